@@ -0,0 +1,58 @@
+"""Measures the memory used per AST node for the most common node classes
+and for the whole AST of a generated program.
+
+Run with: poetry run python -m benchmarks.ast_memory_benchmark [functions]
+"""
+import sys
+import tracemalloc
+from dataclasses import fields
+from typing import Any, Callable
+
+from benchmarks.programs import generate_program
+from compiler.models.expressions import BinaryOp, Block, Expression, Identifier, Literal
+from compiler.parser import parse
+from compiler.tokenizer import tokenize_buffer
+
+
+def bytes_per_node(create: Callable[[int], Any], count: int = 100000) -> float:
+    tracemalloc.start()
+    nodes = [create(i) for i in range(count)]
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Don't count the list holding the nodes
+    return (memory - sys.getsizeof(nodes)) / len(nodes)
+
+
+def count_nodes(root: Expression) -> int:
+    count = 0
+    stack: list[Any] = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, Expression):
+            count += 1
+            stack.extend(getattr(node, f.name) for f in fields(node) if f.name != 'type')
+    return count
+
+
+def main() -> None:
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    shared = Identifier('x')
+    # Children and values are shared, so only the node itself is measured
+    print(f'BinaryOp: {bytes_per_node(lambda i: BinaryOp(shared, "+", shared)):.1f} bytes/node')
+    print(f'Identifier: {bytes_per_node(lambda i: Identifier("x")):.1f} bytes/node')
+    print(f'Literal: {bytes_per_node(lambda i: Literal(1)):.1f} bytes/node')
+    print(f'Block (2 expressions): {bytes_per_node(lambda i: Block([shared, shared])):.1f} bytes/node')
+
+    tokens = tokenize_buffer(generate_program(functions))
+    tracemalloc.start()
+    module = parse(tokens)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    nodes = count_nodes(module)
+    print(f'AST of {functions} functions: {nodes} nodes, {memory / 1e6:.1f} MB, {memory / nodes:.1f} bytes/node')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Runs a program for many sets of inputs, once per set with the interpreter,
+then all at once in a NumPy batch. The program loops a different number of
+times for every input, so the lanes of the batch diverge.
+
+Run with: poetry run python -m benchmarks.batch_benchmark [inputs]
+Requires NumPy.
+"""
+import sys
+import time
+
+from compiler.batch import interpret_lane, run_batch
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+
+code = '''
+var n = read_int();
+var steps = 0;
+while n > 1 do {
+    if n % 2 == 0 then n = n / 2 else n = 3 * n + 1;
+    steps = steps + 1;
+}
+steps
+'''
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    module = parse(tokenize(code))
+    inputs = [[n] for n in range(1, count + 1)]
+
+    start = time.perf_counter()
+    expected = [interpret_lane(module, lane) for lane in inputs]
+    scalar = time.perf_counter() - start
+    print(f'interpreter: {scalar * 1000:.1f} ms, {scalar / count * 1e6:.1f} us per input')
+
+    start = time.perf_counter()
+    result = run_batch(module, inputs)
+    batch = time.perf_counter() - start
+    print(f'batch: {batch * 1000:.1f} ms, {batch / count * 1e6:.1f} us per input ({scalar / batch:.1f}x faster)')
+
+    if list(zip(result.values, result.outputs)) != expected:
+        raise Exception('Results differ')
+
+
+if __name__ == '__main__':
+    main()
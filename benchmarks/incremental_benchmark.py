@@ -0,0 +1,46 @@
+"""Compares re-parsing a large file from scratch with incremental re-parsing
+after single-character edits.
+
+Run with: poetry run python -m benchmarks.incremental_benchmark [lines]
+"""
+import random
+import re
+import sys
+import time
+
+from benchmarks.programs import generate_program
+from compiler.incremental import TextEdit, parse_source, reparse
+
+
+def main() -> None:
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    source_code = generate_program(lines // 15)
+    module, tokens = parse_source(source_code)
+    print(f'source: {source_code.count(chr(10))} lines, {len(tokens)} tokens')
+
+    start = time.perf_counter()
+    parse_source(source_code)
+    full = time.perf_counter() - start
+    print(f'full tokenize and parse: {full * 1000:.1f} ms')
+
+    # Replace the first digit of an integer literal, or insert a digit or a space before it.
+    # All of these keep the program valid.
+    random.seed(0)
+    digits = [m.start() for m in re.finditer(r'(?<![\w])[1-9]', source_code)]
+    edits = 200
+    start = time.perf_counter()
+    for i in range(edits):
+        offset = random.choice(digits)
+        if i % 3 == 0:
+            edit = TextEdit(offset, offset + 1, random.choice('123456789'))
+        else:
+            edit = TextEdit(offset, offset, '1' if i % 3 == 1 else ' ')
+            digits = [d + 1 if d >= offset else d for d in digits]
+        module, tokens = reparse(module, tokens, edit)
+    incremental = (time.perf_counter() - start) / edits
+    print(f'incremental re-parse of a 1-character edit: {incremental * 1000:.2f} ms '
+          f'({full / incremental:.0f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Compares the tree-walking interpreter with the other execution engines
+on a loop-heavy program.
+
+Run with: poetry run python -m benchmarks.interpreter_benchmark [iterations]
+"""
+import contextlib
+import io
+import sys
+import time
+
+from benchmarks.programs import generate_loop_program
+from compiler.bytecode import lower_ir, run_program
+from compiler.closure_compiler import compile_module
+from compiler.interpreter import interpret
+from compiler.ir_generator import generate_ir
+from compiler.ir_interpreter import run_ir
+from compiler.parser import parse
+from compiler.python_backend import run_code, translate
+from compiler.tracing import LoopTracer
+from compiler.tokenizer import tokenize_buffer
+from compiler.type_checker import typecheck
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    module = parse(tokenize_buffer(generate_loop_program(iterations)))
+
+    start = time.perf_counter()
+    expected = interpret(module)
+    tree_walking = time.perf_counter() - start
+    print(f'tree-walking interpreter: {tree_walking * 1000:.1f} ms')
+
+    start = time.perf_counter()
+    program = compile_module(module)
+    compiling = time.perf_counter() - start
+    start = time.perf_counter()
+    result = program()
+    running = time.perf_counter() - start
+    print(f'closure compiler: {compiling * 1000:.2f} ms compiling, {running * 1000:.1f} ms running '
+          f'({tree_walking / running:.1f}x faster)')
+
+    if result != expected:
+        raise Exception(f'Results differ: {result} != {expected}')
+
+    tracer = LoopTracer()
+    start = time.perf_counter()
+    result = interpret(module, tracer=tracer)
+    running = time.perf_counter() - start
+    print(f'interpreter compiling hot loops: {running * 1000:.1f} ms running '
+          f'({tree_walking / running:.1f}x faster, {tracer.stats()["compiled"]} loops compiled)')
+
+    if result != expected:
+        raise Exception(f'Results differ: {result} != {expected}')
+
+    # The IR of the main code prints its result
+    typecheck(module)
+    start = time.perf_counter()
+    ir = generate_ir(module)
+    bytecode = lower_ir(ir)
+    compiling = time.perf_counter() - start
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        run_program(bytecode)
+    running = time.perf_counter() - start
+    print(f'bytecode VM: {compiling * 1000:.2f} ms generating IR and bytecode, {running * 1000:.1f} ms running '
+          f'({tree_walking / running:.1f}x faster)')
+
+    if output.getvalue() != f'{expected}\n':
+        raise Exception(f'Results differ: {output.getvalue()} != {expected}')
+
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        run_ir(ir)
+    running = time.perf_counter() - start
+    print(f'IR interpreter: {running * 1000:.1f} ms running ({tree_walking / running:.1f}x faster)')
+
+    if output.getvalue() != f'{expected}\n':
+        raise Exception(f'Results differ: {output.getvalue()} != {expected}')
+
+    start = time.perf_counter()
+    code = compile(translate(module), '<program>', 'exec')
+    compiling = time.perf_counter() - start
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        run_code(code)
+    running = time.perf_counter() - start
+    print(f'Python backend: {compiling * 1000:.2f} ms translating and compiling, {running * 1000:.1f} ms running '
+          f'({tree_walking / running:.1f}x faster)')
+
+    if output.getvalue() != f'{expected}\n':
+        raise Exception(f'Results differ: {output.getvalue()} != {expected}')
+
+
+if __name__ == '__main__':
+    main()
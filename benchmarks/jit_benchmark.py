@@ -0,0 +1,67 @@
+"""Compares running compiled programs in this process with the JIT against
+assembling them with 'as' and 'ld' and running the executable.
+
+Run with: poetry run python -m benchmarks.jit_benchmark [runs]
+Requires x86-64 Linux, and 'as' and 'ld' for the comparison.
+"""
+import io
+import subprocess
+import sys
+import tempfile
+import time
+from os import path
+
+from compiler.assembler import assemble
+from compiler.assembly_generator import generate_assembly
+from compiler.channel import Channel
+from compiler.ir_generator import generate_ir
+from compiler.jit import JitProgram
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+
+code = '''
+var n = read_int();
+var i = 0;
+var total = 0;
+while i < n do {
+    if i % 3 == 0 then total = total + i else total = total - 1;
+    i = i + 1;
+}
+total
+'''
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    module = parse(tokenize(code))
+    typecheck(module)
+    assembly_code = generate_assembly(generate_ir(module))
+
+    outputs: list[str] = []
+    start = time.perf_counter()
+    for _ in range(runs):
+        program = JitProgram(assembly_code)
+        output = io.StringIO()
+        program.run(Channel(b'1000', output))
+        program.close()
+        outputs.append(output.getvalue())
+    jit = (time.perf_counter() - start) / runs
+    print(f'JIT: {jit * 1e6:.0f} us per program to encode, load and run')
+
+    with tempfile.TemporaryDirectory(prefix='compiler_') as workdir:
+        executable = path.join(workdir, 'program')
+        start = time.perf_counter()
+        for _ in range(runs):
+            assemble(assembly_code, executable, workdir)
+            result = subprocess.run([executable], input=b'1000\n', capture_output=True, check=True)
+            outputs.append(result.stdout.decode())
+        native = (time.perf_counter() - start) / runs
+    print(f'as, ld and a process: {native * 1e6:.0f} us per program ({native / jit:.1f}x slower)')
+
+    if len(set(outputs)) != 1:
+        raise Exception(f'Results differ: {set(outputs)}')
+
+
+if __name__ == '__main__':
+    main()
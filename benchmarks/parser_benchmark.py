@@ -0,0 +1,40 @@
+"""Measures parser throughput in tokens per second on generated programs,
+on one long operator chain and on deeply nested parentheses,
+and the throughput of 'parse_parallel' on all cores.
+
+Run with: poetry run python -m benchmarks.parser_benchmark [functions]
+"""
+import os
+import sys
+import time
+from typing import Any, Callable
+
+from benchmarks.programs import generate_program
+from compiler.models.expressions import Module
+from compiler.models.tokens import Token, TokenBuffer
+from compiler.parser import parse, parse_parallel
+from compiler.tokenizer import tokenize, tokenize_buffer
+
+
+def measure(name: str, tokens: TokenBuffer | list[Token], parser: Callable[[Any], Module] = parse) -> None:
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        parser(tokens)
+        best = min(best, time.perf_counter() - start)
+    print(f'{name}: {len(tokens)} tokens, {best * 1000:.1f} ms, {len(tokens) / best / 1e6:.2f} M tokens/s')
+
+
+def main() -> None:
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    source_code = generate_program(functions)
+    tokens = tokenize_buffer(source_code)
+    measure('program, TokenBuffer', tokens)
+    measure(f'program, parse_parallel on {os.cpu_count()} cores', tokens, parse_parallel)
+    measure('program, token list', tokenize(source_code))
+    measure('1 + 1 + ... (1M terms)', tokenize_buffer(' + '.join(['1'] * 1000000)))
+    measure('((( ... x ))) (100k deep)', tokenize_buffer('(' * 100000 + 'x' + ')' * 100000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+def generate_program(functions: int, statements: int = 8) -> str:
+    """Generates a valid program with the given amount of function declarations,
+    each with a few statements, followed by a main block calling all of them."""
+    lines: list[str] = []
+    for i in range(functions):
+        lines.append(f'fun f{i}(x: Int, y: Int): Int {{')
+        lines.append('    var a = x + y * 2;  // comment')
+        for j in range(statements):
+            lines.append(f'    if a % {j + 2} == 0 and not (a >= {j}) then a = a - {j} else a = a + 1;')
+        lines.append('    # another comment')
+        lines.append('    while a > 100 do { a = a / 2; }')
+        lines.append('    return a;')
+        lines.append('}')
+        lines.append('')
+    lines.append('var total = 0;')
+    for i in range(functions):
+        lines.append(f'total = total + f{i}({i}, {i + 1});')
+    lines.append('print_int(total);')
+    return '\n'.join(lines) + '\n'
+
+def generate_loop_program(iterations: int) -> str:
+    """Generates a program that spends its time in nested while loops
+    and calls to a small function, for benchmarking interpreters."""
+    return f'''
+fun step(a: Int, b: Int): Int {{
+    if a % 7 == 0 or b % 5 == 0 then a + b else a - b
+}}
+
+var i = 0;
+var j = 0;
+var total = 0;
+while i < {iterations} do {{
+    j = 0;
+    while j < 10 do {{
+        if (i + j) % 3 == 0 and j < 8 then total = total + i * j else total = total - 1;
+        j = j + 1;
+    }}
+    total = total % 1000 + step(14, 3);
+    i = i + 1;
+}}
+total
+'''
@@ -0,0 +1,57 @@
+"""Runs deeply recursive programs on the interpreter, which calls functions
+on an explicit stack, and on the closure compiler, which uses the Python stack.
+Then runs an exponential fib with and without memoizing pure functions.
+
+Run with: poetry run python -m benchmarks.recursion_benchmark [depth]
+"""
+import sys
+import time
+from typing import Callable
+
+from compiler.closure_compiler import interpret_compiled
+from compiler.interpreter import MemoCache, interpret
+from compiler.models.expressions import Expression
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+
+programs = {
+    'recursion': 'fun sum(n: Int): Int {{ if n == 0 then 0 else n + sum(n - 1) }} sum({n})',
+    'tail recursion': 'fun sum(n: Int, acc: Int): Int {{ if n == 0 then acc else return sum(n - 1, acc + n); }} sum({n}, 0)',
+}
+
+
+def main() -> None:
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    engines: dict[str, Callable[[Expression], object]] = {
+        'interpreter': interpret,
+        'closure compiler': interpret_compiled,
+    }
+    for (program, code) in programs.items():
+        node = parse(tokenize(code.format(n=depth)))
+        for (engine, run) in engines.items():
+            start = time.perf_counter()
+            try:
+                result = run(node)
+            except RecursionError:
+                print(f'{program}, {engine}: RecursionError')
+                continue
+            elapsed = time.perf_counter() - start
+            assert result == depth * (depth + 1) // 2
+            print(f'{program}, {engine}: {depth} calls in {elapsed * 1000:.1f} ms '
+                  f'({elapsed / depth * 1e6:.2f} us per call)')
+
+    node = parse(tokenize('fun fib(n: Int): Int { if n < 2 then n else fib(n - 1) + fib(n - 2) } fib(22)'))
+    start = time.perf_counter()
+    expected = interpret(node)
+    elapsed = time.perf_counter() - start
+    print(f'fib(22): {elapsed * 1000:.1f} ms')
+    cache = MemoCache()
+    start = time.perf_counter()
+    result = interpret(node, cache=cache)
+    memoized = time.perf_counter() - start
+    assert result == expected
+    print(f'fib(22) memoized: {memoized * 1000:.2f} ms ({elapsed / memoized:.0f}x faster), cache {cache.stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Compares the binary module format with pickle: size, and time to save and load
+a type-checked module, and to load a single function declaration.
+
+Run with: poetry run python -m benchmarks.serialization_benchmark [functions]
+"""
+import pickle
+import sys
+import time
+from typing import Any, Callable
+
+from benchmarks.programs import generate_program
+from compiler.parser import parse
+from compiler.serialization import ModuleReader, decode_module, encode_module
+from compiler.tokenizer import tokenize_buffer
+from compiler.type_checker import typecheck
+
+
+def best_time(function: Callable[[], Any]) -> float:
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    module = parse(tokenize_buffer(generate_program(functions)))
+    typecheck(module)
+
+    encoded = encode_module(module)
+    pickled = pickle.dumps(module, pickle.HIGHEST_PROTOCOL)
+    print(f'size: binary format {len(encoded) / 1e6:.2f} MB, pickle {len(pickled) / 1e6:.2f} MB')
+    print(f'save: binary format {best_time(lambda: encode_module(module)) * 1000:.0f} ms, '
+          f'pickle {best_time(lambda: pickle.dumps(module, pickle.HIGHEST_PROTOCOL)) * 1000:.0f} ms')
+    print(f'load: binary format {best_time(lambda: decode_module(encoded)) * 1000:.0f} ms, '
+          f'pickle {best_time(lambda: pickle.loads(pickled)) * 1000:.0f} ms')
+    reader = ModuleReader(encoded)
+    middle = len(reader.function_names) // 2
+    print(f'load one function: binary format {best_time(lambda: reader.function(middle)) * 1e6:.0f} us')
+
+
+if __name__ == '__main__':
+    main()
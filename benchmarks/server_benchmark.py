@@ -0,0 +1,58 @@
+"""Measures how many compile-and-run requests a server answers per second.
+
+Run with: poetry run python -m benchmarks.server_benchmark [requests] [clients]
+Requires 'as' and 'ld'.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from compiler.server import Server, request
+
+code = '''
+var n = read_int();
+var i = 0;
+var total = 0;
+while i < n do {
+    if i % 3 == 0 then total = total + i else total = total - 1;
+    i = i + 1;
+}
+total
+'''
+
+
+async def run(requests: int, clients: int) -> None:
+    with tempfile.TemporaryDirectory(prefix='compiler_') as directory:
+        server = Server(os.path.join(directory, 'compiler.sock'), workers=os.cpu_count() or 4)
+        start = time.perf_counter()
+        await server.start()
+        print(f'Started and warmed up {server.workers} workers in {(time.perf_counter() - start) * 1e3:.0f} ms')
+
+        queue = list(range(requests))
+        compile_times: list[float] = []
+
+        async def client() -> None:
+            while queue:
+                n = queue.pop()
+                response = await request(server.socket_path, code, str(n))
+                assert 'error' not in response, response
+                compile_times.append(response['timings']['compile'])
+
+        start = time.perf_counter()
+        await asyncio.gather(*[client() for _ in range(clients)])
+        elapsed = time.perf_counter() - start
+        await server.close()
+    print(f'{requests} requests from {clients} clients: {requests / elapsed:.0f} requests per second')
+    print(f'Compile time per request: {sum(compile_times) / len(compile_times) * 1e3:.1f} ms')
+
+
+def main() -> None:
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    asyncio.run(run(requests, clients))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Measures tokenizer throughput in tokens per second
+and the memory used per token by a token list and by a TokenBuffer.
+
+Run with: poetry run python -m benchmarks.tokenizer_benchmark [functions]
+"""
+import sys
+import time
+import tracemalloc
+from typing import Callable, Sized
+
+from benchmarks.programs import generate_program
+from compiler.tokenizer import tokenize, tokenize_buffer
+
+
+def measure(name: str, source_code: str, tokenizer: Callable[[str], Sized]) -> None:
+    best = float('inf')
+    token_count = 0
+    for _ in range(5):
+        start = time.perf_counter()
+        token_count = len(tokenizer(source_code))
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    tokens = tokenizer(source_code)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tokens
+
+    print(f'{name}: {best * 1000:.1f} ms, {token_count / best / 1e6:.2f} M tokens/s, '
+          f'{memory / token_count:.1f} bytes/token')
+
+
+def main() -> None:
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    source_code = generate_program(functions)
+    print(f'source: {len(source_code) / 1e6:.2f} MB, {len(tokenize(source_code))} tokens')
+    measure('tokenize', source_code, tokenize)
+    measure('tokenize_buffer', source_code, tokenize_buffer)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,22 @@
+import asyncio
 import sys
 from compiler.assembler import assemble
 from compiler.assembly_generator import generate_assembly
+from compiler.budget import Budget
+from compiler.bytecode import lower_ir, run_program
+from compiler.interpreter import PredefinedSymbols, interpret
 from compiler.ir_generator import generate_ir
+from compiler.jit import JitProgram
+from compiler.models.expressions import Module
+from compiler.models.tokens import SourceLocation
 from compiler.parser import parse
+from compiler.profiler import Profiler
+from compiler.python_backend import load_program, run_code, translate
+from compiler.resolver import Resolution, resolve
+from compiler.server import Server
+from compiler.tracing import LoopTracer
 
-from compiler.tokenizer import tokenize
+from compiler.tokenizer import iter_tokens, tokenize_buffer
 from compiler.type_checker import typecheck
 
 # TODO(student): add more commands as needed
@@ -12,20 +24,78 @@ usage = f"""
 Usage: {sys.argv[0]} <command> [source_code_file]
 
 Command 'interpret':
-    Runs the interpreter on source code.
+    Runs the interpreter on source code and prints the value of the program.
+    --profile=<name>        Optional. Writes counters and times of the run to <name>.json,
+                            and its call stacks to <name>.folded for flame graph tools.
+    --hot-loops=<n>         Optional. Compiles each loop to Python after it has run n iterations.
+
+Command 'run':
+    Compiles source code to IR and runs it on the bytecode VM, without assembling it.
+
+Command 'jit':
+    Compiles source code to Assembly and runs it in this process, without assembling it
+    with 'as' and 'ld'. Works on x86-64 Linux only.
+
+Command 'python':
+    Prints source code translated to Python.
+
+Command 'pyrun':
+    Translates source code to Python and runs it.
+    --cache=<directory>     Optional. Keeps the compiled Python code there for the next run.
+
+Command 'serve':
+    Compiles and runs programs for clients of a Unix socket, until stopped.
+    Each request is a line of JSON: {{"source": ..., "stdin": ...}}, and each response
+    a line of JSON: {{"output": ..., "exit_code": ..., "timings": {{...}}}} or {{"error": ...}}.
+    --socket=<path>         Optional. Defaults to compiler.sock.
+    --workers=<n>           Optional. Processes that compile programs. Defaults to 4.
+    --max-running=<n>       Optional. Programs that run at once. Defaults to 8.
+    --timeout=<seconds>     Optional. Stops each program after this many seconds. Defaults to 10.
+    --max-output=<bytes>    Optional. Stops each program that prints more than this. Defaults to 16 MiB.
 
 Common arguments:
     source_code_file        Optional. Defaults to standard input if missing.
+
+Arguments of 'interpret', 'run' and 'pyrun':
+    --fuel=<units>          Optional. Stops the program after this many loop iterations and calls.
+    --timeout=<seconds>     Optional. Stops the program after this many seconds.
  """.strip() + "\n"
 
 
 def main() -> int:
     command: str | None = None
     input_file: str | None = None
+    profile_name: str | None = None
+    fuel: int | None = None
+    timeout: float | None = None
+    cache_dir: str | None = None
+    hot_loops: int | None = None
+    socket_path = 'compiler.sock'
+    workers = 4
+    max_running = 8
+    max_output: int | None = None
     for arg in sys.argv[1:]:
         if arg in ['-h', '--help']:
             print(usage)
             return 0
+        elif arg.startswith('--profile='):
+            profile_name = arg[len('--profile='):]
+        elif arg.startswith('--fuel='):
+            fuel = int(arg[len('--fuel='):])
+        elif arg.startswith('--timeout='):
+            timeout = float(arg[len('--timeout='):])
+        elif arg.startswith('--hot-loops='):
+            hot_loops = int(arg[len('--hot-loops='):])
+        elif arg.startswith('--cache='):
+            cache_dir = arg[len('--cache='):]
+        elif arg.startswith('--socket='):
+            socket_path = arg[len('--socket='):]
+        elif arg.startswith('--workers='):
+            workers = int(arg[len('--workers='):])
+        elif arg.startswith('--max-running='):
+            max_running = int(arg[len('--max-running='):])
+        elif arg.startswith('--max-output='):
+            max_output = int(arg[len('--max-output='):])
         elif arg.startswith('-'):
             raise Exception(f"Unknown argument: {arg}")
         elif command is None:
@@ -42,37 +112,81 @@ def main() -> int:
         else:
             return sys.stdin.read()
 
+    def parse_source_code() -> Module:
+        """Parses the input while it is being read, without holding the whole source in memory."""
+        if input_file is not None:
+            with open(input_file, 'rb') as f:
+                return parse(iter_tokens(f))
+        else:
+            return parse(iter_tokens(sys.stdin))
+
+    def check(module: Module) -> Resolution:
+        """Type checks the module, and returns the names resolved for it, for generating IR."""
+        resolution = resolve(module, PredefinedSymbols)
+        typecheck(module, resolution=resolution)
+        return resolution
+
     if command is None:
         print(f"Error: command argument missing\n\n{usage}", file=sys.stderr)
         return 1
 
+    budget = Budget(fuel, timeout) if fuel is not None or timeout is not None else None
+
     if command == 'interpret':
         source_code = read_source_code()
-        ...  # TODO(student)
+        locations: dict[int, SourceLocation] = {}
+        module = parse(tokenize_buffer(source_code), locations)
+        profiler = Profiler(locations) if profile_name is not None else None
+        tracer = LoopTracer(hot_loops) if hot_loops is not None else None
+        value = interpret(module, profiler=profiler, budget=budget, tracer=tracer)
+        if value is not None:
+            print(value)
+        if profiler is not None:
+            with open(f'{profile_name}.json', 'w') as f:
+                f.write(profiler.to_json())
+            with open(f'{profile_name}.folded', 'w') as f:
+                f.write(profiler.to_collapsed())
     elif command == 'ir':
-        source_code = read_source_code()
-        tokens = tokenize(source_code)
-        ast_node = parse(tokens)
-        typecheck(ast_node)
-        ir_instructions = generate_ir(ast_node)
+        ast_node = parse_source_code()
+        ir_instructions = generate_ir(ast_node, resolution=check(ast_node))
 
         for entry in ir_instructions.keys():
             print(entry)
             print("\n".join([str(ins) for ins in ir_instructions[entry]]))
-    elif command == 'asm':
-        source_code = read_source_code()
-        tokens = tokenize(source_code)
-        ast_node = parse(tokens)
+    elif command == 'run':
+        ast_node = parse_source_code()
+        run_program(lower_ir(generate_ir(ast_node, resolution=check(ast_node))), budget)
+    elif command == 'python':
+        ast_node = parse_source_code()
         typecheck(ast_node)
-        ir_instructions = generate_ir(ast_node)
+        print(translate(ast_node), end='')
+    elif command == 'pyrun':
+        run_code(load_program(read_source_code(), cache_dir, budget is not None), budget=budget)
+    elif command == 'asm':
+        ast_node = parse_source_code()
+        ir_instructions = generate_ir(ast_node, resolution=check(ast_node))
         asm_code = generate_assembly(ir_instructions)
         print(asm_code)
+    elif command == 'jit':
+        ast_node = parse_source_code()
+        program = JitProgram(generate_assembly(generate_ir(ast_node, resolution=check(ast_node))))
+        try:
+            program.run()
+        finally:
+            program.close()
+    elif command == 'serve':
+        server = Server(socket_path, workers, max_running)
+        if timeout is not None:
+            server.timeout = timeout
+        if max_output is not None:
+            server.max_output = max_output
+        try:
+            asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            pass
     elif command == 'compile':
-        source_code = read_source_code()
-        tokens = tokenize(source_code)
-        ast_node = parse(tokens)
-        typecheck(ast_node)
-        ir_instructions = generate_ir(ast_node)
+        ast_node = parse_source_code()
+        ir_instructions = generate_ir(ast_node, resolution=check(ast_node))
         asm_code = generate_assembly(ir_instructions)
         print(asm_code)
         assemble(asm_code, 'compiled_program')
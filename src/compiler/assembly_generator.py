@@ -88,6 +88,7 @@ def generate_assembly(instructions: dict[str, list[Instruction]]) -> str:
                             if len(inst.args) % 2 == 1:
                                 emit('subq $8, %rsp') # make %rsp % 16 = 0
                             emit(f'call {inst.fun.name}')
+                            emit(f'addq ${8 * (len(inst.args) + len(inst.args) % 2)}, %rsp') # pop the arguments, or loops use up the stack
                             emit(f'movq %rax, {vars.get_ref(inst.dest)}')
 
                 case Jump():
@@ -0,0 +1,317 @@
+"""Runs a program once for each of many sets of inputs for 'read_int' at the same time,
+with NumPy. Requires NumPy, which is not a dependency of the compiler.
+
+Every value is an array with a lane for each set of inputs, or a scalar that is the same
+in every lane, so each BinaryOp and UnaryOp is one vector operation for all lanes.
+Code runs under a mask of the lanes that take it: when the lanes of an IfExpression
+diverge, both clauses run, each for its own lanes, and a WhileExpression loops
+until no lane continues. Function calls run the same way, also recursively.
+
+Prints are recorded with the lanes they are made in, and the output of each lane
+is put together at the end.
+
+With a budget, each loop iteration and each call spends fuel once for the whole batch,
+and each lane that is run again by 'interpret' gets the budget for its own run.
+
+Results are the same as from 'interpret'. Lanes that would raise an error, read past
+their inputs or leave 64-bit integers are run again one by one with 'interpret',
+and so is the whole batch if the program does something lanes can't do,
+like using a function as a value.
+"""
+from dataclasses import dataclass, field
+from io import StringIO
+from typing import Any, Sequence
+
+try:
+    import numpy as np # type: ignore[import-not-found, unused-ignore]
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+from compiler.budget import Budget
+from compiler.channel import Channel
+from compiler.interpreter import PredefinedSymbols, Value, interpret
+from compiler.models.expressions import *
+from compiler.resolver import Resolution, resolve
+
+# An array with a value for each lane, a scalar for all lanes, or None for Unit
+Vector = Any
+
+class Unvectorizable(Exception):
+    "Raised when the program can't run in lanes, so that every lane is run by 'interpret'"
+
+@dataclass
+class Lanes:
+    resolution: Resolution
+    frames: list[list[Any]]
+    # The inputs of each lane in a row, padded to the length of the longest
+    inputs: Any
+    counts: Any
+    # The index of the next input of each lane
+    cursor: Any
+    # The lanes left to 'interpret'
+    failed: Any
+    # The function, lanes and values of each print
+    prints: list[tuple[str, Any, Vector]] = field(default_factory=list)
+    budget: Budget | None = None
+
+@dataclass
+class BatchResult:
+    "The value and output of the program for each set of inputs, and the sets that were run by 'interpret'"
+    values: list[Value]
+    outputs: list[str]
+    scalar_lanes: list[int]
+
+def run_batch(exp: Expression, inputs: Sequence[Sequence[int]], budget: Budget | None = None) -> BatchResult:
+    if not HAS_NUMPY:
+        raise Exception('Running in batches requires NumPy')
+    if budget is not None:
+        budget.start()
+    count = len(inputs)
+    global_symbols: dict[str, Any] = dict(PredefinedSymbols)
+    resolution = resolve(exp, global_symbols)
+    global_frame: list[Any] = [global_symbols.get(name) for name in resolution.global_slots]
+    if isinstance(exp, Module):
+        main = exp.sequence[0]
+        for fun in exp.sequence[1:]:
+            if isinstance(fun, FunctionDeclaration):
+                global_frame[resolution.global_slots[fun.name]] = fun
+    else:
+        main = exp
+
+    try:
+        width = max((len(lane) for lane in inputs), default=0)
+        table = np.zeros((count, max(width, 1)), dtype=np.int64)
+        for (i, lane) in enumerate(inputs):
+            table[i, :len(lane)] = lane
+        lanes = Lanes(
+            resolution, [global_frame], table,
+            np.array([len(lane) for lane in inputs], dtype=np.int64),
+            np.zeros(count, dtype=np.int64),
+            np.zeros(count, dtype=np.bool_),
+            budget=budget,
+        )
+        # Integers wrap around silently, overflows are checked separately
+        with np.errstate(all='ignore'):
+            value = evaluate(main, lanes, np.ones(count, dtype=np.bool_))
+        if value is not None and not hasattr(value, 'dtype'):
+            raise Unvectorizable()
+    except (Unvectorizable, TypeError, OverflowError, RecursionError):
+        results = [interpret_lane(exp, lane, budget) for lane in inputs]
+        return BatchResult([value for (value, _) in results], [output for (_, output) in results], list(range(count)))
+
+    values: list[Value] = [None] * count if value is None else np.broadcast_to(value, (count,)).tolist()
+    outputs: list[list[str]] = [[] for _ in range(count)]
+    for (name, mask, printed) in lanes.prints:
+        texts = np.broadcast_to(printed, (count,)).tolist()
+        for i in np.flatnonzero(mask).tolist():
+            if name == 'print_int':
+                outputs[i].append(f'{texts[i]}\n')
+            else:
+                outputs[i].append('true\n' if texts[i] == True else 'false\n')
+    result = BatchResult(values, [''.join(output) for output in outputs], [int(i) for i in np.flatnonzero(lanes.failed)])
+    for i in result.scalar_lanes:
+        result.values[i], result.outputs[i] = interpret_lane(exp, inputs[i], budget)
+    return result
+
+def interpret_lane(exp: Expression, inputs: Sequence[int], budget: Budget | None = None) -> tuple[Value, str]:
+    "Runs the program with 'interpret' on the given inputs. Returns its value and output."
+    output = StringIO()
+    channel = Channel(' '.join(str(value) for value in inputs).encode(), output)
+    value = interpret(exp, channel=channel, budget=budget)
+    return value, output.getvalue()
+
+def fail(lanes: Lanes, bad: Any) -> None:
+    lanes.failed |= bad
+
+def truth(value: Vector) -> Vector:
+    "Whether each lane is true, like 'if' in the interpreter"
+    if value is None:
+        return np.bool_(False)
+    if value.dtype == np.bool_:
+        return value
+    return value != 0
+
+def as_int(value: Vector) -> Vector:
+    return value.astype(np.int64) if value.dtype == np.bool_ else value
+
+def evaluate(node: Expression, lanes: Lanes, mask: Any) -> Vector:
+    "Evaluates a node for the lanes in the mask. The values of the other lanes are undefined."
+    match node:
+        case Literal():
+            if isinstance(node.value, bool):
+                return np.bool_(node.value)
+            if node.value is None:
+                return None
+            if not -2**63 <= node.value < 2**63:
+                raise Unvectorizable()
+            return np.int64(node.value)
+
+        case Identifier():
+            location = lanes.resolution.variables.get(id(node))
+            if location is None:
+                raise Unvectorizable()
+            value = lanes.frames[location[0]][location[1]]
+            if value is not None and not hasattr(value, 'dtype'):
+                # Functions as values
+                raise Unvectorizable()
+            return value
+
+        case BinaryOp():
+            if isinstance(node.left, Identifier) and node.op == '=':
+                location = lanes.resolution.variables.get(id(node))
+                if location is None:
+                    raise Unvectorizable()
+                assign(lanes, location, evaluate(node.right, lanes, mask), mask)
+                return None
+
+            operator = lanes.resolution.operators.get(id(node))
+            if operator is None:
+                raise Unvectorizable()
+            if node.op == 'or' or node.op == 'and':
+                # The right side runs only for the lanes it would run for in the interpreter
+                a = evaluate(node.left, lanes, mask)
+                if a is None:
+                    raise Unvectorizable()
+                decided = a == (node.op == 'or')
+                rest = mask & ~decided & ~lanes.failed
+                b = evaluate(node.right, lanes, rest) if rest.any() else None
+                if b is None or b.dtype != np.bool_:
+                    b = np.bool_(False)
+                return np.where(decided, node.op == 'or', b)
+
+            a = evaluate(node.left, lanes, mask)
+            b = evaluate(node.right, lanes, mask)
+            if a is None or b is None:
+                raise Unvectorizable()
+            if node.op in ['+', '-', '*', '/', '%']:
+                a = as_int(a)
+                b = as_int(b)
+            if node.op == '/' or node.op == '%':
+                zero = b == 0
+                fail(lanes, mask & zero)
+                b = np.where(zero, 1, b)
+            result = operator(a, b)
+            if node.op == '+':
+                fail(lanes, mask & (((a ^ result) & (b ^ result)) < 0))
+            elif node.op == '-':
+                fail(lanes, mask & (((a ^ b) & (a ^ result)) < 0))
+            elif node.op == '*':
+                # Exact: the wrapped product divides back to b unless it overflowed,
+                # and so does -2**63 // -1, which wraps too
+                divisor = np.where(a == 0, 1, a)
+                wrapped = (result // divisor != b) | ((a == -1) & (b == -2**63))
+                fail(lanes, mask & (a != 0) & wrapped)
+            return result
+
+        case UnaryOp():
+            x = evaluate(node.right, lanes, mask)
+            if id(node) not in lanes.resolution.operators or x is None:
+                raise Unvectorizable()
+            if x.dtype == np.bool_:
+                return ~x
+            fail(lanes, mask & (x == -2**63))
+            return -x
+
+        case IfExpression():
+            cond = truth(evaluate(node.cond, lanes, mask))
+            active = mask & ~lanes.failed
+            then_mask = active & cond
+            then_value = evaluate(node.then_clause, lanes, then_mask) if then_mask.any() else None
+            if node.else_clause is None:
+                return None
+            else_mask = active & ~cond
+            if not else_mask.any():
+                return then_value
+            else_value = evaluate(node.else_clause, lanes, else_mask)
+            if not then_mask.any():
+                return else_value
+            if then_value is None or else_value is None:
+                if then_value is None and else_value is None:
+                    return None
+                raise Unvectorizable()
+            return np.where(cond, then_value, else_value)
+
+        case WhileExpression():
+            running = mask
+            budget = lanes.budget
+            while True:
+                running = running & (evaluate(node.cond, lanes, running) == True) & ~lanes.failed
+                if not running.any():
+                    return None
+                if budget is not None:
+                    budget.remaining -= 1
+                    if budget.remaining == 0:
+                        budget.check()
+                evaluate(node.body, lanes, running)
+
+        case VariableDeclaration():
+            location = lanes.resolution.variables[id(node)]
+            assign(lanes, location, evaluate(node.initializer, lanes, mask), mask)
+            return None
+
+        case Block():
+            frames = lanes.frames
+            frames.append([None] * lanes.resolution.frame_sizes[id(node)])
+            last: Vector = None
+            for exp in node.sequence:
+                last = evaluate(exp, lanes, mask)
+            frames.pop()
+            return last
+
+        case Function():
+            return call(node, lanes, mask)
+
+        case ReturnExpression():
+            return evaluate(node.value, lanes, mask)
+
+        case _:
+            raise Unvectorizable()
+
+def assign(lanes: Lanes, location: tuple[int, int], value: Vector, mask: Any) -> None:
+    frame = lanes.frames[location[0]]
+    old = frame[location[1]]
+    if old is None or value is None:
+        frame[location[1]] = value
+    elif not hasattr(old, 'dtype'):
+        raise Unvectorizable()
+    else:
+        frame[location[1]] = np.where(mask, value, old)
+
+def call(node: Function, lanes: Lanes, mask: Any) -> Vector:
+    match node.name:
+        case 'print_int' | 'print_bool':
+            if len(node.args) != 1:
+                raise Unvectorizable()
+            value = evaluate(node.args[0], lanes, mask)
+            if value is None:
+                raise Unvectorizable()
+            lanes.prints.append((node.name, mask & ~lanes.failed, value))
+            return None
+        case 'read_int':
+            reading = mask & ~lanes.failed
+            fail(lanes, reading & (lanes.cursor >= lanes.counts))
+            column = np.minimum(lanes.cursor, lanes.inputs.shape[1] - 1)
+            values = lanes.inputs[np.arange(len(column)), column]
+            lanes.cursor += reading
+            return values
+
+    location = lanes.resolution.variables.get(id(node))
+    if location is None:
+        raise Unvectorizable()
+    fun = lanes.frames[0][location[1]]
+    if not isinstance(fun, FunctionDeclaration) or len(fun.args) != len(node.args):
+        raise Unvectorizable()
+    frame = [evaluate(arg, lanes, mask) for arg in node.args]
+    budget = lanes.budget
+    if budget is not None:
+        budget.remaining -= 1
+        if budget.remaining == 0:
+            budget.check()
+    frame.extend([None] * (lanes.resolution.frame_sizes[id(fun)] - len(frame)))
+    frames = lanes.frames
+    lanes.frames = [frames[0], frame]
+    try:
+        return evaluate(fun.body, lanes, mask)
+    finally:
+        lanes.frames = frames
@@ -0,0 +1,71 @@
+"""Limits on how long a program may run in the interpreter engines: 'interpreter',
+'closure_compiler', 'bytecode' and 'ir_interpreter', and in the code of 'python_backend'.
+
+Fuel is spent on every loop iteration and every call to a function of the program,
+since a program can run for long only by looping or calling. The engines count
+'remaining' down and call 'check' when it reaches zero, so that the limits are
+compared and the clock is read only once every 'check_interval' units.
+"""
+import time
+
+class BudgetExceeded(Exception):
+    "Raised when a program runs out of fuel or time. The stats tell how far it got."
+    stats: dict[str, int | float | None]
+
+    def __init__(self, message: str, stats: dict[str, int | float | None]) -> None:
+        super().__init__(message)
+        self.stats = stats
+
+class Budget:
+    """At most 'fuel' units of work and 'timeout' seconds for each run, if not None.
+    A budget is restarted by every run it is given to."""
+    fuel: int | None
+    timeout: float | None
+    check_interval: int
+    # Units left before the next check
+    remaining: int
+    # Units spent before the current chunk of units
+    _spent: int
+    _chunk: int
+    _start: float
+
+    def __init__(self, fuel: int | None = None, timeout: float | None = None, check_interval: int = 1000) -> None:
+        self.fuel = fuel
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.start()
+
+    def start(self) -> None:
+        self._spent = 0
+        self._start = time.monotonic()
+        self._next_chunk()
+
+    def _next_chunk(self) -> None:
+        chunk = self.check_interval
+        if self.fuel is not None:
+            # The unit after the last one allowed fails the check
+            chunk = min(chunk, self.fuel + 1 - self._spent)
+        self._chunk = self.remaining = chunk
+
+    def check(self) -> None:
+        self._spent += self._chunk - self.remaining
+        self._chunk = self.remaining = 0
+        if self.fuel is not None and self._spent > self.fuel:
+            raise BudgetExceeded(f'Out of fuel: used all {self.fuel} units', self.stats())
+        if self.timeout is not None and self.elapsed() > self.timeout:
+            raise BudgetExceeded(f'Out of time: ran over {self.timeout} seconds', self.stats())
+        self._next_chunk()
+
+    def used(self) -> int:
+        return self._spent + self._chunk - self.remaining
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._start
+
+    def stats(self) -> dict[str, int | float | None]:
+        return {
+            'fuel': self.fuel,
+            'fuel_used': self.used(),
+            'timeout': self.timeout,
+            'elapsed': self.elapsed(),
+        }
@@ -0,0 +1,353 @@
+"""A register-based bytecode for the IR, and a virtual machine that runs it
+without assembling or executing native code.
+
+All functions are lowered into one code array of integers: an opcode followed
+by its operands. IR variables become register indices of the frame of their
+function, labels become absolute offsets in the code, and the callee of a call
+becomes an index to 'Program.functions'. The parameters of a function are its first
+registers, in the order they are declared. Common instruction pairs are fused into
+superinstructions, like a comparison followed by a 'CondJump' on its result.
+
+Values are integers, with booleans as 0 and 1. Division and remainder round towards
+zero like 'idivq' does, but unlike the native code integers don't overflow.
+"""
+from array import array
+from dataclasses import dataclass
+
+from compiler.budget import Budget
+from compiler.channel import Channel
+from compiler.models.instructions import *
+
+OP_LOAD = 0         # dest, value
+OP_COPY = 1         # dest, source
+OP_ADD = 2          # dest, a, b
+OP_SUB = 3
+OP_MUL = 4
+OP_DIV = 5
+OP_MOD = 6
+OP_EQ = 7
+OP_NE = 8
+OP_LT = 9
+OP_LE = 10
+OP_GT = 11
+OP_GE = 12
+OP_NEG = 13         # dest, a
+OP_NOT = 14
+OP_JUMP = 15        # target
+OP_COND_JUMP = 16   # cond, then target, else target
+OP_PRINT_INT = 17   # a
+OP_PRINT_BOOL = 18
+OP_READ_INT = 19    # dest
+OP_CALL = 20        # dest, function index, argument count, arguments...
+OP_RETURN = 21      # source, or -1 for none
+
+# Superinstructions
+OP_EQ_JUMP = 22     # dest, a, b, then target, else target
+OP_NE_JUMP = 23
+OP_LT_JUMP = 24
+OP_LE_JUMP = 25
+OP_GT_JUMP = 26
+OP_GE_JUMP = 27
+OP_COPY_JUMP = 28   # dest, source, target
+
+binary_ops = {
+    '+': OP_ADD, '-': OP_SUB, '*': OP_MUL, '/': OP_DIV, '%': OP_MOD,
+    '==': OP_EQ, '!=': OP_NE, '<': OP_LT, '<=': OP_LE, '>': OP_GT, '>=': OP_GE,
+}
+unary_ops = {'unary_-': OP_NEG, 'unary_not': OP_NOT}
+compare_jumps = {
+    OP_EQ: OP_EQ_JUMP, OP_NE: OP_NE_JUMP, OP_LT: OP_LT_JUMP,
+    OP_LE: OP_LE_JUMP, OP_GT: OP_GT_JUMP, OP_GE: OP_GE_JUMP,
+}
+
+@dataclass
+class BytecodeFunction:
+    name: str
+    entry: int
+    registers: int
+    params: int
+
+@dataclass
+class Program:
+    code: 'array[int]'
+    functions: list[BytecodeFunction]
+    main: int
+
+def lower_ir(ir: dict[str, list[Instruction]]) -> Program:
+    "Lowers the output of 'generate_ir' to bytecode"
+    names = list(ir.keys())
+    function_ids = {name: i for (i, name) in enumerate(names)}
+    code = array('q')
+    functions: list[BytecodeFunction] = []
+    for name in names:
+        functions.append(lower_function(name, ir[name], function_ids, code))
+    return Program(code, functions, function_ids['main'])
+
+def lower_function(name: str, instructions: list[Instruction], function_ids: dict[str, int], code: 'array[int]') -> BytecodeFunction:
+    entry = len(code)
+    registers: dict[IRVar, int] = {}
+    # The parameters p1, p2, ... come first. A function with an odd amount of
+    # parameters doesn't use p1, which only keeps the native stack aligned.
+    params = sorted({v for v in variables_of(instructions) if is_parameter(v)}, key=lambda v: int(v.name[1:]))
+    for param in params:
+        registers[param] = len(registers)
+
+    def register(v: IRVar) -> int:
+        if v not in registers:
+            registers[v] = len(registers)
+        return registers[v]
+
+    labels: dict[str, int] = {}
+    # Offsets of jump targets to patch, with the label they point to
+    patches: list[tuple[int, str]] = []
+    # The value the native code leaves in %rax, if the function ends without 'return'
+    last_dest = -1
+
+    def emit_target(label: Label) -> None:
+        patches.append((len(code), label.name))
+        code.append(-1)
+
+    i = 0
+    while i < len(instructions):
+        inst = instructions[i]
+        next = instructions[i + 1] if i + 1 < len(instructions) else None
+        i += 1
+        match inst:
+            case Label():
+                labels[inst.name] = len(code)
+            case LoadIntConst():
+                code.extend([OP_LOAD, register(inst.dest), inst.value])
+                last_dest = register(inst.dest)
+            case LoadBoolConst():
+                code.extend([OP_LOAD, register(inst.dest), 1 if inst.value else 0])
+                last_dest = register(inst.dest)
+            case Copy():
+                if isinstance(next, Jump):
+                    code.extend([OP_COPY_JUMP, register(inst.dest), register(inst.source)])
+                    emit_target(next.label)
+                    i += 1
+                else:
+                    code.extend([OP_COPY, register(inst.dest), register(inst.source)])
+                last_dest = register(inst.dest)
+            case Call():
+                fun = inst.fun.name
+                if fun in binary_ops:
+                    op = binary_ops[fun]
+                    args = [register(inst.dest), register(inst.args[0]), register(inst.args[1])]
+                    if op in compare_jumps and isinstance(next, CondJump) and next.cond == inst.dest:
+                        code.extend([compare_jumps[op]] + args)
+                        emit_target(next.then_label)
+                        emit_target(next.else_label)
+                        i += 1
+                    else:
+                        code.extend([op] + args)
+                    last_dest = args[0]
+                elif fun in unary_ops:
+                    code.extend([unary_ops[fun], register(inst.dest), register(inst.args[0])])
+                    last_dest = register(inst.dest)
+                elif fun == 'print_int':
+                    code.extend([OP_PRINT_INT, register(inst.args[0])])
+                elif fun == 'print_bool':
+                    code.extend([OP_PRINT_BOOL, register(inst.args[0])])
+                elif fun == 'read_int':
+                    code.extend([OP_READ_INT, register(inst.dest)])
+                    last_dest = register(inst.dest)
+                elif fun in function_ids:
+                    code.extend([OP_CALL, register(inst.dest), function_ids[fun], len(inst.args)])
+                    code.extend([register(arg) for arg in inst.args])
+                    last_dest = register(inst.dest)
+                else:
+                    raise Exception(f'Calling undefined function {fun}')
+            case Jump():
+                code.append(OP_JUMP)
+                emit_target(inst.label)
+            case CondJump():
+                code.extend([OP_COND_JUMP, register(inst.cond)])
+                emit_target(inst.then_label)
+                emit_target(inst.else_label)
+            case Return():
+                code.extend([OP_RETURN, register(inst.val) if inst.val is not None else -1])
+            case _:
+                raise Exception(f'Unknown instruction: {type(inst)}')
+    code.extend([OP_RETURN, last_dest if name != 'main' else -1])
+
+    for (offset, label) in patches:
+        if label not in labels:
+            raise Exception(f'Jump to undefined label {label} in function {name}')
+        code[offset] = labels[label]
+    return BytecodeFunction(name, entry, len(registers), len(params))
+
+def variables_of(instructions: list[Instruction]) -> list[IRVar]:
+    result: list[IRVar] = []
+    for inst in instructions:
+        for value in vars(inst).values():
+            if isinstance(value, IRVar):
+                result.append(value)
+            elif isinstance(value, list):
+                result.extend(v for v in value if isinstance(v, IRVar))
+    return result
+
+def is_parameter(v: IRVar) -> bool:
+    return v.name.startswith('p') and v.name[1:].isdigit()
+
+def run_program(program: Program, budget: Budget | None = None, channel: Channel | None = None) -> int:
+    """Runs the main function and returns the value of its 'Return', 0 if it has none.
+    Reads and prints through the channel, by default one for the standard input and output.
+    With a budget, every backward jump, which ends a loop iteration, and every call spend its fuel."""
+    if budget is not None:
+        budget.start()
+    io = channel if channel is not None else Channel()
+    try:
+        return execute(program, budget, io)
+    finally:
+        io.flush()
+
+def execute(program: Program, budget: Budget | None, channel: Channel) -> int:
+    # Reading a list is faster than reading an array, which boxes every integer it returns
+    code = program.code.tolist()
+    functions = program.functions
+    main = functions[program.main]
+    regs = [0] * main.registers
+    pc = main.entry
+    # Return address, registers and destination register of the caller of each active call
+    stack: list[tuple[int, list[int], int]] = []
+
+    while True:
+        op = code[pc]
+        if op == OP_COPY:
+            regs[code[pc + 1]] = regs[code[pc + 2]]
+            pc += 3
+        elif op == OP_LOAD:
+            regs[code[pc + 1]] = code[pc + 2]
+            pc += 3
+        elif op == OP_ADD:
+            regs[code[pc + 1]] = regs[code[pc + 2]] + regs[code[pc + 3]]
+            pc += 4
+        elif op == OP_SUB:
+            regs[code[pc + 1]] = regs[code[pc + 2]] - regs[code[pc + 3]]
+            pc += 4
+        elif op == OP_JUMP:
+            target = code[pc + 1]
+            if budget is not None and target < pc:
+                budget.remaining -= 1
+                if budget.remaining == 0:
+                    budget.check()
+            pc = target
+        elif op == OP_COPY_JUMP:
+            regs[code[pc + 1]] = regs[code[pc + 2]]
+            target = code[pc + 3]
+            if budget is not None and target < pc:
+                budget.remaining -= 1
+                if budget.remaining == 0:
+                    budget.check()
+            pc = target
+        elif op == OP_LT_JUMP:
+            if regs[code[pc + 2]] < regs[code[pc + 3]]:
+                regs[code[pc + 1]] = 1
+                pc = code[pc + 4]
+            else:
+                regs[code[pc + 1]] = 0
+                pc = code[pc + 5]
+        elif op == OP_COND_JUMP:
+            pc = code[pc + 2] if regs[code[pc + 1]] else code[pc + 3]
+        elif op == OP_MUL:
+            regs[code[pc + 1]] = regs[code[pc + 2]] * regs[code[pc + 3]]
+            pc += 4
+        elif op == OP_GT_JUMP:
+            if regs[code[pc + 2]] > regs[code[pc + 3]]:
+                regs[code[pc + 1]] = 1
+                pc = code[pc + 4]
+            else:
+                regs[code[pc + 1]] = 0
+                pc = code[pc + 5]
+        elif op == OP_EQ_JUMP:
+            if regs[code[pc + 2]] == regs[code[pc + 3]]:
+                regs[code[pc + 1]] = 1
+                pc = code[pc + 4]
+            else:
+                regs[code[pc + 1]] = 0
+                pc = code[pc + 5]
+        elif op == OP_NE_JUMP:
+            if regs[code[pc + 2]] != regs[code[pc + 3]]:
+                regs[code[pc + 1]] = 1
+                pc = code[pc + 4]
+            else:
+                regs[code[pc + 1]] = 0
+                pc = code[pc + 5]
+        elif op == OP_LE_JUMP:
+            if regs[code[pc + 2]] <= regs[code[pc + 3]]:
+                regs[code[pc + 1]] = 1
+                pc = code[pc + 4]
+            else:
+                regs[code[pc + 1]] = 0
+                pc = code[pc + 5]
+        elif op == OP_GE_JUMP:
+            if regs[code[pc + 2]] >= regs[code[pc + 3]]:
+                regs[code[pc + 1]] = 1
+                pc = code[pc + 4]
+            else:
+                regs[code[pc + 1]] = 0
+                pc = code[pc + 5]
+        elif op == OP_CALL:
+            if budget is not None:
+                budget.remaining -= 1
+                if budget.remaining == 0:
+                    budget.check()
+            function = functions[code[pc + 2]]
+            argc = code[pc + 3]
+            callee_regs = [regs[r] for r in code[pc + 4:pc + 4 + argc]]
+            if argc != function.params:
+                raise Exception(f'Bad arguments for the function {function.name}')
+            callee_regs.extend([0] * (function.registers - argc))
+            stack.append((pc + 4 + argc, regs, code[pc + 1]))
+            regs = callee_regs
+            pc = function.entry
+        elif op == OP_RETURN:
+            value = regs[code[pc + 1]] if code[pc + 1] >= 0 else 0
+            if not stack:
+                return value
+            pc, regs, dest = stack.pop()
+            regs[dest] = value
+        elif op == OP_DIV or op == OP_MOD:
+            a = regs[code[pc + 2]]
+            b = regs[code[pc + 3]]
+            q = a // b
+            if q < 0 and q * b != a:
+                q += 1
+            regs[code[pc + 1]] = q if op == OP_DIV else a - q * b
+            pc += 4
+        elif op == OP_EQ:
+            regs[code[pc + 1]] = 1 if regs[code[pc + 2]] == regs[code[pc + 3]] else 0
+            pc += 4
+        elif op == OP_NE:
+            regs[code[pc + 1]] = 1 if regs[code[pc + 2]] != regs[code[pc + 3]] else 0
+            pc += 4
+        elif op == OP_LT:
+            regs[code[pc + 1]] = 1 if regs[code[pc + 2]] < regs[code[pc + 3]] else 0
+            pc += 4
+        elif op == OP_LE:
+            regs[code[pc + 1]] = 1 if regs[code[pc + 2]] <= regs[code[pc + 3]] else 0
+            pc += 4
+        elif op == OP_GT:
+            regs[code[pc + 1]] = 1 if regs[code[pc + 2]] > regs[code[pc + 3]] else 0
+            pc += 4
+        elif op == OP_GE:
+            regs[code[pc + 1]] = 1 if regs[code[pc + 2]] >= regs[code[pc + 3]] else 0
+            pc += 4
+        elif op == OP_NEG:
+            regs[code[pc + 1]] = -regs[code[pc + 2]]
+            pc += 3
+        elif op == OP_NOT:
+            regs[code[pc + 1]] = regs[code[pc + 2]] ^ 1
+            pc += 3
+        elif op == OP_PRINT_INT:
+            channel.print_int(regs[code[pc + 1]])
+            pc += 2
+        elif op == OP_PRINT_BOOL:
+            channel.print_bool(regs[code[pc + 1]] != 0)
+            pc += 2
+        elif op == OP_READ_INT:
+            regs[code[pc + 1]] = channel.read_int()
+            pc += 2
+        else:
+            raise Exception(f'Unknown opcode {op} at {pc}')
@@ -0,0 +1,57 @@
+"""Buffered input and output for the programs run by the interpreter engines:
+'read_int', 'print_int' and 'print_bool'.
+
+Input is read all at once, from given bytes or from the standard input, and split
+into integers at whitespace. Output is collected and written to the sink in bulk,
+whenever enough of it has been collected and when the program ends.
+"""
+import sys
+from typing import TextIO
+
+class Channel:
+    sink: TextIO
+    buffer_size: int
+    _input: bytes | None
+    _tokens: list[bytes] | None
+    _next: int
+    _parts: list[str]
+    _size: int
+
+    def __init__(self, input: bytes | None = None, sink: TextIO | None = None, buffer_size: int = 1 << 16) -> None:
+        "Without input bytes, reads the standard input when the first integer is read"
+        self.sink = sink if sink is not None else sys.stdout
+        self.buffer_size = buffer_size
+        self._input = input
+        self._tokens = None
+        self._next = 0
+        self._parts = []
+        self._size = 0
+
+    def read_int(self) -> int:
+        if self._tokens is None:
+            data = self._input if self._input is not None else sys.stdin.buffer.read()
+            self._tokens = data.split()
+        if self._next >= len(self._tokens):
+            raise EOFError('No more input to read')
+        token = self._tokens[self._next]
+        self._next += 1
+        return int(token)
+
+    def write(self, text: str) -> None:
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def print_int(self, value: int) -> None:
+        self.write(f'{value}\n')
+
+    def print_bool(self, value: bool) -> None:
+        self.write('true\n' if value else 'false\n')
+
+    def flush(self) -> None:
+        if self._parts:
+            self.sink.write(''.join(self._parts))
+            self._parts.clear()
+            self._size = 0
+        self.sink.flush()
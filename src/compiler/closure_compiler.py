@@ -0,0 +1,285 @@
+"""An interpreter engine that translates the AST once into a tree of Python closures,
+so that running a program is just calling the root closure.
+
+Every closure takes the frame of the running function: a list with a slot for each
+of its parameters and local variables. Names are resolved to slots while compiling,
+and every block gets slots of its own in the frame of the function, so no symbol tables
+are walked while running. Operators behave exactly like in 'interpreter.PredefinedSymbols'.
+"""
+from typing import Any, Callable
+
+from compiler.budget import Budget
+from compiler.channel import Channel
+from compiler.interpreter import PredefinedSymbols, Value
+from compiler.models.expressions import *
+
+Frame = list[Any]
+Compiled = Callable[[Frame], Value]
+
+class CompiledFunction:
+    "A function declaration compiled into a body closure and the size of its frame"
+    name: str
+    arity: int
+    frame_size: int
+    body: Compiled
+
+    def __init__(self, name: str, arity: int) -> None:
+        self.name = name
+        self.arity = arity
+        self.frame_size = arity
+        self.body = undefined_body
+
+    def call(self, args: list[Value]) -> Value:
+        if len(args) != self.arity:
+            raise Exception(f"Bad arguments for the function {self.name}")
+        return self.body(args + [None] * (self.frame_size - self.arity))
+
+def undefined_body(frame: Frame) -> Value:
+    raise Exception('Function is not compiled yet')
+
+def failing(message: str) -> Compiled:
+    "Compiles an error that the tree-walking interpreter reports only when it is evaluated"
+    def fail(frame: Frame) -> Value:
+        raise Exception(message)
+    return fail
+
+def interpret_compiled(exp: Expression) -> Value:
+    return compile_module(exp)()
+
+def compile_module(exp: Expression, budget: Budget | None = None, channel: Channel | None = None) -> Callable[[], Value]:
+    """The program reads and prints through the channel, by default one for the standard
+    input and output, and flushes its output at the end of every run.
+    With a budget, the loops and calls of the program spend its fuel,
+    and every run of the program restarts it"""
+    io = channel if channel is not None else Channel()
+    functions: dict[str, CompiledFunction] = {}
+    if isinstance(exp, Module):
+        declarations = [fun for fun in exp.sequence[1:] if isinstance(fun, FunctionDeclaration)]
+        # Create all functions first, so that calls can be compiled before the callee
+        for fun in declarations:
+            functions[fun.name] = CompiledFunction(fun.name, len(fun.args))
+        for fun in declarations:
+            compiled = functions[fun.name]
+            compiled.body, compiled.frame_size = compile_body(fun.body, [arg.get_name() for arg in fun.args], functions, io, budget)
+        main = exp.sequence[0]
+    else:
+        main = exp
+
+    body, frame_size = compile_body(main, [], functions, io, budget)
+    def run() -> Value:
+        if budget is not None:
+            budget.start()
+        try:
+            return body([None] * frame_size)
+        finally:
+            io.flush()
+    return run
+
+def compile_body(body: Expression, params: list[str], functions: dict[str, CompiledFunction],
+                 channel: Channel, budget: Budget | None = None) -> tuple[Compiled, int]:
+    """Compiles the body of a function or the main code. Returns the closure
+    and the number of slots it needs in the frame. Without a budget,
+    loops and calls are compiled without spending fuel."""
+    # The innermost scope is last, and maps names to slots
+    scopes: list[dict[str, int]] = [{name: i for (i, name) in enumerate(params)}]
+    frame_size = len(params)
+
+    def new_slot() -> int:
+        nonlocal frame_size
+        frame_size += 1
+        return frame_size - 1
+
+    def lookup(name: str) -> int | None:
+        for scope in reversed(scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def compile(node: Expression) -> Compiled:
+        match node:
+            case Literal():
+                value = node.value == True if isinstance(node.value, bool) else node.value
+                return lambda frame: value
+
+            case Identifier():
+                variable = lookup(node.name)
+                if variable is not None:
+                    slot = variable
+                    return lambda frame: frame[slot]
+                if node.name in functions:
+                    function = functions[node.name].call
+                    return lambda frame: function
+                if node.name in PredefinedSymbols:
+                    predefined: Any = PredefinedSymbols[node.name]
+                    return lambda frame: predefined
+                return failing(f'Variable {node.name} is not defined')
+
+            case BinaryOp():
+                if isinstance(node.left, Identifier) and node.op == '=':
+                    return compile_assignment(node.left.name, compile(node.right))
+                if node.op not in PredefinedSymbols:
+                    return failing(f'Unsupported operator "{node.op}"')
+                return compile_binary_op(node.op, compile(node.left), compile(node.right))
+
+            case UnaryOp():
+                right = compile(node.right)
+                def unary_op(frame: Frame) -> Value:
+                    x: Any = right(frame)
+                    return not x if isinstance(x, bool) else -x
+                return unary_op
+
+            case IfExpression():
+                cond = compile(node.cond)
+                then_clause = compile(node.then_clause)
+                if node.else_clause is not None:
+                    else_clause = compile(node.else_clause)
+                    return lambda frame: then_clause(frame) if cond(frame) else else_clause(frame)
+                def if_then(frame: Frame) -> Value:
+                    if cond(frame):
+                        then_clause(frame)
+                    return None
+                return if_then
+
+            case VariableDeclaration():
+                # The initializer can't see the variable it initializes
+                initializer = compile(node.initializer)
+                slot = new_slot()
+                scopes[-1][node.name] = slot
+                def declare(frame: Frame) -> Value:
+                    frame[slot] = initializer(frame)
+                    return None
+                return declare
+
+            case Block():
+                scopes.append({})
+                sequence = [compile(e) for e in node.sequence]
+                scopes.pop()
+                return compile_sequence(sequence)
+
+            case WhileExpression():
+                cond = compile(node.cond)
+                body = compile(node.body)
+                if budget is None:
+                    def loop(frame: Frame) -> Value:
+                        while cond(frame) == True:
+                            body(frame)
+                        return None
+                    return loop
+                metered = budget
+                def metered_loop(frame: Frame) -> Value:
+                    while cond(frame) == True:
+                        metered.remaining -= 1
+                        if metered.remaining == 0:
+                            metered.check()
+                        body(frame)
+                    return None
+                return metered_loop
+
+            case Function():
+                return compile_call(node)
+
+            case ReturnExpression():
+                # Like in the tree-walking interpreter, 'return' evaluates to its value
+                # but doesn't leave the function
+                return compile(node.value)
+
+            case _:
+                return failing(f'Unsupported AST node: {node}')
+
+    def compile_assignment(name: str, value: Compiled) -> Compiled:
+        slot = lookup(name)
+        if slot is None:
+            return failing(f'Asserting unknown variable {name}')
+        def assign(frame: Frame) -> Value:
+            frame[slot] = value(frame)
+            return None
+        return assign
+
+    def compile_call(node: Function) -> Compiled:
+        if node.name in ['print_int', 'print_bool']:
+            if len(node.args) != 1:
+                return failing(f'Unsupported arguments for the {node.name} function, {node.args}')
+            value = compile(node.args[0])
+            if node.name == 'print_int':
+                print_int = channel.print_int
+                def call_print_int(frame: Frame) -> Value:
+                    print_int(value(frame)) # type: ignore[arg-type]
+                    return None
+                return call_print_int
+            print_bool = channel.print_bool
+            def call_print_bool(frame: Frame) -> Value:
+                print_bool(value(frame) == True)
+                return None
+            return call_print_bool
+        if node.name == 'read_int':
+            read_int = channel.read_int
+            return lambda frame: read_int()
+        if node.name not in functions:
+            return failing(f'Calling undefined function {node.name}')
+
+        function = functions[node.name]
+        args = [compile(arg) for arg in node.args]
+        if len(args) != function.arity:
+            return failing(f"Bad arguments for the function {function.name}")
+        if budget is None:
+            def call(frame: Frame) -> Value:
+                new_frame = [arg(frame) for arg in args]
+                new_frame.extend([None] * (function.frame_size - function.arity))
+                return function.body(new_frame)
+            return call
+        metered = budget
+        def metered_call(frame: Frame) -> Value:
+            new_frame = [arg(frame) for arg in args]
+            new_frame.extend([None] * (function.frame_size - function.arity))
+            metered.remaining -= 1
+            if metered.remaining == 0:
+                metered.check()
+            return function.body(new_frame)
+        return metered_call
+
+    compiled = compile(body)
+    return compiled, frame_size
+
+def compile_binary_op(op: str, left: Compiled, right: Compiled) -> Compiled:
+    "Binds the operator into the closure. The most common ones are inlined."
+    match op:
+        case '+': return lambda frame: left(frame) + right(frame) # type: ignore[operator]
+        case '-': return lambda frame: left(frame) - right(frame) # type: ignore[operator]
+        case '*': return lambda frame: left(frame) * right(frame) # type: ignore[operator]
+        case '<': return lambda frame: left(frame) < right(frame) # type: ignore[operator]
+        case '>': return lambda frame: left(frame) > right(frame) # type: ignore[operator]
+        case '==': return lambda frame: left(frame) == right(frame)
+        case 'or':
+            def or_operation(frame: Frame) -> Value:
+                if left(frame) == True:
+                    return True
+                ret = right(frame)
+                return ret if isinstance(ret, bool) else False
+            return or_operation
+        case 'and':
+            def and_operation(frame: Frame) -> Value:
+                if left(frame) == False:
+                    return False
+                ret = right(frame)
+                return ret if isinstance(ret, bool) else False
+            return and_operation
+        case _:
+            operation: Any = PredefinedSymbols[op]
+            return lambda frame: operation(left(frame), right(frame))
+
+def compile_sequence(sequence: list[Compiled]) -> Compiled:
+    if len(sequence) == 1:
+        return sequence[0]
+    if len(sequence) == 2:
+        first, second = sequence
+        def run_two(frame: Frame) -> Value:
+            first(frame)
+            return second(frame)
+        return run_two
+    init = sequence[:-1]
+    last = sequence[-1]
+    def run_all(frame: Frame) -> Value:
+        for exp in init:
+            exp(frame)
+        return last(frame)
+    return run_all
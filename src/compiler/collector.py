@@ -0,0 +1,31 @@
+"""Pausing the cycle collector while building large trees that have no reference cycles,
+like the parser and the decoders do, so that it doesn't keep re-scanning the growing tree."""
+import gc
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+_lock = threading.Lock()
+# The number of threads in 'paused_collector', and whether the collector was enabled before the first one
+_pauses = 0
+_was_enabled = False
+
+
+@contextmanager
+def paused_collector() -> Iterator[None]:
+    """Disables the cycle collector for the duration of the block. The collector setting is global,
+    so with several threads in blocks at once, it is restored only when the last one leaves.
+    It is restored to what it was before the first one entered, so it stays disabled if it was."""
+    global _pauses, _was_enabled
+    with _lock:
+        if _pauses == 0:
+            _was_enabled = gc.isenabled()
+            gc.disable()
+        _pauses += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _pauses -= 1
+            if _pauses == 0 and _was_enabled:
+                gc.enable()
@@ -0,0 +1,154 @@
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+import sys
+
+from compiler.models.expressions import Expression, FunctionDeclaration, Literal, Module
+from compiler.models.tokens import IDENTIFIER, INT_LITERAL, Keywords, Kinds, TokenBuffer, TokenRegex
+from compiler.parser import find_function_declarations, parse
+from compiler.tokenizer import tokenize_buffer
+
+@dataclass(frozen=True)
+class TextEdit:
+    "Replaces the source code between offsets 'start' and 'end' with 'text'"
+    start: int
+    end: int
+    text: str
+
+@dataclass(frozen=True)
+class Relexed:
+    "Result of re-tokenizing an edit: old tokens [first, old_end) became new tokens [first, new_end)"
+    tokens: TokenBuffer
+    first: int
+    old_end: int
+    new_end: int
+
+def relex(tokens: TokenBuffer, edit: TextEdit) -> Relexed:
+    """Re-tokenizes only the region damaged by the edit. Tokenizing starts after the last token
+    that ends before the edit, and stops as soon as a new token starts where an old token
+    after the edit started, because from there on the source and its tokens are unchanged."""
+    old_source = tokens.source
+    source = old_source[:edit.start] + edit.text + old_source[edit.end:]
+    delta = len(edit.text) - (edit.end - edit.start)
+    starts = tokens.starts
+    count = len(tokens)
+
+    # A token ending exactly at the edit could be extended by it
+    first = bisect_left(tokens.ends, edit.start)
+    position = tokens.ends[first - 1] if first > 0 else 0
+    old_end = bisect_left(starts, edit.end)
+
+    kinds = array('B')
+    new_starts = array('I')
+    new_ends = array('I')
+    resynchronized = False
+    for match in TokenRegex.finditer(source, position):
+        type = match.lastgroup
+        if type is None:
+            continue
+        start, end = match.span(type)
+        while old_end < count and starts[old_end] + delta < start:
+            old_end += 1
+        if old_end < count and starts[old_end] + delta == start:
+            resynchronized = True
+            break
+        if type == 'identifier':
+            kinds.append(Keywords.get(match.group(type), IDENTIFIER))
+        elif type == 'int_literal':
+            kinds.append(INT_LITERAL)
+        elif type == 'error':
+            raise Exception(f'Tokenization failed near {source[start:start+10]}')
+        else:
+            kinds.append(Kinds[match.group(type)])
+        new_starts.append(start)
+        new_ends.append(end)
+    if not resynchronized:
+        old_end = count
+
+    # Tokens before the edit that came out the same are not damaged
+    same = 0
+    while (same < len(kinds) and first + same < old_end and new_ends[same] <= edit.start
+           and kinds[same] == tokens.kinds[first + same] and new_starts[same] == starts[first + same]
+           and new_ends[same] == tokens.ends[first + same]):
+        same += 1
+    if same > 0:
+        first += same
+        kinds = kinds[same:]
+        new_starts = new_starts[same:]
+        new_ends = new_ends[same:]
+
+    new_end = first + len(kinds)
+    kinds = tokens.kinds[:first] + kinds + tokens.kinds[old_end:]
+    new_starts = starts[:first] + new_starts + shift_offsets(starts[old_end:], delta)
+    new_ends = tokens.ends[:first] + new_ends + shift_offsets(tokens.ends[old_end:], delta)
+    return Relexed(TokenBuffer(source, kinds, new_starts, new_ends), first, old_end, new_end)
+
+def shift_offsets(offsets: 'array[int]', delta: int) -> 'array[int]':
+    """Adds 'delta' to every offset. Instead of looping in Python, the offsets are
+    added to as one big integer, with 'delta' repeated in every 32-bit lane.
+    No lane can carry or borrow, because every shifted offset is in 0..2**32-1."""
+    if delta == 0 or len(offsets) == 0:
+        return offsets
+    size = offsets.itemsize
+    lanes = int.from_bytes(offsets.tobytes(), sys.byteorder)
+    deltas = int.from_bytes(abs(delta).to_bytes(size, sys.byteorder) * len(offsets), sys.byteorder)
+    lanes = lanes + deltas if delta > 0 else lanes - deltas
+    result = array(offsets.typecode)
+    result.frombytes(lanes.to_bytes(size * len(offsets), sys.byteorder))
+    return result
+
+def reparse(module: Module, tokens: TokenBuffer, edit: TextEdit) -> tuple[Module, TokenBuffer]:
+    """Applies an edit to a module parsed from 'tokens'. Only the damaged region is re-tokenized,
+    and only the function declaration or the main code containing it is re-parsed.
+    Everything else in the returned module is shared with the old one.
+    Falls back to parsing the whole source if the edit changes the top-level structure."""
+    relexed = relex(tokens, edit)
+    new_tokens = relexed.tokens
+    if relexed.first == relexed.old_end == relexed.new_end:
+        # Only whitespace or comments changed
+        return Module(list(module.sequence)), new_tokens
+
+    declarations = find_function_declarations(tokens)
+    if len(declarations) == len(module.sequence) - 1:
+        growth = relexed.new_end - relexed.old_end
+        main_start = declarations[-1][1] if declarations else 0
+        sequence = list(module.sequence)
+        if relexed.first >= main_start:
+            main = parse_main(new_tokens.slice(main_start, len(new_tokens)))
+            if main is not None:
+                sequence[0] = main
+                return Module(sequence), new_tokens
+        for i, (start, end) in enumerate(declarations):
+            if start < relexed.first and relexed.old_end < end:
+                declaration = parse_declaration(new_tokens.slice(start, end + growth))
+                if declaration is not None:
+                    sequence[i + 1] = declaration
+                    return Module(sequence), new_tokens
+                break
+
+    return parse(new_tokens), new_tokens
+
+def parse_main(tokens: TokenBuffer) -> Expression | None:
+    if len(tokens) == 0:
+        return Literal(None)
+    try:
+        module = parse(tokens)
+    except Exception:
+        return None
+    return module.sequence[0] if len(module.sequence) == 1 else None
+
+def parse_declaration(tokens: TokenBuffer) -> FunctionDeclaration | None:
+    try:
+        module = parse(tokens)
+    except Exception:
+        return None
+    if len(module.sequence) == 2 and module.sequence[0] == Literal(None):
+        declaration = module.sequence[1]
+        if isinstance(declaration, FunctionDeclaration):
+            return declaration
+    return None
+
+def parse_source(source_code: str) -> tuple[Module, TokenBuffer]:
+    "Parses source code from scratch, returning the tokens needed by 'reparse'"
+    tokens = tokenize_buffer(source_code)
+    return parse(tokens), tokens
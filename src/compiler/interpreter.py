@@ -1,8 +1,15 @@
-from dataclasses import dataclass
-from typing import Any, Callable
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from types import GeneratorType
+from typing import Any, Callable, Generator
 
+from compiler.budget import Budget
+from compiler.channel import Channel
 from compiler.models.expressions import *
 from compiler.models.symbol_table import *
+from compiler.profiler import Profiler
+from compiler.resolver import Resolution, resolve
+from compiler.tracing import LoopTracer
 
 Value = Callable | int | bool | None
 PredefinedSymbols = {
@@ -22,21 +29,196 @@ PredefinedSymbols = {
 
     'unary_negative': lambda x: not x if isinstance(x, bool) else -x,
 }
+# The Python operator that each predefined operator applies, for loops compiled by 'tracing'.
+# The unary operator negates Ints and Bools alike.
+PythonOperators: dict[Any, str] = {
+    PredefinedSymbols['+']: '+',
+    PredefinedSymbols['-']: '-',
+    PredefinedSymbols['*']: '*',
+    PredefinedSymbols['/']: '//',
+    PredefinedSymbols['<']: '<',
+    PredefinedSymbols['>']: '>',
+    PredefinedSymbols['==']: '==',
+    PredefinedSymbols['<=']: '<=',
+    PredefinedSymbols['>=']: '==',
+    PredefinedSymbols['!=']: '==',
+    PredefinedSymbols['%']: '%',
+    PredefinedSymbols['unary_negative']: 'negate',
+}
+
+Frame = list[Any]
+
+@dataclass(slots=True)
+class Context:
+    """The resolution of the running module, the frames of the running function by depth,
+    and the input and output channel, the budget, the loop tracer and the profiler of the run.
+    Nodes are evaluated through 'evaluate' and 'steps' of the context, which are timed
+    with a profiler, so that the functions used without one don't check for it on every node."""
+    resolution: Resolution
+    frames: list[Frame]
+    channel: Channel
+    budget: Budget | None = None
+    tracer: LoopTracer | None = None
+    profiler: Profiler | None = None
+    evaluate: Callable[[Expression, 'Context'], Value] = field(init=False)
+    steps: Callable[[Expression, 'Context'], 'Evaluation'] = field(init=False)
+
+    def __post_init__(self) -> None:
+        if self.profiler is None:
+            self.evaluate = evaluate
+            self.steps = steps
+        else:
+            self.evaluate = timed_evaluate
+            self.steps = timed_steps
+
+# A memoized call: the function name, the arguments and their types, as True == 1
+MemoKey = tuple[str, tuple[Any, ...], tuple[type, ...]]
+
+class MemoCache:
+    """The values of calls to pure functions, keyed by their arguments. When full,
+    the least recently used value is dropped. Counts hits, misses and drops."""
+    maxsize: int
+    hits: int
+    misses: int
+    evictions: int
+    _values: 'OrderedDict[MemoKey, Value]'
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._values = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def get(self, key: MemoKey) -> tuple[bool, Value]:
+        "Returns whether the key was found, and its value"
+        if key in self._values:
+            self.hits += 1
+            self._values.move_to_end(key)
+            return True, self._values[key]
+        self.misses += 1
+        return False, None
 
-def create_lambda(fun: FunctionDeclaration) -> Callable:
-    return lambda args: call_function(fun, args)
+    def put(self, key: MemoKey, value: Value) -> None:
+        self._values[key] = value
+        self._values.move_to_end(key)
+        if len(self._values) > self.maxsize:
+            self._values.popitem(last=False)
+            self.evictions += 1
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate(),
+        }
+
+@dataclass(slots=True)
+class UserFunction:
+    """A function of the running module, which is the value of its name.
+    Calls to it are memoized if it has a cache."""
+    declaration: FunctionDeclaration
+    resolution: Resolution
+    global_frame: Frame
+    cache: MemoCache | None = field(default=None)
+    # The profiler of the run, for calls from outside of it
+    profiler: Profiler | None = field(default=None)
+
+    def __call__(self, args: list[Value]) -> Value:
+        return call_function(self, args)
+
+@dataclass(slots=True)
+class Invocation:
+    """Asks 'run' to call a function. A call in tail position replaces
+    the call it is in, so that tail calls run in constant space."""
+    function: UserFunction
+    args: list[Value]
+    tail: bool
+
+# An evaluation step of a node with calls in it. Instead of calling each other recursively,
+# steps yield the nested steps and the calls they make to 'run', which sends back their values.
+Evaluation = Generator[Any, Any, Value]
 
 # TODO: add variables, loops, tables, etc...
-def interpret(exp: Expression, variables: SymTab = SymTab(variables=PredefinedSymbols)) -> Value:
+def interpret(exp: Expression, variables: SymTab = SymTab(variables=PredefinedSymbols),
+              cache: MemoCache | None = None, profiler: Profiler | None = None, budget: Budget | None = None,
+              channel: Channel | None = None, tracer: LoopTracer | None = None,
+              resolution: Resolution | None = None) -> Value:
+    """Reads and prints through the channel, by default one for the standard input and output,
+    and flushes its output at the end.
+    With a cache, memoizes the calls to the pure functions of the module in it.
+    With a profiler, counts and times the evaluated nodes, function calls and loop iterations in it.
+    With a budget, spends its fuel on every loop iteration and function call,
+    and raises BudgetExceeded when it runs out of fuel or time.
+    With a loop tracer, compiles the loops that run many iterations to Python.
+    A resolution of the expression, from 'resolve' with the names of the symbol table
+    among its global symbols, can be given to reuse it, for example from the type checker."""
+    global_symbols = dict(variables.variables)
+    parent = variables
+    while isinstance(parent, HierarchicalSymTab):
+        parent = parent.parent
+        global_symbols = parent.variables | global_symbols
+    if resolution is None:
+        resolution = resolve(exp, global_symbols)
+    global_frame: Frame = [global_symbols.get(name) for name in resolution.global_slots]
+    context = Context(resolution, [global_frame], channel if channel is not None else Channel(), budget, tracer, profiler)
+    if budget is not None:
+        budget.start()
+    if tracer is not None:
+        tracer.attach(exp)
+
     if isinstance(exp, Module):
         node = exp.sequence[0]
         for i in range(1, len(exp.sequence)):
             fun = exp.sequence[i]
             if isinstance(fun, FunctionDeclaration):
-                variables.variables[fun.name] = create_lambda(fun)
+                memoized = cache if fun.name in resolution.pure_functions else None
+                global_frame[resolution.global_slots[fun.name]] = UserFunction(fun, resolution, global_frame, memoized, profiler)
     else:
         node = exp
+    if profiler is not None:
+        profiler.start(exp)
+    try:
+        if id(node) in resolution.calls:
+            return run(context.steps(node, context), profiler, budget, context.channel, tracer)
+        return context.evaluate(node, context)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        context.channel.flush()
+
+def timed_evaluate(node: Expression, context: Context) -> Value:
+    "Evaluates a node like 'evaluate', timed by the profiler of the context"
+    profiler = context.profiler
+    assert profiler is not None
+    start = profiler.enter_node(node)
+    try:
+        return evaluate(node, context)
+    finally:
+        profiler.exit_node(node, start)
+
+def timed_steps(node: Expression, context: Context) -> Evaluation:
+    "Like 'steps', timed by the profiler of the context"
+    profiler = context.profiler
+    assert profiler is not None
+    start = profiler.enter_node(node)
+    try:
+        return (yield from steps(node, context))
+    finally:
+        profiler.exit_node(node, start)
 
+def evaluate(node: Expression, context: Context) -> Value:
+    "Evaluates a node without calls in it"
     match node:
         case Literal():
             if isinstance(node.value, bool):
@@ -44,132 +226,330 @@ def interpret(exp: Expression, variables: SymTab = SymTab(variables=PredefinedSy
             return node.value
         
         case Identifier():
-            if node.name in variables.variables:
-                return variables.variables[node.name]
-            elif isinstance(variables, HierarchicalSymTab):
-                return interpret(node, variables.parent)
-            else:
+            location = context.resolution.variables.get(id(node))
+            if location is None:
                 raise Exception(f'Variable {node.name} is not defined')
+            return context.frames[location[0]][location[1]]
         
         case BinaryOp():
             if isinstance(node.left, Identifier) and node.op == '=':
-                if isinstance(variables.variables, dict) and node.left.name in variables.variables:
-                    variables.variables[node.left.name] = interpret(node.right, variables)
-                    return None
-                elif isinstance(variables, HierarchicalSymTab):
-                    return interpret(node, variables.parent)
-                else:
+                location = context.resolution.variables.get(id(node))
+                if location is None:
                     raise Exception(f'Asserting unknown variable {node.left.name}')
+                context.frames[location[0]][location[1]] = context.evaluate(node.right, context)
+                return None
 
-            topVar = variables
-            while isinstance(topVar, HierarchicalSymTab):
-                topVar = topVar.parent
-            if node.op in topVar.variables:
-                if node.op in ['or', 'and']:
-                    return topVar.variables[node.op](node.left, node.right, variables)
-                else:
-                    a: Any = interpret(node.left, variables)
-                    b: Any = interpret(node.right, variables)
-                    return topVar.variables[node.op](a, b)
-            else:
+            operator = context.resolution.operators.get(id(node))
+            if operator is None:
                 raise Exception(f'Unsupported operator "{node.op}"')
+            if node.op == 'or' or node.op == 'and':
+                # Like 'or_operation' and 'and_operation'
+                a: Any = context.evaluate(node.left, context)
+                if node.op == 'or' and a == True:
+                    return True
+                if node.op == 'and' and a == False:
+                    return False
+                ret = context.evaluate(node.right, context)
+                return ret if isinstance(ret, bool) else False
+            a = context.evaluate(node.left, context)
+            b: Any = context.evaluate(node.right, context)
+            return operator(a, b)
             
         case UnaryOp():
-            x: Any = interpret(node.right, variables)
-            op = 'unary_negative'
-            topVar = variables
-            while isinstance(topVar, HierarchicalSymTab):
-                topVar = topVar.parent
-            if op in topVar.variables:
-                return topVar.variables[op](x)
-            else:
+            x: Any = context.evaluate(node.right, context)
+            operator = context.resolution.operators.get(id(node))
+            if operator is None:
                 raise Exception("Couldn't find unary operator")
+            return operator(x)
 
-            
         case IfExpression():
             if node.else_clause is not None:
-                if interpret(node.cond, variables):
-                    return interpret(node.then_clause, variables)
+                if context.evaluate(node.cond, context):
+                    return context.evaluate(node.then_clause, context)
                 else:
-                    return interpret(node.else_clause, variables)
+                    return context.evaluate(node.else_clause, context)
             else:
-                if interpret(node.cond, variables):
-                    interpret(node.then_clause, variables)
+                if context.evaluate(node.cond, context):
+                    context.evaluate(node.then_clause, context)
                 return None
             
         case VariableDeclaration():
-            variables.variables[node.name] = interpret(node.initializer, variables)
+            depth, slot = context.resolution.variables[id(node)]
+            context.frames[depth][slot] = context.evaluate(node.initializer, context)
             return None
 
         case Block():
-            childVariables = HierarchicalSymTab({}, variables)
+            frames = context.frames
+            frames.append([None] * context.resolution.frame_sizes[id(node)])
             for i in range(0, len(node.sequence)-1):
-                interpret(node.sequence[i], childVariables)
-            return interpret(node.sequence[len(node.sequence)-1], childVariables)
+                context.evaluate(node.sequence[i], context)
+            ret = context.evaluate(node.sequence[len(node.sequence)-1], context)
+            frames.pop()
+            return ret
         
         case WhileExpression():
-            while interpret(node.cond, variables) == True:
-                interpret(node.body, variables)
+            if context.tracer is not None:
+                return trace_loop(node, context, context.tracer)
+            budget = context.budget
+            while context.evaluate(node.cond, context) == True:
+                if budget is not None:
+                    budget.remaining -= 1
+                    if budget.remaining == 0:
+                        budget.check()
+                context.evaluate(node.body, context)
             return None
         
         case Function():
-            match node.name:
-                case 'print_int':
-                    if len(node.args) == 1:
-                        if isinstance(node.args[0], Literal) or isinstance(node.args[0], Identifier):
-                            return None
-                    raise Exception(f'Unsupported arguments for the print_int function, {node.args}')
-                case 'print_bool':
-                    if len(node.args) == 1:
-                        if isinstance(node.args[0], Literal) or isinstance(node.args[0], Identifier):
-                            return None
-                    raise Exception(f'Unsupported arguments for the print_bool function, {node.args}')
-                case 'read_int':
-                    val = int(input(""))
-                    return val
-                case _:
-                    top_sym = variables
-                    while isinstance(top_sym, HierarchicalSymTab):
-                        top_sym = top_sym.parent
-                    if not node.name in top_sym.variables:
-                        raise Exception(f'Calling undefined function {node.name}')
-                    print(node.name)
-                    print(top_sym.variables)
-                    function: Callable = top_sym.variables[node.name]
-                    fun_variables = []
-                    for arg in node.args:
-                        fun_variables.append(interpret(arg))
-                    return function(fun_variables)
+            if node.name in ['print_int', 'print_bool', 'read_int']:
+                return call_builtin(node.name, [context.evaluate(arg, context) for arg in node.args], context.channel)
+            # Calls to the functions of the module have 'steps'
+            raise Exception(f'Calling undefined function {node.name}')
             
         case ReturnExpression():
-            return interpret(node.value)
+            return context.evaluate(node.value, context)
                     
         case _:
             raise Exception(f'Unsupported AST node: {node}')
         
-def or_operation(a: Expression, b: Expression, variables: SymTab) -> bool:
-    if interpret(a, variables) == True:
+def trace_loop(node: WhileExpression, context: Context, tracer: LoopTracer) -> Value:
+    "Like the loop in 'evaluate', counting iterations. Once the loop is hot, the rest of it runs compiled if it can."
+    key = id(node)
+    iterations = tracer.iterations.get(key, 0)
+    budget = context.budget
+    try:
+        while True:
+            if iterations >= tracer.threshold:
+                loop = tracer.specialize(node, context.resolution, context.frames, budget, PythonOperators)
+                if loop is not None:
+                    loop.run(context.frames, budget, context.channel)
+                    return None
+            if context.evaluate(node.cond, context) != True:
+                return None
+            if budget is not None:
+                budget.remaining -= 1
+                if budget.remaining == 0:
+                    budget.check()
+            context.evaluate(node.body, context)
+            iterations += 1
+    finally:
+        tracer.iterations[key] = iterations
+
+def call_builtin(name: str, args: list[Value], channel: Channel) -> Value:
+    match name:
+        case 'print_int':
+            if len(args) != 1:
+                raise Exception(f'Unsupported arguments for the print_int function, {args}')
+            channel.print_int(args[0]) # type: ignore[arg-type]
+            return None
+        case 'print_bool':
+            if len(args) != 1:
+                raise Exception(f'Unsupported arguments for the print_bool function, {args}')
+            channel.print_bool(args[0] == True)
+            return None
+        case _:
+            return channel.read_int()
+
+def or_operation(a: Expression, b: Expression, context: Context) -> bool:
+    if context.evaluate(a, context) == True:
         return True
     else:
-        ret = interpret(b, variables)
+        ret = context.evaluate(b, context)
         if isinstance(ret, bool):
             return ret
     return False
 
-def and_operation(a: Expression, b: Expression, variables: SymTab) -> bool:
-    if interpret(a, variables) == False:
+def and_operation(a: Expression, b: Expression, context: Context) -> bool:
+    if context.evaluate(a, context) == False:
         return False
     else:
-        ret = interpret(b, variables)
+        ret = context.evaluate(b, context)
         if isinstance(ret, bool):
             return ret
     return False
 
-def call_function(fun: FunctionDeclaration, args: list[int | bool | None | Callable[..., Any]]) -> Value:
-    print(fun.name, args)
-    if len(args) != len(fun.args):
-        raise Exception(f"Bad arguments for the function {fun.name}")
-    temp_sym: SymTab = SymTab(PredefinedSymbols)
-    for i in range(0, len(args)):
-        temp_sym.variables[fun.args[i].get_name()] = args[i]
-    return interpret(fun.body, temp_sym)
\ No newline at end of file
+def call_function(function: UserFunction, args: list[Value]) -> Value:
+    def call() -> Evaluation:
+        return (yield Invocation(function, args, False))
+    return run(call(), function.profiler)
+
+def run(evaluation: Evaluation, profiler: Profiler | None = None, budget: Budget | None = None,
+        channel: Channel | None = None, tracer: LoopTracer | None = None) -> Value:
+    """Runs evaluation steps, and the calls they make, on an explicit stack.
+    With a profiler, times the calls that aren't memoized. With a budget, spends fuel on every call.
+    Without a channel, the calls read and print through a new one, which is flushed at the end.
+    The loops of the calls are traced with the tracer."""
+    if channel is None:
+        channel = Channel()
+        try:
+            return run(evaluation, profiler, budget, channel, tracer)
+        finally:
+            channel.flush()
+    stack: list[Any] = [evaluation]
+    # The index in the stack of the first step of each running function call,
+    # and the memoized calls waiting for its value
+    bases: list[int] = [0]
+    waiting: list[list[tuple[MemoCache, MemoKey]]] = [[]]
+    value: Any = None
+    while True:
+        try:
+            request = stack[-1].send(value)
+        except StopIteration as result:
+            stack.pop()
+            if not stack:
+                return result.value # type: ignore[no-any-return]
+            value = result.value
+            if len(stack) == bases[-1]:
+                bases.pop()
+                if profiler is not None:
+                    profiler.exit_function()
+                for (cache, key) in waiting.pop():
+                    cache.put(key, value)
+            continue
+
+        if isinstance(request, GeneratorType):
+            stack.append(request)
+            value = None
+            continue
+
+        function: UserFunction = request.function
+        fun = function.declaration
+        if budget is not None:
+            budget.remaining -= 1
+            if budget.remaining == 0:
+                budget.check()
+        if len(request.args) != len(fun.args):
+            raise Exception(f"Bad arguments for the function {fun.name}")
+        keys: list[tuple[MemoCache, MemoKey]] = []
+        if request.tail:
+            # The steps of the calling function only return the value of this call
+            if profiler is not None:
+                # Innermost first, so that the profiler sees the nodes end in order
+                for step in reversed(stack[bases[-1]:]):
+                    step.close()
+                profiler.exit_function()
+            del stack[bases[-1]:]
+            bases.pop()
+            keys = waiting.pop()
+        if function.cache is not None:
+            key = (fun.name, tuple(request.args), tuple(type(arg) for arg in request.args))
+            try:
+                found, value = function.cache.get(key)
+            except TypeError:
+                # Functions as arguments can't be hashed
+                pass
+            else:
+                if found:
+                    for (cache, waiting_key) in keys:
+                        cache.put(waiting_key, value)
+                    continue
+                keys.append((function.cache, key))
+        if profiler is not None:
+            profiler.enter_function(fun.name)
+        resolution = function.resolution
+        frame: Frame = request.args + [None] * (resolution.frame_sizes[id(fun)] - len(request.args))
+        context = Context(resolution, [function.global_frame, frame], channel, budget, tracer, profiler)
+        if id(fun.body) in resolution.calls:
+            bases.append(len(stack))
+            waiting.append(keys)
+            stack.append(context.steps(fun.body, context))
+            value = None
+        else:
+            value = context.evaluate(fun.body, context)
+            if profiler is not None:
+                profiler.exit_function()
+            for (cache, key) in keys:
+                cache.put(key, value)
+
+def steps(node: Expression, context: Context) -> Evaluation:
+    "Like 'evaluate', for a node with calls in it"
+    calls = context.resolution.calls
+    match node:
+        case BinaryOp():
+            if isinstance(node.left, Identifier) and node.op == '=':
+                location = context.resolution.variables.get(id(node))
+                if location is None:
+                    raise Exception(f'Asserting unknown variable {node.left.name}')
+                context.frames[location[0]][location[1]] = (yield context.steps(node.right, context))
+                return None
+
+            operator = context.resolution.operators.get(id(node))
+            if operator is None:
+                raise Exception(f'Unsupported operator "{node.op}"')
+            if node.op == 'or' or node.op == 'and':
+                # Like 'or_operation' and 'and_operation'
+                a = (yield context.steps(node.left, context)) if id(node.left) in calls else context.evaluate(node.left, context)
+                if node.op == 'or' and a == True:
+                    return True
+                if node.op == 'and' and a == False:
+                    return False
+                ret = (yield context.steps(node.right, context)) if id(node.right) in calls else context.evaluate(node.right, context)
+                return ret if isinstance(ret, bool) else False
+            a = (yield context.steps(node.left, context)) if id(node.left) in calls else context.evaluate(node.left, context)
+            b = (yield context.steps(node.right, context)) if id(node.right) in calls else context.evaluate(node.right, context)
+            return operator(a, b) # type: ignore[no-any-return]
+
+        case UnaryOp():
+            x = yield context.steps(node.right, context)
+            operator = context.resolution.operators.get(id(node))
+            if operator is None:
+                raise Exception("Couldn't find unary operator")
+            return operator(x) # type: ignore[no-any-return]
+
+        case IfExpression():
+            cond = (yield context.steps(node.cond, context)) if id(node.cond) in calls else context.evaluate(node.cond, context)
+            if node.else_clause is not None:
+                clause = node.then_clause if cond else node.else_clause
+                return (yield context.steps(clause, context)) if id(clause) in calls else context.evaluate(clause, context)
+            if cond:
+                if id(node.then_clause) in calls:
+                    yield context.steps(node.then_clause, context)
+                else:
+                    context.evaluate(node.then_clause, context)
+            return None
+
+        case VariableDeclaration():
+            depth, slot = context.resolution.variables[id(node)]
+            context.frames[depth][slot] = (yield context.steps(node.initializer, context))
+            return None
+
+        case Block():
+            frames = context.frames
+            frames.append([None] * context.resolution.frame_sizes[id(node)])
+            last: Value = None
+            for exp in node.sequence:
+                last = (yield context.steps(exp, context)) if id(exp) in calls else context.evaluate(exp, context)
+            frames.pop()
+            return last
+
+        case WhileExpression():
+            budget = context.budget
+            while ((yield context.steps(node.cond, context)) if id(node.cond) in calls else context.evaluate(node.cond, context)) == True:
+                if budget is not None:
+                    budget.remaining -= 1
+                    if budget.remaining == 0:
+                        budget.check()
+                if id(node.body) in calls:
+                    yield context.steps(node.body, context)
+                else:
+                    context.evaluate(node.body, context)
+            return None
+
+        case Function():
+            args: list[Value] = []
+            for arg in node.args:
+                args.append((yield context.steps(arg, context)) if id(arg) in calls else context.evaluate(arg, context))
+            if node.name in ['print_int', 'print_bool', 'read_int']:
+                return call_builtin(node.name, args, context.channel)
+            location = context.resolution.variables.get(id(node))
+            if location is None:
+                raise Exception(f'Calling undefined function {node.name}')
+            function = context.frames[0][location[1]]
+            if isinstance(function, UserFunction):
+                return (yield Invocation(function, args, id(node) in context.resolution.tail_calls))
+            return function(args) # type: ignore[no-any-return]
+
+        case ReturnExpression():
+            return (yield context.steps(node.value, context))
+
+        case _:
+            raise Exception(f'Unsupported AST node: {node}')
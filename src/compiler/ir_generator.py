@@ -1,7 +1,11 @@
+from typing import Callable
+
+from compiler.models.arena import *
 from compiler.models.expressions import *
 from compiler.models.instructions import *
 from compiler.models.symbol_table import *
 from compiler.models.types import *
+from compiler.resolver import Resolution, resolve, resolve_arena
 
 RootTypes = {
     IRVar('+'): Int,
@@ -28,6 +32,9 @@ def get_next_var_number() -> int:
     next_var_number = next_var_number + 1
     return ret
 
+# Generates the IR of a child node, and returns the variable of its value
+Generate = Callable[[], IRVar]
+
 end_label_number = 1
 def get_next_end_label_number() -> int:
     global end_label_number
@@ -35,283 +42,379 @@ def get_next_end_label_number() -> int:
     end_label_number = end_label_number + 1
     return ret
 
-def generate_ir(exp: Expression,  root_types: dict[IRVar, Type] = {}) -> dict[str, list[Instruction]]:
-    instructions_dictionary: dict[str, list[Instruction]] = {}   
-    var_types: dict[IRVar, Type] = root_types.copy()
-
+class FunctionIR:
+    """The instructions of a function or the main program being generated, and the code of each kind of node,
+    for both forms of the AST. The visitors generate the children, some of them through the functions
+    given, so that the instructions of each come where they belong."""
+    resolution: Resolution
+    ir_vars: dict[int, IRVar]
+    instructions: list[Instruction]
     # 'var_unit' is used when an expression's type is 'Unit'.
-    var_unit = IRVar('unit')
-    var_types[var_unit] = Unit
-    
-    next_label_number = 1
-    next_parameter_number = 1
-    instructions: list[Instruction] = []
+    var_unit: IRVar
+    next_label_number: int
+    next_parameter_number: int
+
+    def __init__(self, resolution: Resolution, ir_vars: dict[int, IRVar]) -> None:
+        self.resolution = resolution
+        self.ir_vars = ir_vars
+        self.instructions = []
+        self.var_unit = IRVar('unit')
+        self.next_label_number = 1
+        self.next_parameter_number = 1
 
-    def new_var(t: Type) -> IRVar:
+    def new_var(self, t: Type) -> IRVar:
         next = get_next_var_number()
         var = IRVar(f'x{next}')
         return var
     
-    def new_label() -> Label:
-        nonlocal next_label_number
-        label = Label(f'L{next_label_number}')
-        next_label_number += 1
+    def new_label(self) -> Label:
+        label = Label(f'L{self.next_label_number}')
+        self.next_label_number += 1
         return label
     
-    def new_parameter() -> IRVar:
-        nonlocal next_parameter_number
-        parameter = IRVar(f'p{next_parameter_number}')
-        next_parameter_number += 1
+    def new_parameter(self) -> IRVar:
+        parameter = IRVar(f'p{self.next_parameter_number}')
+        self.next_parameter_number += 1
         return parameter
     
-    def reset_parameters() -> None:
-        nonlocal next_parameter_number
-        next_parameter_number = 1
-    
-    def visit(node: Expression, variables: SymTab) -> IRVar:
-        match node:
-            case Literal():
-                match node.value:
-                    case bool():
-                        var = new_var(Bool)
-                        instructions.append(LoadBoolConst(node.value, var))
-                    case int():
-                        var = new_var(Int)
-                        instructions.append(LoadIntConst(node.value, var))
-                    case None:
-                        var = var_unit
-                    case _:
-                        raise Exception(f"loc(TODO): unsupported literal: {type(node.value)}")
-                    
-                return var
-            
-            case Identifier():
-                if node.name in variables.variables:
-                    return variables.variables[node.name]
-                elif isinstance(variables, HierarchicalSymTab):
-                    return visit(node, variables.parent)
-                else:
-                    raise Exception(f'Variable {node.name} is not defined')
+    def lookup(self, key: int) -> IRVar | None:
+        "Returns the IR variable of the declaration that the node with the key is bound to"
+        declaration = self.resolution.bindings.get(key)
+        return self.ir_vars.get(declaration) if declaration is not None else None
 
+    def parameters(self, keys: list[int], types: list[Type]) -> None:
+        if len(keys) % 2 == 1: self.new_parameter() # fix for odd amount of parameters to make stack % 16 = 0
+        for (key, t) in zip(keys, types):
+            ir_var = self.new_parameter()
+            var = self.new_var(t)
+            self.instructions.append(Copy(ir_var, var))
+            self.ir_vars[self.resolution.bindings[key]] = var
+        self.next_parameter_number = 1
+
+    def literal(self, value: int | bool | None) -> IRVar:
+        match value:
+            case bool():
+                var = self.new_var(Bool)
+                self.instructions.append(LoadBoolConst(value, var))
+            case int():
+                var = self.new_var(Int)
+                self.instructions.append(LoadIntConst(value, var))
+            case None:
+                var = self.var_unit
+            case _:
+                raise Exception(f"loc(TODO): unsupported literal: {type(value)}")
             
-            case BinaryOp():
-                var_left = visit(node.left, variables)
-
-                if isinstance(node.left, Identifier) and node.op == '=':
-                    if isinstance(variables.variables, dict) and node.left.name in variables.variables:
-                        var_right = visit(node.right, variables)
-                        instructions.append(Copy(var_right, variables.variables[node.left.name]))
-                        return variables.variables[node.left.name]
-                    elif isinstance(variables, HierarchicalSymTab):
-                        return visit(node, variables.parent)
-                    else:
-                        raise Exception(f'Asserting unknown variable {node.left.name}')
-                elif node.op == 'and':
-                    label_and_right = new_label()
-                    label_and_skip = new_label()
-                    label_and_end = new_label()
-                    instructions.append(CondJump(var_left, label_and_right, label_and_skip))
-                    instructions.append(label_and_right)
-                    var_right = visit(node.right, variables)
-                    var_result = new_var(node.type)
-                    instructions.append(Copy(var_right, var_result))
-                    instructions.append(Jump(label_and_end))
-                    instructions.append(label_and_skip)
-                    instructions.append(LoadBoolConst(False, var_result))
-                    instructions.append(Jump(label_and_end))
-                    instructions.append(label_and_end)
-                    return var_result
-                elif node.op == 'or':
-                    label_or_right = new_label()
-                    label_or_skip = new_label()
-                    label_or_end = new_label()
-                    instructions.append(CondJump(var_left, label_or_skip, label_or_right))
-                    instructions.append(label_or_right)
-                    var_right = visit(node.right, variables)
-                    var_result = new_var(node.type)
-                    instructions.append(Copy(var_right, var_result))
-                    instructions.append(Jump(label_or_end))
-                    instructions.append(label_or_skip)
-                    instructions.append(LoadBoolConst(True, var_result))
-                    instructions.append(Jump(label_or_end))
-                    instructions.append(label_or_end)
-                    return var_result
-
-                var_right = visit(node.right, variables)
-                var_result = new_var(node.type)
-                instructions.append(Call(
-                    fun=IRVar(node.op),
-                    args=[var_left, var_right],
-                    dest=var_result
-                ))
-                return var_result
-            
-            case UnaryOp():
-                variable = visit(node.right, variables)
-                var_result = new_var(node.type)
-                if node.type == BasicType('Int'):
-                    instructions.append(Call(
-                        fun=IRVar('unary_-'),
-                        args=[variable],
-                        dest=var_result
-                    ))
-                elif node.type == BasicType('Bool'):
-                    instructions.append(Call(
-                        fun=IRVar('unary_not'),
-                        args=[variable],
-                        dest=var_result
-                    ))
-                else:
-                    raise Exception(f'Unknown unary operation {node.op} with node type {node.type}')
-                return var_result
-
-            case IfExpression():
-                if node.else_clause is None:
-                    l_then = new_label()
-                    l_end = new_label()
-
-                    var_cond = visit(node.cond, variables)
-                    instructions.append(CondJump(var_cond, l_then, l_end))
-
-                    instructions.append(l_then)
-                    var_result = visit(node.then_clause, variables)
-
-                    instructions.append(l_end)
-                    return var_result
-                else:
-                    l_then = new_label()
-                    l_else = new_label()
-                    l_end = new_label()
-
-                    var_cond = visit(node.cond, variables)
-                    instructions.append(CondJump(var_cond, l_then, l_else))
-
-                    var_result = new_var(BasicType('Unit'))
-
-                    instructions.append(l_then)
-                    var_result_then = visit(node.then_clause, variables)
-                    instructions.append(Copy(var_result_then, var_result))
-                    instructions.append(Jump(l_end))
-
-                    instructions.append(l_else)
-                    var_else_result = visit(node.else_clause, variables)
-                    instructions.append(Copy(var_else_result, var_result))
-
-                    instructions.append(l_end)
-                    return var_result
-                
-            case VariableDeclaration():
-                last = visit(node.initializer, variables)
-                var_result = new_var(node.initializer.type)
-                instructions.append(Copy(last, var_result))
-                variables.variables[node.name] = var_result
-                
-                return var_unit
-
-            case Block():
-                childVariables = HierarchicalSymTab({}, variables)
-                for i in range(0, len(node.sequence)-1):
-                    visit(node.sequence[i], childVariables)
-                return visit(node.sequence[len(node.sequence)-1], childVariables)
-            
-            case WhileExpression():
-                l_start = new_label()
-                l_body = new_label()
-                l_end = new_label()
+        return var
 
-                instructions.append(l_start)
-                var_cond = visit(node.cond, variables)
-                instructions.append(CondJump(var_cond, l_body, l_end))
+    def variable(self, key: int, name: str) -> IRVar:
+        variable = self.lookup(key)
+        if variable is None:
+            raise Exception(f'Variable {name} is not defined')
+        return variable
 
-                instructions.append(l_body)
-                var_result_body = visit(node.body, variables)
-                instructions.append(Jump(l_start))
+    def assignment(self, key: int, name: str, right: Generate) -> IRVar:
+        assigned = self.lookup(key)
+        if assigned is None:
+            raise Exception(f'Asserting unknown variable {name}')
+        var_right = right()
+        self.instructions.append(Copy(var_right, assigned))
+        return assigned
 
-                instructions.append(l_end)
-                return var_result_body
-            
-            case Function():
-                if node.name in ['print_int', 'print_bool', 'read_int']:
-                    if len(node.args) > 1:
-                        raise Exception(f"Invalid arguments for function {node.name}")
-                    var_result = new_var(BasicType('Unit'))
-                    args = []
-                    for arg in node.args:
-                        args.append(visit(arg, variables))
-                    instructions.append(Call(
-                        fun=IRVar(node.name),
-                        args=args,
-                        dest=var_result
-                    ))
-                    return var_result
-                else:
-                    var_result = new_var(node.type)
-                    root_variables = variables
-                    while isinstance(root_variables, HierarchicalSymTab):
-                        root_variables = root_variables.parent
-                    args=[]
-                    for arg in node.args:
-                        args.append(visit(arg, variables))
-                    instructions.append(Call(
-                        fun=IRVar(node.name),
-                        args=args,
-                        dest=var_result
-                    ))
-                    return var_result
-                
-            case ReturnExpression():
-                res = visit(node.value, variables)
-                instructions.append(Return(val=res))
-                instructions.append(Jump(Label(f"End_{end_label_number}")))
-                return res
+    def logical_op(self, op: str, t: Type, var_left: IRVar, right: Generate) -> IRVar:
+        "Generates 'and' or 'or', of which the right side is evaluated only if needed"
+        instructions = self.instructions
+        if op == 'and':
+            label_and_right = self.new_label()
+            label_and_skip = self.new_label()
+            label_and_end = self.new_label()
+            instructions.append(CondJump(var_left, label_and_right, label_and_skip))
+            instructions.append(label_and_right)
+            var_right = right()
+            var_result = self.new_var(t)
+            instructions.append(Copy(var_right, var_result))
+            instructions.append(Jump(label_and_end))
+            instructions.append(label_and_skip)
+            instructions.append(LoadBoolConst(False, var_result))
+            instructions.append(Jump(label_and_end))
+            instructions.append(label_and_end)
+            return var_result
+        elif op == 'or':
+            label_or_right = self.new_label()
+            label_or_skip = self.new_label()
+            label_or_end = self.new_label()
+            instructions.append(CondJump(var_left, label_or_skip, label_or_right))
+            instructions.append(label_or_right)
+            var_right = right()
+            var_result = self.new_var(t)
+            instructions.append(Copy(var_right, var_result))
+            instructions.append(Jump(label_or_end))
+            instructions.append(label_or_skip)
+            instructions.append(LoadBoolConst(True, var_result))
+            instructions.append(Jump(label_or_end))
+            instructions.append(label_or_end)
+            return var_result
+        raise Exception(f'Unknown logical operator {op}')
 
-            case _:
-                raise Exception(f'Unsupported AST node: {node}')
-            
+    def binary_op(self, op: str, t: Type, var_left: IRVar, var_right: IRVar) -> IRVar:
+        var_result = self.new_var(t)
+        self.instructions.append(Call(
+            fun=IRVar(op),
+            args=[var_left, var_right],
+            dest=var_result
+        ))
+        return var_result
 
-    root_symtab = SymTab({})
-    for v in root_types.keys():
-        root_symtab.variables[v.name] = v
-
-    if isinstance(exp, Module):
-        root_node = exp.sequence[0]
-        for i in range(1, len(exp.sequence)):
-            next = exp.sequence[i]
-            if isinstance(next, FunctionDeclaration):
-                instructions_dictionary[next.name] = generate_ir(next)["main"]
-                instructions_dictionary[next.name].append(Label(f"End_{end_label_number}"))
-                get_next_end_label_number()
-        instructions.append(Label('start'))
-    elif isinstance(exp, FunctionDeclaration):
-        if len(exp.args) % 2 == 1: new_parameter() # fix for odd amount of parameters to make stack % 16 = 0
-        for arg in exp.args:
-            ir_var = new_parameter()
-            var = new_var(arg.type)
-            instructions.append(Copy(ir_var, var))
-            root_symtab.variables[arg.get_name()] = var
-        reset_parameters()
-        root_node = exp.body
-    else:
-        root_node = exp
-        instructions.append(Label('start'))
-    
-    var_result = visit(root_node, root_symtab)
+    def unary_op(self, op: str, t: Type, variable: IRVar) -> IRVar:
+        var_result = self.new_var(t)
+        if t == BasicType('Int'):
+            self.instructions.append(Call(
+                fun=IRVar('unary_-'),
+                args=[variable],
+                dest=var_result
+            ))
+        elif t == BasicType('Bool'):
+            self.instructions.append(Call(
+                fun=IRVar('unary_not'),
+                args=[variable],
+                dest=var_result
+            ))
+        else:
+            raise Exception(f'Unknown unary operation {op} with node type {t}')
+        return var_result
+
+    def if_expression(self, cond: Generate, then_clause: Generate, else_clause: Generate | None) -> IRVar:
+        instructions = self.instructions
+        if else_clause is None:
+            l_then = self.new_label()
+            l_end = self.new_label()
+
+            var_cond = cond()
+            instructions.append(CondJump(var_cond, l_then, l_end))
+
+            instructions.append(l_then)
+            var_result = then_clause()
+
+            instructions.append(l_end)
+            return var_result
+        else:
+            l_then = self.new_label()
+            l_else = self.new_label()
+            l_end = self.new_label()
+
+            var_cond = cond()
+            instructions.append(CondJump(var_cond, l_then, l_else))
 
-    if not isinstance(exp, FunctionDeclaration):
-        if root_node.type == Int:
-            instructions.append(Call(
+            var_result = self.new_var(BasicType('Unit'))
+
+            instructions.append(l_then)
+            var_result_then = then_clause()
+            instructions.append(Copy(var_result_then, var_result))
+            instructions.append(Jump(l_end))
+
+            instructions.append(l_else)
+            var_else_result = else_clause()
+            instructions.append(Copy(var_else_result, var_result))
+
+            instructions.append(l_end)
+            return var_result
+
+    def variable_declaration(self, key: int, t: Type, last: IRVar) -> IRVar:
+        var_result = self.new_var(t)
+        self.instructions.append(Copy(last, var_result))
+        self.ir_vars[self.resolution.bindings[key]] = var_result
+        
+        return self.var_unit
+
+    def while_expression(self, cond: Generate, body: Generate) -> IRVar:
+        instructions = self.instructions
+        l_start = self.new_label()
+        l_body = self.new_label()
+        l_end = self.new_label()
+
+        instructions.append(l_start)
+        var_cond = cond()
+        instructions.append(CondJump(var_cond, l_body, l_end))
+
+        instructions.append(l_body)
+        var_result_body = body()
+        instructions.append(Jump(l_start))
+
+        instructions.append(l_end)
+        return var_result_body
+
+    def call(self, name: str, t: Type, arg_count: int, args: Callable[[], list[IRVar]]) -> IRVar:
+        if name in ['print_int', 'print_bool', 'read_int']:
+            if arg_count > 1:
+                raise Exception(f"Invalid arguments for function {name}")
+            var_result = self.new_var(BasicType('Unit'))
+        else:
+            var_result = self.new_var(t)
+        self.instructions.append(Call(
+            fun=IRVar(name),
+            args=args(),
+            dest=var_result
+        ))
+        return var_result
+
+    def return_expression(self, res: IRVar) -> IRVar:
+        self.instructions.append(Return(val=res))
+        self.instructions.append(Jump(Label(f"End_{end_label_number}")))
+        return res
+
+    def print_result(self, var_result: IRVar, t: Type) -> None:
+        "Ends the main program, printing its value"
+        if t == Int:
+            self.instructions.append(Call(
                 IRVar("print_int"),
                 [var_result],
-                new_var(Unit)
+                self.new_var(Unit)
             ))
-        elif root_node.type == Bool:
-            instructions.append(Call(
+        elif t == Bool:
+            self.instructions.append(Call(
                 IRVar("print_bool"),
                 [var_result],
-                new_var(Unit)
+                self.new_var(Unit)
             ))
 
-        instructions.append(Return())
+        self.instructions.append(Return())
+
+def generate_ir(exp: Expression | Arena,  root_types: dict[IRVar, Type] = {},
+                resolution: Resolution | None = None, root: int = 0) -> dict[str, list[Instruction]]:
+    """Generates the IR of each function of a type checked module, and of its main program.
+    The names of the root types are global variables.
+    The resolution that the module was type checked with can be given to reuse it.
+    An arena is read by its indices, from the node at 'root', with a resolution from 'resolve_arena'."""
+    if resolution is None:
+        names = {v.name: t for (v, t) in root_types.items()}
+        if isinstance(exp, Arena):
+            resolution = resolve_arena(exp, names)
+        else:
+            # A function is resolved in a module of its own
+            resolution = resolve(Module([Literal(None), exp]) if isinstance(exp, FunctionDeclaration) else exp, names)
+    # The global symbols are declared first, so their declarations are their slots
+    code = FunctionIR(resolution, {
+        resolution.global_slots[v.name]: v for v in root_types.keys() if v.name in resolution.global_slots})
+    instructions_dictionary: dict[str, list[Instruction]] = {}
 
-    instructions_dictionary["main"] = instructions
-    return instructions_dictionary
\ No newline at end of file
+    def generate_functions(functions: list[tuple[str, Expression | Arena, int]]) -> None:
+        for (name, function, index) in functions:
+            instructions_dictionary[name] = generate_ir(function, root_types, resolution, index)["main"]
+            instructions_dictionary[name].append(Label(f"End_{end_label_number}"))
+            get_next_end_label_number()
+
+    if isinstance(exp, Arena):
+        kind = exp.kinds[root]
+        if kind == NODE_MODULE:
+            (main, *rest) = exp.children(root)
+            generate_functions([(exp.name(f), exp, f) for f in rest if exp.kinds[f] == NODE_FUNCTION_DECLARATION])
+            code.instructions.append(Label('start'))
+        elif kind == NODE_FUNCTION_DECLARATION:
+            (*args, main) = exp.children(root)
+            code.parameters(args, [exp.type(arg) for arg in args])
+        else:
+            main = root
+            code.instructions.append(Label('start'))
+        var_result = visit_arena(code, exp, main)
+        if kind != NODE_FUNCTION_DECLARATION:
+            code.print_result(var_result, exp.type(main))
+    else:
+        if isinstance(exp, Module):
+            root_node = exp.sequence[0]
+            generate_functions([(f.name, f, 0) for f in exp.sequence[1:] if isinstance(f, FunctionDeclaration)])
+            code.instructions.append(Label('start'))
+        elif isinstance(exp, FunctionDeclaration):
+            code.parameters([id(arg) for arg in exp.args], [arg.type for arg in exp.args])
+            root_node = exp.body
+        else:
+            root_node = exp
+            code.instructions.append(Label('start'))
+        var_result = visit(code, root_node)
+        if not isinstance(exp, FunctionDeclaration):
+            code.print_result(var_result, root_node.type)
+
+    instructions_dictionary["main"] = code.instructions
+    return instructions_dictionary
+
+def visit(code: FunctionIR, node: Expression) -> IRVar:
+    match node:
+        case Literal():
+            return code.literal(node.value)
+        
+        case Identifier():
+            return code.variable(id(node), node.name)
+        
+        case BinaryOp():
+            if isinstance(node.left, Identifier) and node.op == '=':
+                return code.assignment(id(node), node.left.name, lambda: visit(code, node.right))
+            var_left = visit(code, node.left)
+            if node.op == 'and' or node.op == 'or':
+                return code.logical_op(node.op, node.type, var_left, lambda: visit(code, node.right))
+            return code.binary_op(node.op, node.type, var_left, visit(code, node.right))
+        
+        case UnaryOp():
+            return code.unary_op(node.op, node.type, visit(code, node.right))
+
+        case IfExpression():
+            else_clause = node.else_clause
+            return code.if_expression(lambda: visit(code, node.cond), lambda: visit(code, node.then_clause),
+                                      (lambda: visit(code, else_clause)) if else_clause is not None else None)
+            
+        case VariableDeclaration():
+            return code.variable_declaration(id(node), node.initializer.type, visit(code, node.initializer))
+
+        case Block():
+            for i in range(0, len(node.sequence)-1):
+                visit(code, node.sequence[i])
+            return visit(code, node.sequence[len(node.sequence)-1])
+        
+        case WhileExpression():
+            return code.while_expression(lambda: visit(code, node.cond), lambda: visit(code, node.body))
+        
+        case Function():
+            return code.call(node.name, node.type, len(node.args), lambda: [visit(code, arg) for arg in node.args])
+            
+        case ReturnExpression():
+            return code.return_expression(visit(code, node.value))
+
+        case _:
+            raise Exception(f'Unsupported AST node: {node}')
+
+def visit_arena(code: FunctionIR, arena: Arena, i: int) -> IRVar:
+    "Like 'visit' for the node at the index of the arena"
+    kind = arena.kinds[i]
+    children = arena.children(i)
+    if kind == NODE_LITERAL:
+        return code.literal(arena.literal(i))
+    elif kind == NODE_IDENTIFIER:
+        return code.variable(i, arena.name(i))
+    elif kind == NODE_BINARY_OP:
+        (left, right) = children
+        if arena.kinds[left] == NODE_IDENTIFIER and arena.op(i) == '=':
+            return code.assignment(i, arena.name(left), lambda: visit_arena(code, arena, right))
+        op = arena.op(i)
+        var_left = visit_arena(code, arena, left)
+        if op == 'and' or op == 'or':
+            return code.logical_op(op, arena.type(i), var_left, lambda: visit_arena(code, arena, right))
+        return code.binary_op(op, arena.type(i), var_left, visit_arena(code, arena, right))
+    elif kind == NODE_UNARY_OP:
+        return code.unary_op(arena.op(i), arena.type(i), visit_arena(code, arena, children[0]))
+    elif kind == NODE_IF:
+        return code.if_expression(
+            lambda: visit_arena(code, arena, children[0]), lambda: visit_arena(code, arena, children[1]),
+            (lambda: visit_arena(code, arena, children[2])) if len(children) > 2 else None)
+    elif kind == NODE_VARIABLE_DECLARATION:
+        return code.variable_declaration(i, arena.type(children[0]), visit_arena(code, arena, children[0]))
+    elif kind == NODE_BLOCK:
+        for c in children[:-1]:
+            visit_arena(code, arena, c)
+        return visit_arena(code, arena, children[-1])
+    elif kind == NODE_WHILE:
+        return code.while_expression(
+            lambda: visit_arena(code, arena, children[0]), lambda: visit_arena(code, arena, children[1]))
+    elif kind == NODE_FUNCTION:
+        return code.call(
+            arena.name(i), arena.type(i), len(children), lambda: [visit_arena(code, arena, c) for c in children])
+    elif kind == NODE_RETURN:
+        return code.return_expression(visit_arena(code, arena, children[0]))
+    else:
+        raise Exception(f'Unknown node kind: {kind}')
@@ -0,0 +1,160 @@
+"""A reference interpreter that runs the output of 'generate_ir' directly,
+instruction by instruction, without assembling it.
+
+Before running, every function gets a map from its labels to instruction indices,
+and its variables are numbered, so that each call keeps its variables in a list.
+The semantics are the same as in 'compiler.bytecode': parameters in declaration order,
+booleans as 0 and 1, division rounding towards zero, and functions ending without
+'return' giving the value of their last computed variable.
+"""
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from compiler.budget import Budget
+from compiler.channel import Channel
+from compiler.bytecode import is_parameter, variables_of
+from compiler.models.instructions import *
+
+def divide(a: int, b: int) -> int:
+    q = a // b
+    if q < 0 and q * b != a:
+        q += 1
+    return q
+
+def remainder(a: int, b: int) -> int:
+    return a - divide(a, b) * b
+
+Intrinsics: dict[str, Callable[..., int]] = {
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b,
+    '/': divide,
+    '%': remainder,
+    '==': lambda a, b: int(a == b),
+    '!=': lambda a, b: int(a != b),
+    '<': lambda a, b: int(a < b),
+    '<=': lambda a, b: int(a <= b),
+    '>': lambda a, b: int(a > b),
+    '>=': lambda a, b: int(a >= b),
+    'unary_-': lambda a: -a,
+    'unary_not': lambda a: a ^ 1,
+}
+
+@dataclass
+class IRFunction:
+    name: str
+    instructions: list[Instruction]
+    # Operands of each instruction: variable slots, constants and instruction indices of labels
+    operands: list[tuple[Any, ...]]
+    variables: int
+    params: int
+    # The slot of the last computed variable, returned when the function ends without 'return'
+    result: int
+
+def prepare_function(name: str, instructions: list[Instruction], names: set[str]) -> IRFunction:
+    slots: dict[IRVar, int] = {}
+    params = sorted({v for v in variables_of(instructions) if is_parameter(v)}, key=lambda v: int(v.name[1:]))
+    for param in params:
+        slots[param] = len(slots)
+    for v in variables_of(instructions):
+        if v not in slots:
+            slots[v] = len(slots)
+    labels = {inst.name: i for (i, inst) in enumerate(instructions) if isinstance(inst, Label)}
+
+    def index(label: Label) -> int:
+        if label.name not in labels:
+            raise Exception(f'Jump to undefined label {label.name} in function {name}')
+        return labels[label.name]
+
+    operands: list[tuple[Any, ...]] = []
+    result = -1
+    for inst in instructions:
+        match inst:
+            case LoadIntConst() | LoadBoolConst():
+                operands.append((slots[inst.dest], int(inst.value)))
+                result = slots[inst.dest]
+            case Copy():
+                operands.append((slots[inst.dest], slots[inst.source]))
+                result = slots[inst.dest]
+            case Call():
+                if inst.fun.name in Intrinsics:
+                    operands.append((slots[inst.dest], Intrinsics[inst.fun.name], [slots[arg] for arg in inst.args]))
+                elif inst.fun.name in names or inst.fun.name in ['print_int', 'print_bool', 'read_int']:
+                    operands.append((slots[inst.dest], inst.fun.name, [slots[arg] for arg in inst.args]))
+                else:
+                    raise Exception(f'Calling undefined function {inst.fun.name}')
+                if inst.fun.name not in ['print_int', 'print_bool']:
+                    result = slots[inst.dest]
+            case Jump():
+                operands.append((index(inst.label),))
+            case CondJump():
+                operands.append((slots[inst.cond], index(inst.then_label), index(inst.else_label)))
+            case Return():
+                operands.append((slots[inst.val] if inst.val is not None else -1,))
+            case Label():
+                operands.append(())
+            case _:
+                raise Exception(f'Unknown instruction: {type(inst)}')
+    return IRFunction(name, instructions, operands, len(slots), len(params), result if name != 'main' else -1)
+
+def run_ir(ir: dict[str, list[Instruction]], budget: Budget | None = None, channel: Channel | None = None) -> int:
+    """Runs the main function and returns the value of its 'Return', 0 if it has none.
+    Reads and prints through the channel, by default one for the standard input and output.
+    With a budget, every backward jump, which ends a loop iteration, and every call spend its fuel."""
+    names = set(ir.keys())
+    functions = {name: prepare_function(name, instructions, names) for (name, instructions) in ir.items()}
+    if budget is not None:
+        budget.start()
+    io = channel if channel is not None else Channel()
+    try:
+        return call(functions, functions['main'], [], io, budget)
+    finally:
+        io.flush()
+
+def call(functions: dict[str, IRFunction], function: IRFunction, args: list[int],
+         channel: Channel, budget: Budget | None = None) -> int:
+    if len(args) != function.params:
+        raise Exception(f'Bad arguments for the function {function.name}')
+    frame = args + [0] * (function.variables - len(args))
+    instructions = function.instructions
+    operands = function.operands
+    pc = 0
+    while pc < len(instructions):
+        inst = instructions[pc]
+        ops = operands[pc]
+        pc += 1
+        match inst:
+            case Copy():
+                frame[ops[0]] = frame[ops[1]]
+            case LoadIntConst() | LoadBoolConst():
+                frame[ops[0]] = ops[1]
+            case Call():
+                dest, fun, arg_slots = ops
+                values = [frame[slot] for slot in arg_slots]
+                if not isinstance(fun, str):
+                    frame[dest] = fun(*values)
+                elif fun == 'print_int':
+                    channel.print_int(values[0])
+                elif fun == 'print_bool':
+                    channel.print_bool(values[0] != 0)
+                elif fun == 'read_int':
+                    frame[dest] = channel.read_int()
+                else:
+                    if budget is not None:
+                        budget.remaining -= 1
+                        if budget.remaining == 0:
+                            budget.check()
+                    frame[dest] = call(functions, functions[fun], values, channel, budget)
+            case Jump():
+                if budget is not None and ops[0] < pc:
+                    budget.remaining -= 1
+                    if budget.remaining == 0:
+                        budget.check()
+                pc = ops[0]
+            case CondJump():
+                pc = ops[1] if frame[ops[0]] else ops[2]
+            case Return():
+                return frame[ops[0]] if ops[0] >= 0 else 0
+            case Label():
+                pass
+    return frame[function.result] if function.result >= 0 else 0
@@ -0,0 +1,324 @@
+"""Runs the output of 'generate_assembly' in this process, without 'as', 'ld'
+or starting the program as a process of its own. Works on x86-64 Linux only.
+
+The Assembly code is encoded into machine code here. Only the instructions and
+operands that 'generate_assembly' and 'intrinsics' emit are supported.
+The machine code is copied to memory mapped with 'mmap', which is then made
+executable, and 'main' is called with 'ctypes'.
+
+Calls to 'print_int', 'print_bool' and 'read_int' go to stubs after the program,
+which align the stack and call Python functions that read and print through a Channel.
+An error in them, like running out of input, can't stop the machine code,
+so it is raised when 'main' returns, and nothing is printed after it.
+
+The program runs on the stack of the calling thread, so a program that overflows
+the stack crashes the whole process, like it crashes the compiled executable.
+"""
+import ctypes
+import mmap
+import platform
+import re
+import struct
+import sys
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from compiler.channel import Channel
+
+HAS_JIT = sys.platform == 'linux' and platform.machine() == 'x86_64'
+
+registers = {
+    'rax': 0, 'rcx': 1, 'rdx': 2, 'rbx': 3, 'rsp': 4, 'rbp': 5, 'rsi': 6, 'rdi': 7,
+    'r8': 8, 'r9': 9, 'r10': 10, 'r11': 11, 'r12': 12, 'r13': 13, 'r14': 14, 'r15': 15,
+}
+byte_registers = {'al': 0, 'cl': 1, 'dl': 2, 'bl': 3}
+# The condition codes of 'jcc' and 'setcc'
+conditions = {'e': 0x4, 'ne': 0x5, 'l': 0xC, 'ge': 0xD, 'le': 0xE, 'g': 0xF}
+# The opcodes of arithmetic instructions: with an immediate (the /digit of 0x81 and 0x83),
+# with a register source, and with a memory source
+arithmetic = {
+    'addq': (0, 0x01, 0x03),
+    'subq': (5, 0x29, 0x2B),
+    'cmpq': (7, 0x39, 0x3B),
+    'xorq': (6, 0x31, 0x33),
+    'xor': (6, 0x31, 0x33),
+}
+externals = ['print_int', 'print_bool', 'read_int']
+
+@dataclass
+class Register:
+    number: int
+
+@dataclass
+class Memory:
+    base: int
+    offset: int
+
+@dataclass
+class Immediate:
+    value: int
+
+@dataclass
+class Name:
+    name: str
+
+Operand = Register | Memory | Immediate | Name
+
+memory_operand = re.compile(r'(-?\d*)\(%(\w+)\)')
+
+def parse_operand(text: str) -> Operand:
+    if text.startswith('%'):
+        name = text[1:]
+        if name in registers:
+            return Register(registers[name])
+        if name in byte_registers:
+            return Register(byte_registers[name])
+        raise Exception(f'Unsupported register: {text}')
+    if text.startswith('$'):
+        return Immediate(int(text[1:]))
+    if (match := memory_operand.fullmatch(text)) is not None:
+        if match.group(2) not in registers:
+            raise Exception(f'Unsupported register: {text}')
+        return Memory(registers[match.group(2)], int(match.group(1) or '0'))
+    return Name(text)
+
+def rex(reg: int, rm: Register | Memory) -> int:
+    "A REX prefix for 64-bit operands"
+    base = rm.number if isinstance(rm, Register) else rm.base
+    return 0x48 | (reg >> 3) << 2 | base >> 3
+
+def short_rex(base: int) -> bytes:
+    "The REX prefix of an instruction that is 64-bit without one, only needed for %r8 to %r15"
+    return b'\x41' if base >= 8 else b''
+
+def modrm(reg: int, rm: Register | Memory) -> bytes:
+    "The ModRM byte, and the SIB byte and displacement of a memory operand"
+    if isinstance(rm, Register):
+        return bytes([0xC0 | (reg & 7) << 3 | rm.number & 7])
+    # Base 5 without a displacement would mean %rip, so %rbp and %r13 always have one
+    if rm.offset == 0 and rm.base & 7 != 5:
+        mode = 0
+    else:
+        mode = 1 if -128 <= rm.offset < 128 else 2
+    encoded = bytes([mode << 6 | (reg & 7) << 3 | rm.base & 7])
+    if rm.base & 7 == 4:
+        # %rsp and %r12 as a base need a SIB byte
+        encoded += b'\x24'
+    if mode == 0:
+        return encoded
+    return encoded + struct.pack('<b' if mode == 1 else '<i', rm.offset)
+
+class Encoder:
+    "Machine code being encoded, and the jumps and calls to patch once all labels are known"
+    code: bytearray
+    labels: dict[str, int]
+    # The offsets of 32-bit relative targets, and the labels they refer to
+    patches: list[tuple[int, str]]
+
+    def __init__(self) -> None:
+        self.code = bytearray()
+        self.labels = {}
+        self.patches = []
+
+    def emit(self, *parts: bytes | int) -> None:
+        for part in parts:
+            if isinstance(part, int):
+                self.code.append(part)
+            else:
+                self.code.extend(part)
+
+    def emit_target(self, label: str) -> None:
+        self.patches.append((len(self.code), label))
+        self.code.extend(b'\0\0\0\0')
+
+    def instruction(self, line: str) -> None:
+        (op, _, rest) = line.partition(' ')
+        operands = [parse_operand(part.strip()) for part in rest.split(',')] if rest.strip() else []
+        match operands:
+            case [Immediate(value), Register() | Memory() as dst] if op == 'movq' and -2**31 <= value < 2**31:
+                self.emit(rex(0, dst), 0xC7, modrm(0, dst), struct.pack('<i', value))
+            case [Immediate(value), Register(number)] if op in ('movq', 'movabsq'):
+                self.emit(rex(0, Register(number)), 0xB8 | number & 7, struct.pack('<q', value))
+            case [Register(src), Register() | Memory() as dst] if op == 'movq':
+                self.emit(rex(src, dst), 0x89, modrm(src, dst))
+            case [Memory() as src, Register(dst)] if op == 'movq':
+                self.emit(rex(dst, src), 0x8B, modrm(dst, src))
+            case [Immediate(value), Register() | Memory() as dst] if op in arithmetic and -128 <= value < 128:
+                self.emit(rex(0, dst), 0x83, modrm(arithmetic[op][0], dst), struct.pack('<b', value))
+            case [Immediate(value), Register() | Memory() as dst] if op in arithmetic and -2**31 <= value < 2**31:
+                self.emit(rex(0, dst), 0x81, modrm(arithmetic[op][0], dst), struct.pack('<i', value))
+            case [Register(src), Register() | Memory() as dst] if op in arithmetic:
+                self.emit(rex(src, dst), arithmetic[op][1], modrm(src, dst))
+            case [Memory() as src, Register(dst)] if op in arithmetic:
+                self.emit(rex(dst, src), arithmetic[op][2], modrm(dst, src))
+            case [Register() | Memory() as src, Register(dst)] if op == 'imulq':
+                self.emit(rex(dst, src), 0x0F, 0xAF, modrm(dst, src))
+            case [Register() | Memory() as dst] if op == 'negq':
+                self.emit(rex(3, dst), 0xF7, modrm(3, dst))
+            case [Register() | Memory() as src] if op == 'idivq':
+                self.emit(rex(7, src), 0xF7, modrm(7, src))
+            case [] if op == 'cqto':
+                self.emit(0x48, 0x99)
+            case [Register(number)] if op.startswith('set') and op[3:] in conditions and number < 4:
+                self.emit(0x0F, 0x90 | conditions[op[3:]], modrm(0, Register(number)))
+            case [Register(number)] if op == 'pushq':
+                self.emit(short_rex(number), 0x50 | number & 7)
+            case [Memory() as src] if op == 'pushq':
+                self.emit(short_rex(src.base), 0xFF, modrm(6, src))
+            case [Register(number)] if op == 'popq':
+                self.emit(short_rex(number), 0x58 | number & 7)
+            case [Name(label)] if op == 'jmp':
+                self.emit(0xE9)
+                self.emit_target(label)
+            case [Name(label)] if op.startswith('j') and op[1:] in conditions:
+                self.emit(0x0F, 0x80 | conditions[op[1:]])
+                self.emit_target(label)
+            case [Name(label)] if op == 'call':
+                self.emit(0xE8)
+                self.emit_target(label)
+            case [] if op == 'ret':
+                self.emit(0xC3)
+            case _:
+                raise Exception(f'Unsupported instruction: {line}')
+
+    def stub(self, name: str, address: int) -> None:
+        "A function that aligns the stack for a C function at the address, and calls it"
+        self.labels[name] = len(self.code)
+        self.emit(
+            0x55,                               # pushq %rbp
+            0x48, 0x89, 0xE5,                   # movq %rsp, %rbp
+            0x48, 0x83, 0xE4, 0xF0,             # andq $-16, %rsp
+            0x48, 0xB8, struct.pack('<Q', address),  # movabsq $address, %rax
+            0xFF, 0xD0,                         # call *%rax
+            0x48, 0x89, 0xEC,                   # movq %rbp, %rsp
+            0x5D,                               # popq %rbp
+            0xC3,                               # ret
+        )
+
+    def patch(self) -> None:
+        for (offset, label) in self.patches:
+            if label not in self.labels:
+                raise Exception(f'Unknown label: {label}')
+            struct.pack_into('<i', self.code, offset, self.labels[label] - (offset + 4))
+
+def encode(assembly_code: str, addresses: dict[str, int]) -> Encoder:
+    """Encodes Assembly code into machine code, with a stub after it
+    for each function at the given addresses"""
+    encoder = Encoder()
+    for line in assembly_code.split('\n'):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        if line.endswith(':'):
+            if line[:-1] in encoder.labels:
+                raise Exception(f'Label {line[:-1]} is already defined')
+            encoder.labels[line[:-1]] = len(encoder.code)
+        elif line.startswith('.'):
+            # Directives like .global and .section
+            continue
+        else:
+            encoder.instruction(line)
+    for (name, address) in addresses.items():
+        encoder.stub(name, address)
+    encoder.patch()
+    return encoder
+
+def libc() -> Any:
+    lib = ctypes.CDLL(None, use_errno=True)
+    lib.mmap.restype = ctypes.c_void_p
+    lib.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    lib.mprotect.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+    lib.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    return lib
+
+PrintFunction = ctypes.CFUNCTYPE(ctypes.c_int64, ctypes.c_int64)
+ReadFunction = ctypes.CFUNCTYPE(ctypes.c_int64)
+MainFunction = ctypes.CFUNCTYPE(ctypes.c_int64)
+
+class JitProgram:
+    """The machine code of a program in executable memory. It can be run many times,
+    and its memory is freed by 'close'."""
+    labels: dict[str, int]
+    size: int
+    _libc: Any
+    _address: int | None
+    _main: Callable[[], int]
+    _shims: list[Any]
+    _channel: Channel
+    _error: BaseException | None
+
+    def __init__(self, assembly_code: str) -> None:
+        if not HAS_JIT:
+            raise Exception('The JIT runs only on x86-64 Linux')
+        self._channel = Channel()
+        self._error = None
+        # Kept here, since the machine code calls them after this function returns
+        self._shims = [PrintFunction(self._print_int), PrintFunction(self._print_bool), ReadFunction(self._read_int)]
+        addresses = {name: ctypes.cast(shim, ctypes.c_void_p).value or 0 for (name, shim) in zip(externals, self._shims)}
+        encoder = encode(assembly_code, addresses)
+        self.labels = encoder.labels
+        self.size = max(len(encoder.code), 1)
+
+        self._libc = libc()
+        address = self._libc.mmap(None, self.size, mmap.PROT_READ | mmap.PROT_WRITE,
+                                  mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS, -1, 0)
+        if address is None or address == ctypes.c_void_p(-1).value:
+            raise OSError(ctypes.get_errno(), 'Could not map memory for the JIT')
+        self._address = address
+        ctypes.memmove(address, bytes(encoder.code), len(encoder.code))
+        # Never writable and executable at the same time
+        if self._libc.mprotect(address, self.size, mmap.PROT_READ | mmap.PROT_EXEC) != 0:
+            self.close()
+            raise OSError(ctypes.get_errno(), 'Could not make the JIT code executable')
+        if 'main' not in self.labels:
+            self.close()
+            raise Exception('The program has no main function')
+        self._main = MainFunction(address + self.labels['main'])
+
+    def run(self, channel: Channel | None = None) -> int:
+        """Calls 'main', which reads and prints through the channel, by default one
+        for the standard input and output. Returns the value 'main' returns."""
+        if self._address is None:
+            raise Exception('The program is closed')
+        self._channel = channel if channel is not None else Channel()
+        self._error = None
+        try:
+            result = self._main()
+        finally:
+            self._channel.flush()
+        if self._error is not None:
+            raise self._error
+        return result
+
+    def close(self) -> None:
+        if self._address is not None:
+            self._libc.munmap(self._address, self.size)
+            self._address = None
+
+    def _print_int(self, value: int) -> int:
+        if self._error is None:
+            try:
+                self._channel.print_int(value)
+            except Exception as e:
+                self._error = e
+        return value
+
+    def _print_bool(self, value: int) -> int:
+        if self._error is None:
+            try:
+                self._channel.print_bool(value != 0)
+            except Exception as e:
+                self._error = e
+        return value
+
+    def _read_int(self) -> int:
+        if self._error is not None:
+            return 0
+        try:
+            value = self._channel.read_int()
+            if not -2**63 <= value < 2**63:
+                raise OverflowError(f'Input {value} does not fit in 64 bits')
+            return value
+        except Exception as e:
+            self._error = e
+            return 0
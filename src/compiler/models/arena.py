@@ -0,0 +1,287 @@
+from array import array
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Literal as TypeCode, TypeAlias
+
+from compiler.models.expressions import *
+from compiler.models.tokens import END, FALSE, INT_LITERAL, Kinds, KindTexts, TRUE
+from compiler.models.types import *
+
+# Node kinds
+NODE_MODULE = 0
+NODE_BLOCK = 1
+NODE_LITERAL = 2
+NODE_IDENTIFIER = 3
+NODE_BINARY_OP = 4
+NODE_UNARY_OP = 5
+NODE_IF = 6
+NODE_WHILE = 7
+NODE_FUNCTION = 8
+NODE_FUNCTION_DECLARATION = 9
+NODE_VARIABLE_DECLARATION = 10
+NODE_RETURN = 11
+
+# Type ids are indices to this list
+Types: list[BasicType] = [Unit, Int, Bool, FunType]
+type_ids: dict[str, int] = {t.name: i for (i, t) in enumerate(Types)}
+
+Column: TypeAlias = 'array[int] | memoryview[int]'
+
+class Arena:
+    """An AST stored column-wise, one entry per node in breadth-first order, the root being node 0.
+    - kinds: the node kind, one of the NODE_ constants
+    - ops: the token kind of the operator of BinaryOp and UnaryOp nodes, and for
+      literals INT_LITERAL, TRUE, FALSE or END for None
+    - values: the value of int literals, or the index in 'strings' of the name of
+      identifiers, function calls and declarations
+    - types: the type id of the node, an index to 'Types'
+    - first_child: because of the breadth-first order, the children of node i
+      are the nodes from first_child[i] to first_child[i + 1] - 1.
+    The columns are arrays, or memoryviews when attached to shared memory."""
+    kinds: Column
+    ops: Column
+    values: Column
+    types: Column
+    first_child: Column
+    strings: list[str]
+
+    def __init__(
+        self,
+        kinds: 'Column | None' = None,
+        ops: 'Column | None' = None,
+        values: 'Column | None' = None,
+        types: 'Column | None' = None,
+        first_child: 'Column | None' = None,
+        strings: list[str] | None = None,
+    ) -> None:
+        self.kinds = kinds if kinds is not None else array('B')
+        self.ops = ops if ops is not None else array('B')
+        self.values = values if values is not None else array('q')
+        self.types = types if types is not None else array('B')
+        self.first_child = first_child if first_child is not None else array('I', [1])
+        self.strings = strings if strings is not None else []
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # Memoryviews can't be pickled, so columns in shared memory are copied to arrays
+        columns = [copy_column(c, t) for (c, t) in self.columns()]
+        return (Arena, (*columns, self.strings))
+
+    def columns(self) -> list[tuple[Column, str]]:
+        "The columns with their array type codes, in the order of the constructor parameters"
+        return [(self.kinds, 'B'), (self.ops, 'B'), (self.values, 'q'), (self.types, 'B'), (self.first_child, 'I')]
+
+    def columns_by_size(self) -> list[tuple[Column, str]]:
+        "The columns in the order they are stored in shared memory"
+        return [(self.values, 'q'), (self.first_child, 'I'), (self.kinds, 'B'), (self.ops, 'B'), (self.types, 'B')]
+
+    def children(self, i: int) -> range:
+        return range(self.first_child[i], self.first_child[i + 1])
+
+    def name(self, i: int) -> str:
+        return self.strings[self.values[i]]
+
+    def op(self, i: int) -> str:
+        return KindTexts[self.ops[i]]
+
+    def literal(self, i: int) -> int | bool | None:
+        "The value of a literal"
+        op = self.ops[i]
+        return None if op == END else True if op == TRUE else False if op == FALSE else self.values[i]
+
+    def type(self, i: int) -> Type:
+        return Types[self.types[i]]
+
+    def set_type(self, i: int, t: Type) -> None:
+        self.types[i] = type_ids[str(t)]
+
+def copy_column(column: Column, typecode: str) -> 'array[int]':
+    if isinstance(column, array):
+        return column
+    copy = array(typecode)
+    copy.frombytes(column.cast('B'))
+    return copy
+
+def to_arena(root: Expression) -> Arena:
+    "Converts an object AST to an arena, without recursion"
+    kinds = array('B')
+    ops = array('B')
+    values = array('q')
+    types = array('B')
+    first_child = array('I', [1])
+    strings: list[str] = []
+    string_ids: dict[str, int] = {}
+
+    def string_id(s: str) -> int:
+        id = string_ids.get(s)
+        if id is None:
+            id = string_ids[s] = len(strings)
+            strings.append(s)
+        return id
+
+    nodes: list[Expression] = [root]
+    i = 0
+    while i < len(nodes):
+        node = nodes[i]
+        i += 1
+        op = 0
+        value = 0
+        match node:
+            case Module():
+                kind = NODE_MODULE
+            case Block():
+                kind = NODE_BLOCK
+            case Literal():
+                kind = NODE_LITERAL
+                if node.value is None:
+                    op = END
+                elif isinstance(node.value, bool):
+                    op = TRUE if node.value else FALSE
+                else:
+                    op = INT_LITERAL
+                    value = node.value
+            case Identifier():
+                kind = NODE_IDENTIFIER
+                value = string_id(node.name)
+            case BinaryOp():
+                kind = NODE_BINARY_OP
+                op = Kinds[node.op]
+            case UnaryOp():
+                kind = NODE_UNARY_OP
+                op = Kinds[node.op]
+            case IfExpression():
+                kind = NODE_IF
+            case WhileExpression():
+                kind = NODE_WHILE
+            case Function():
+                kind = NODE_FUNCTION
+                value = string_id(node.name)
+            case FunctionDeclaration():
+                kind = NODE_FUNCTION_DECLARATION
+                value = string_id(node.name)
+            case VariableDeclaration():
+                kind = NODE_VARIABLE_DECLARATION
+                value = string_id(node.name)
+            case ReturnExpression():
+                kind = NODE_RETURN
+            case _:
+                raise Exception(f'Unsupported AST node: {node}')
+        nodes.extend(child_nodes(node))
+        kinds.append(kind)
+        ops.append(op)
+        values.append(value)
+        types.append(type_ids[str(node.type)])
+        first_child.append(len(nodes))
+    return Arena(kinds, ops, values, types, first_child, strings)
+
+def child_nodes(node: Expression) -> list[Expression]:
+    "The children of an object AST node, in the order they have in an arena"
+    match node:
+        case Module() | Block():
+            return node.sequence
+        case BinaryOp():
+            return [node.left, node.right]
+        case UnaryOp():
+            return [node.right]
+        case IfExpression():
+            return [node.cond, node.then_clause] + ([node.else_clause] if node.else_clause is not None else [])
+        case WhileExpression():
+            return [node.cond, node.body]
+        case Function():
+            return node.args
+        case FunctionDeclaration():
+            return [*node.args, node.body]
+        case VariableDeclaration():
+            return [node.initializer]
+        case ReturnExpression():
+            return [node.value]
+        case _:
+            return []
+
+def from_arena(arena: Arena, root: int = 0) -> Expression:
+    """Converts an arena, or the subtree of one node in it, back to an object AST.
+    Children come after their parents, so the nodes are built from the last one to the first."""
+    built: list[Any] = [None] * len(arena)
+    first_child = arena.first_child
+    for i in reversed(range(root, len(arena))):
+        children = built[first_child[i]:first_child[i + 1]]
+        t = arena.type(i)
+        kind = arena.kinds[i]
+        node: Expression
+        if kind == NODE_MODULE:
+            node = Module(children, type=t)
+        elif kind == NODE_BLOCK:
+            node = Block(children, type=t)
+        elif kind == NODE_LITERAL:
+            node = Literal(arena.literal(i), type=t)
+        elif kind == NODE_IDENTIFIER:
+            node = Identifier(arena.name(i), type=t)
+        elif kind == NODE_BINARY_OP:
+            node = BinaryOp(children[0], arena.op(i), children[1], type=t)
+        elif kind == NODE_UNARY_OP:
+            node = UnaryOp(arena.op(i), children[0], type=t)
+        elif kind == NODE_IF:
+            node = IfExpression(children[0], children[1], children[2] if len(children) > 2 else None, type=t)
+        elif kind == NODE_WHILE:
+            node = WhileExpression(children[0], children[1], type=t)
+        elif kind == NODE_FUNCTION:
+            node = Function(arena.name(i), children, type=t)
+        elif kind == NODE_FUNCTION_DECLARATION:
+            node = FunctionDeclaration(arena.name(i), children[:-1], children[-1], type=t)
+        elif kind == NODE_VARIABLE_DECLARATION:
+            node = VariableDeclaration(arena.name(i), children[0], type=t)
+        elif kind == NODE_RETURN:
+            node = ReturnExpression(children[0], type=t)
+        else:
+            raise Exception(f'Unknown node kind: {kind}')
+        built[i] = node
+        # Children are not needed anymore
+        for c in range(first_child[i], first_child[i + 1]):
+            built[c] = None
+    return built[root]
+
+def share_arena(arena: Arena) -> SharedMemory:
+    """Copies an arena to a new block of shared memory, which other processes can attach
+    to by its name with 'attach_arena'. The caller must close and unlink the block."""
+    names = '\0'.join(arena.strings).encode()
+    header = array('Q', [len(arena), len(arena.strings), len(names)])
+    # The 8-byte columns come first, so that every column is aligned
+    parts = [header] + [copy_column(c, t) for (c, t) in arena.columns_by_size()]
+    size = sum(len(part) * part.itemsize for part in parts) + len(names)
+    memory = SharedMemory(create=True, size=size)
+    buffer = shared_buffer(memory)
+    offset = 0
+    for data in [part.tobytes() for part in parts] + [names]:
+        buffer[offset:offset + len(data)] = data
+        offset += len(data)
+    return memory
+
+def attach_arena(memory: SharedMemory) -> Arena:
+    """Returns an arena whose columns are views to shared memory created by 'share_arena',
+    without copying them. Only the strings are copied. The arena must be dropped
+    before the shared memory is closed."""
+    buffer = shared_buffer(memory)
+    count, string_count, names_size = buffer[:24].cast('Q')
+    offset = 24
+
+    def view(typecode: TypeCode['B', 'I', 'q'], length: int) -> 'memoryview[int]':
+        nonlocal offset
+        size = length * array(typecode).itemsize
+        column = buffer[offset:offset + size].cast(typecode)
+        offset += size
+        return column
+
+    values = view('q', count)
+    first_child = view('I', count + 1)
+    kinds = view('B', count)
+    ops = view('B', count)
+    types = view('B', count)
+    names = bytes(buffer[offset:offset + names_size]).decode()
+    strings = names.split('\0') if string_count > 0 else []
+    return Arena(kinds, ops, values, types, first_child, strings)
+
+def shared_buffer(memory: SharedMemory) -> memoryview:
+    if memory.buf is None:
+        raise Exception(f'Shared memory {memory.name} is closed')
+    return memory.buf
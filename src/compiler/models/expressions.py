@@ -1,39 +1,51 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
+from hashlib import blake2b
 from compiler.models.types import Type, Unit
 
-@dataclass
+@dataclass(slots=True)
 class Expression:
     "base class"
     type: Type = field(kw_only=True, default=Unit)
+    _structural_hash: int | None = field(kw_only=True, default=None, init=False, repr=False, compare=False)
 
     def ends_with_block(self) -> bool:
         return False
+
+    def structural_hash(self) -> int:
+        """Returns a 128-bit hash of the subtree that is the same in every run and process.
+        It depends on the node classes, names, operators, values and declared types,
+        but not on types inferred by the type checker. It is computed only once,
+        so the subtree must not be changed afterwards."""
+        if self._structural_hash is None:
+            compute_structural_hashes(self)
+        assert self._structural_hash is not None
+        return self._structural_hash
     
     def get_name(self) -> str:
         return ""
     
-@dataclass
+@dataclass(slots=True)
 class TypeExpression(Expression):
     "TODO: separate from generic base class"
     
     def get_name(self) -> str:
         return ""
 
-@dataclass
+@dataclass(slots=True)
 class Identifier(Expression):
     name: str
 
     def get_name(self) -> str:
         return self.name
 
-@dataclass
+@dataclass(slots=True)
 class Literal(Expression):
     value: int | bool | None
     
     def get_name(self) -> str:
         raise Exception("Expression doesn't have name parameter")
 
-@dataclass
+@dataclass(slots=True)
 class BinaryOp(Expression):
     left: Expression
     op: str
@@ -45,7 +57,7 @@ class BinaryOp(Expression):
     def get_name(self) -> str:
         raise Exception("Expression doesn't have name parameter")
 
-@dataclass
+@dataclass(slots=True)
 class UnaryOp(Expression):
     op: str
     right: Expression
@@ -56,7 +68,7 @@ class UnaryOp(Expression):
     def get_name(self) -> str:
         raise Exception("Expression doesn't have name parameter")
 
-@dataclass
+@dataclass(slots=True)
 class IfExpression(Expression):
     cond: Expression
     then_clause: Expression
@@ -68,7 +80,7 @@ class IfExpression(Expression):
     def get_name(self) -> str:
         raise Exception("Expression doesn't have name parameter")
 
-@dataclass
+@dataclass(slots=True)
 class Function(Expression):
     name: str
     args: list[Expression]
@@ -76,7 +88,7 @@ class Function(Expression):
     def get_name(self) -> str:
         return self.name
     
-@dataclass
+@dataclass(slots=True)
 class FunctionDeclaration(Expression):
     name: str
     args: list[Expression]
@@ -88,7 +100,7 @@ class FunctionDeclaration(Expression):
     def get_name(self) -> str:
         return self.name
 
-@dataclass
+@dataclass(slots=True)
 class Block(Expression):
     sequence: list[Expression]
 
@@ -98,7 +110,7 @@ class Block(Expression):
     def get_name(self) -> str:
         raise Exception("Expression doesn't have name parameter")
     
-@dataclass
+@dataclass(slots=True)
 class WhileExpression(Expression):
     cond: Expression
     body: Expression
@@ -109,7 +121,7 @@ class WhileExpression(Expression):
     def get_name(self) -> str:
         raise Exception("Expression doesn't have name parameter")
     
-@dataclass
+@dataclass(slots=True)
 class VariableDeclaration(Expression):
     name: str
     initializer: Expression
@@ -117,7 +129,7 @@ class VariableDeclaration(Expression):
     def get_name(self) -> str:
         return self.name
 
-@dataclass
+@dataclass(slots=True)
 class Module(Expression):
     "This will allow recoursion function calls, which are restricted in Block"
 
@@ -126,9 +138,44 @@ class Module(Expression):
     def get_name(self) -> str:
         raise Exception("Expression doesn't have name parameter")
     
-@dataclass
+@dataclass(slots=True)
 class ReturnExpression(Expression):
     value: Expression
     
     def get_name(self) -> str:
-        raise Exception("Expression doesn't have name parameter")
\ No newline at end of file
+        raise Exception("Expression doesn't have name parameter")
+
+
+def compute_structural_hashes(root: Expression) -> None:
+    "Hashes the nodes of a subtree children first, without recursion"
+    stack = [root]
+    while stack:
+        node = stack[-1]
+        if node._structural_hash is not None:
+            stack.pop()
+            continue
+        values = [getattr(node, f.name) for f in fields(node) if f.name != 'type' and f.name != '_structural_hash']
+        children = [c for v in values for c in (v if isinstance(v, list) else [v]) if isinstance(c, Expression)]
+        unhashed = [c for c in children if c._structural_hash is None]
+        if unhashed:
+            stack.extend(unhashed)
+            continue
+        stack.pop()
+
+        parts = [type(node).__name__]
+        for value in values:
+            if isinstance(value, list):
+                parts.append(f'list {len(value)}')
+                parts.extend(f'{child._structural_hash:032x}' for child in value)
+            elif isinstance(value, Expression):
+                parts.append(f'{value._structural_hash:032x}')
+            else:
+                parts.append(f'{type(value).__name__} {value!r}')
+        # Other types are inferred from the content, but these are declared
+        if isinstance(node, (FunctionDeclaration, VariableDeclaration)):
+            parts.append(str(node.type))
+        if isinstance(node, FunctionDeclaration):
+            parts.extend(str(arg.type) for arg in node.args)
+        # Names and values can't contain newlines
+        digest = blake2b('\n'.join(parts).encode(), digest_size=16).digest()
+        node._structural_hash = int.from_bytes(digest, 'little')
@@ -1,7 +1,8 @@
-
-from dataclasses import dataclass
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, field
 import re
-from typing import Literal, Tuple
+from typing import Callable, Iterator, Literal, Tuple
 
 TokenType = Literal["int_literal", "identifier", "operator", "punctuation", "end"]
 
@@ -12,7 +13,194 @@ Regexes: list[Tuple[TokenType, re.Pattern[str]]] = [
     ("punctuation", re.compile(r'[(){},;:]'))
 ]
 
+# One alternation of all token patterns, tried in the same order as 'Regexes'.
+# Whitespace and comments before a token are consumed by the same match,
+# a character that starts no token ends up in the 'error' group,
+# and trailing whitespace produces a last empty match without a group.
+TokenRegex: re.Pattern[str] = re.compile(
+    r'(?:\s+|#.*|//.*)*(?:'
+    + '|'.join([f'(?P<{type}>{pattern.pattern})' for (type, pattern) in Regexes])
+    + r'|(?P<error>.)|\Z)'
+)
+
+# Small integer kind codes of tokens, so that the parser compares ints instead of strings.
+# Keywords are still tokens of type "identifier", but they get a kind of their own.
+END = 0
+INT_LITERAL = 1
+IDENTIFIER = 2
+
+VAR = 3
+FUN = 4
+IF = 5
+THEN = 6
+ELSE = 7
+WHILE = 8
+DO = 9
+RETURN = 10
+AND = 11
+OR = 12
+NOT = 13
+TRUE = 14
+FALSE = 15
+
+PLUS = 16
+MINUS = 17
+STAR = 18
+SLASH = 19
+PERCENT = 20
+EQUAL = 21
+NOT_EQUAL = 22
+LESS = 23
+GREATER = 24
+LESS_EQUAL = 25
+GREATER_EQUAL = 26
+ASSIGN = 27
+
+LEFT_PAREN = 28
+RIGHT_PAREN = 29
+LEFT_BRACE = 30
+RIGHT_BRACE = 31
+COMMA = 32
+SEMICOLON = 33
+COLON = 34
+
+Keywords: dict[str, int] = {
+    'var': VAR,
+    'fun': FUN,
+    'if': IF,
+    'then': THEN,
+    'else': ELSE,
+    'while': WHILE,
+    'do': DO,
+    'return': RETURN,
+    'and': AND,
+    'or': OR,
+    'not': NOT,
+    'true': TRUE,
+    'false': FALSE,
+}
+
+Operators: dict[str, int] = {
+    '+': PLUS,
+    '-': MINUS,
+    '*': STAR,
+    '/': SLASH,
+    '%': PERCENT,
+    '==': EQUAL,
+    '!=': NOT_EQUAL,
+    '<': LESS,
+    '>': GREATER,
+    '<=': LESS_EQUAL,
+    '>=': GREATER_EQUAL,
+    '=': ASSIGN,
+}
+
+Punctuation: dict[str, int] = {
+    '(': LEFT_PAREN,
+    ')': RIGHT_PAREN,
+    '{': LEFT_BRACE,
+    '}': RIGHT_BRACE,
+    ',': COMMA,
+    ';': SEMICOLON,
+    ':': COLON,
+}
+
+# Kinds of every token with a fixed text
+Kinds: dict[str, int] = {**Keywords, **Operators, **Punctuation}
+KindTexts: dict[int, str] = {kind: text for (text, kind) in Kinds.items()}
+
+def kind_of(type: TokenType, text: str) -> int:
+    match type:
+        case "int_literal": return INT_LITERAL
+        case "identifier": return Keywords.get(text, IDENTIFIER)
+        case "end": return END
+        case _: return Kinds[text]
+
 @dataclass(frozen=True)
 class Token:
     type: TokenType
-    text: str
\ No newline at end of file
+    text: str
+    kind: int = field(default=-1, compare=False)
+
+    def __post_init__(self) -> None:
+        if self.kind == -1:
+            object.__setattr__(self, 'kind', kind_of(self.type, self.text))
+
+# Token type of each kind, indexed by kind
+KindTypes: list[TokenType] = ["end", "int_literal", "identifier"]
+KindTypes.extend("identifier" for _ in Keywords)
+KindTypes.extend("operator" for _ in Operators)
+KindTypes.extend("punctuation" for _ in Punctuation)
+
+@dataclass(frozen=True)
+class SourceLocation:
+    line: int
+    column: int
+
+    def __str__(self) -> str:
+        return f'line {self.line}, column {self.column}'
+
+class TokenBuffer:
+    """Tokens stored column-wise: the kind of every token and its start and end
+    offsets in the source code. Token texts are sliced from the source on demand."""
+    source: str
+    kinds: 'array[int]'
+    starts: 'array[int]'
+    ends: 'array[int]'
+    _line_starts: 'array[int] | None'
+    # The ranges of the top-level function declarations, kept by 'function_declarations'
+    _declarations: list[tuple[int, int]] | None
+
+    def __init__(
+        self,
+        source: str,
+        kinds: 'array[int] | None' = None,
+        starts: 'array[int] | None' = None,
+        ends: 'array[int] | None' = None,
+    ) -> None:
+        self.source = source
+        self.kinds = kinds if kinds is not None else array('B')
+        self.starts = starts if starts is not None else array('I')
+        self.ends = ends if ends is not None else array('I')
+        self._line_starts = None
+        self._declarations = None
+
+    def append(self, kind: int, start: int, end: int) -> None:
+        self._declarations = None
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, i: int) -> Token:
+        kind = self.kinds[i]
+        return Token(KindTypes[kind], self.source[self.starts[i]:self.ends[i]], kind)
+
+    def __iter__(self) -> Iterator[Token]:
+        for i in range(len(self.kinds)):
+            yield self[i]
+
+    def slice(self, start: int, end: int) -> 'TokenBuffer':
+        """Returns the tokens from 'start' to 'end' as a new buffer over the same source."""
+        return TokenBuffer(self.source, self.kinds[start:end], self.starts[start:end], self.ends[start:end])
+
+    def function_declarations(self, find: Callable[['TokenBuffer'], list[tuple[int, int]]]) -> list[tuple[int, int]]:
+        """Returns the token ranges of the top-level function declarations, found by 'find'.
+        They are kept until a token is appended, so that only the first call scans the tokens."""
+        if self._declarations is None:
+            self._declarations = find(self)
+        return self._declarations
+
+    def text(self, i: int) -> str:
+        return self.source[self.starts[i]:self.ends[i]]
+
+    def location(self, i: int) -> SourceLocation:
+        """Returns the line and column (both starting from 1) where the i-th token starts."""
+        if self._line_starts is None:
+            self._line_starts = array('I', [0])
+            self._line_starts.extend(m.end() for m in re.finditer('\n', self.source))
+        offset = self.starts[i] if i < len(self.starts) else len(self.source)
+        line = bisect_right(self._line_starts, offset)
+        return SourceLocation(line, offset - self._line_starts[line - 1] + 1)
@@ -18,6 +18,10 @@ class BasicType(Type):
     def __str__(self) -> str:
         return self.name
 
+    def __reduce__(self) -> tuple[typing.Any, ...]:
+        # Unpickles to the shared instances below, which are compared by identity in places
+        return (string_to_type, (self.name,))
+
 Int = BasicType('Int')
 Bool = BasicType('Bool')
 Unit = BasicType('Unit')
@@ -1,27 +1,252 @@
+import atexit
+from concurrent.futures import Executor, ProcessPoolExecutor
+import os
+import pickle
+import re
+import sys
+import threading
+from typing import Any, Callable, Generator, Iterable, TypeVar
+
+from compiler.collector import paused_collector
 from compiler.models.expressions import *
-from compiler.models.tokens import Token
+from compiler.models.tokens import (
+    AND, ASSIGN, COLON, COMMA, DO, ELSE, END, EQUAL, FALSE, FUN, GREATER, GREATER_EQUAL, IDENTIFIER, IF,
+    INT_LITERAL, LEFT_BRACE, LEFT_PAREN, LESS, LESS_EQUAL, MINUS, NOT, NOT_EQUAL, OR, PERCENT, PLUS,
+    RETURN, RIGHT_BRACE, RIGHT_PAREN, SEMICOLON, SLASH, STAR, THEN, TRUE, VAR, WHILE,
+    KindTexts, KindTypes, SourceLocation, Token, TokenBuffer
+)
 from compiler.models.types import *
+from compiler.tokenizer import tokenize_buffer
 
-def parse(tokens: list[Token]) -> Module:
-    pos = 0
+T = TypeVar('T')
+
+# A parsing step. Instead of calling each other recursively, steps yield the nested steps
+# they need and are sent their results back by 'run', which keeps the steps on a list.
+Parsing = Generator[Any, Any, T]
+
+# Precedences of the binary operators, from loosest to tightest.
+# Operators looser than comparisons take a whole expression as their right operand,
+# comparisons may also take a block.
+LOGICAL, ASSIGNMENT, COMPARISON, ADDITIVE, MULTIPLICATIVE = 1, 2, 3, 4, 5
 
-    def peek() -> Token:
-        if pos < len(tokens):
-            return tokens[pos]
+binary_precedences: dict[int, int] = {
+    OR: LOGICAL, AND: LOGICAL,
+    ASSIGN: ASSIGNMENT,
+    LESS: COMPARISON, GREATER: COMPARISON, EQUAL: COMPARISON, NOT_EQUAL: COMPARISON,
+    LESS_EQUAL: COMPARISON, GREATER_EQUAL: COMPARISON, PERCENT: COMPARISON,
+    PLUS: ADDITIVE, MINUS: ADDITIVE,
+    STAR: MULTIPLICATIVE, SLASH: MULTIPLICATIVE,
+}
+
+# Matches the kinds that delimit function declarations in the bytes of 'TokenBuffer.kinds'
+declaration_kinds_regex = re.compile(b'[' + re.escape(bytes([FUN, LEFT_BRACE, RIGHT_BRACE])) + b']')
+
+def find_function_declarations(tokens: TokenBuffer) -> list[tuple[int, int]]:
+    """Returns the token ranges of the top-level function declarations.
+    They are found by matching braces only, without parsing the declarations.
+    Like in 'parse', declarations are looked for only at the start of the code.
+    The ranges are kept in the buffer, so that only the first call for a buffer scans its tokens."""
+    return tokens.function_declarations(scan_function_declarations)
+
+def scan_function_declarations(tokens: TokenBuffer) -> list[tuple[int, int]]:
+    kinds = tokens.kinds.tobytes()
+    declarations: list[tuple[int, int]] = []
+    start = 0
+    depth = 0
+    in_header = False
+    for match in declaration_kinds_regex.finditer(kinds):
+        i = match.start()
+        kind = kinds[i]
+        if depth > 0:
+            if kind == LEFT_BRACE:
+                depth += 1
+            elif kind == RIGHT_BRACE:
+                depth -= 1
+                if depth == 0:
+                    declarations.append((start, i + 1))
+                    start = i + 1
+                    in_header = False
+        elif not in_header and kind == FUN and i == start:
+            in_header = True
+        elif in_header and kind == LEFT_BRACE:
+            depth = 1
         else:
-            return Token(type='end', text='')
-        
-    def consume(expected: str | list[str] | None = None) -> Token:
-        token = peek()
-        if isinstance(expected, str) and token.text != expected:
-            raise Exception(f'Expected "{expected}", got "{token.text}"')
-        if isinstance(expected, list) and token.text not in expected:
-            comma_separated = ", ".join([f'"{e}"' for e in expected])
-            raise Exception(f'Parsing fails: expected one of: {comma_separated}')
-        nonlocal pos
-        pos += 1
-        return token
-    
+            break
+    return declarations
+
+# The worker pools of 'parse_parallel' by their sizes, started on first use and kept for later calls
+parse_pools: dict[int, ProcessPoolExecutor] = {}
+parse_pools_lock = threading.Lock()
+
+def parse_pool(workers: int) -> ProcessPoolExecutor:
+    with parse_pools_lock:
+        if workers not in parse_pools:
+            parse_pools[workers] = ProcessPoolExecutor(workers)
+        return parse_pools[workers]
+
+@atexit.register
+def close_parse_pools() -> None:
+    "Shuts down the worker pools of 'parse_parallel'. Later calls start new ones."
+    with parse_pools_lock:
+        pools = list(parse_pools.values())
+        parse_pools.clear()
+    for pool in pools:
+        pool.shutdown(cancel_futures=True)
+
+def parse_parallel(tokens: TokenBuffer, workers: int | None = None, min_declarations: int = 64,
+                   executor: Executor | None = None) -> Module:
+    """Parses the top-level function declarations in worker processes and the main code
+    in this one, and merges the results in source order. The result is the same as from 'parse'.
+    Batches of declarations are sent to the workers as source code, and if any batch
+    does not parse into exactly its declarations, the whole module is parsed serially
+    so that errors are reported like 'parse' does.
+    The workers are those of the executor, or else of a pool of this module that is kept
+    for the next calls, so that only the first call pays for starting them."""
+    declarations = find_function_declarations(tokens)
+    workers = workers or os.cpu_count() or 1
+    if workers < 2 or len(declarations) < min_declarations:
+        return parse(tokens)
+
+    # A few batches per worker balance the load without sending every declaration separately
+    batch_count = min(workers * 4, len(declarations))
+    bounds = [len(declarations) * i // batch_count for i in range(batch_count + 1)]
+    batches = [
+        tokens.source[tokens.starts[declarations[first][0]]:tokens.ends[declarations[last - 1][1] - 1]]
+        for (first, last) in zip(bounds, bounds[1:])
+    ]
+
+    if executor is None:
+        executor = parse_pool(workers)
+    results = executor.map(parse_pickled_declarations, batches)
+    main_start = declarations[-1][1]
+    main: Expression | None = Literal(None)
+    if main_start < len(tokens):
+        try:
+            module = parse(tokens.slice(main_start, len(tokens)))
+            main = module.sequence[0] if len(module.sequence) == 1 else None
+        except Exception:
+            main = None
+    sequence: list[Expression] = []
+    for (first, last), pickled in zip(zip(bounds, bounds[1:]), results):
+        if pickled is None:
+            return parse(tokens)
+        batch = unpickle(pickled)
+        if len(batch) != last - first:
+            return parse(tokens)
+        sequence.extend(batch)
+
+    if main is None:
+        return parse(tokens)
+    return Module([main] + sequence)
+
+def parse_declarations(source_code: str) -> list[FunctionDeclaration] | None:
+    "Parses source code of function declarations only, or returns None if it is something else"
+    try:
+        module = parse(tokenize_buffer(source_code))
+    except Exception:
+        return None
+    if module.sequence[0] != Literal(None):
+        return None
+    declarations = [d for d in module.sequence[1:] if isinstance(d, FunctionDeclaration)]
+    return declarations if len(declarations) == len(module.sequence) - 1 else None
+
+def parse_pickled_declarations(source_code: str) -> bytes | None:
+    declarations = parse_declarations(source_code)
+    if declarations is None:
+        return None
+    # Like the parser, pickling creates no cycles, and pausing the collector makes it several times faster
+    with paused_collector():
+        return pickle.dumps(declarations, pickle.HIGHEST_PROTOCOL)
+
+def unpickle(data: bytes) -> Any:
+    with paused_collector():
+        return pickle.loads(data)
+
+def parse(tokens: TokenBuffer | Iterable[Token], locations: dict[int, SourceLocation] | None = None) -> Module:
+    """Parses a TokenBuffer, a list of tokens or a token stream, e.g. from 'iter_tokens'.
+    A TokenBuffer is walked by index, other tokens are pulled one at a time.
+    Nesting depth is limited only by memory, not by the recursion limit.
+    With a TokenBuffer, the locations of the loops are put in 'locations', by the ids of their nodes."""
+    pos = 0
+    end = Token(type='end', text='')
+
+    if isinstance(tokens, TokenBuffer):
+        buffer = tokens
+        kinds = buffer.kinds
+        starts = buffer.starts
+        ends = buffer.ends
+        source = buffer.source
+        count = len(kinds)
+
+        def peek_kind() -> int:
+            return kinds[pos] if pos < count else END
+
+        def peek_text() -> str:
+            return source[starts[pos]:ends[pos]] if pos < count else ''
+
+        def advance() -> None:
+            nonlocal pos
+            pos += 1
+
+        def location() -> str:
+            return f' at {buffer.location(pos)}'
+
+        def locate(node: Expression, start: int) -> None:
+            if locations is not None:
+                locations[id(node)] = buffer.location(start)
+    else:
+        stream = iter(tokens)
+        current = next(stream, end)
+
+        def peek_kind() -> int:
+            return current.kind
+
+        def peek_text() -> str:
+            return current.text
+
+        def advance() -> None:
+            nonlocal pos, current
+            pos += 1
+            current = next(stream, end)
+
+        def location() -> str:
+            return ''
+
+        def locate(node: Expression, start: int) -> None:
+            pass
+
+    def expect(kind: int) -> None:
+        if peek_kind() != kind:
+            raise Exception(f'Expected "{KindTexts[kind]}", got "{peek_text()}"{location()}')
+        advance()
+
+    def consume() -> str:
+        if peek_kind() == END:
+            raise Exception('Unexpected end of input')
+        text = peek_text()
+        advance()
+        return text
+
+    # Only the name strings are interned. Leaf nodes are not: every occurrence gets a node of its own,
+    # since passes keep what they know about nodes in tables keyed by the ids of the nodes
+    def consume_name() -> str:
+        return sys.intern(consume())
+
+    def run(parsing: Parsing[T]) -> T:
+        stack: list[Parsing[Any]] = [parsing]
+        value: Any = None
+        while True:
+            try:
+                nested = stack[-1].send(value)
+            except StopIteration as result:
+                stack.pop()
+                if not stack:
+                    return result.value # type: ignore[no-any-return]
+                value = result.value
+            else:
+                stack.append(nested)
+                value = None
+
     def many_to_one(exps: list[Expression]) -> Expression:
         if len(exps) == 1:
             return exps[0]
@@ -29,31 +254,31 @@ def parse(tokens: list[Token]) -> Module:
             return Block(exps)
         
     # TODO: reduce copy-paste
-    def parse_code() -> Module:
+    def parse_code() -> Parsing[Module]:
         sequence: list[Expression] = []
-        if peek().type == 'end':
+        if peek_kind() == END:
             raise Exception('No code to parse')
-        while peek().text == 'fun':
-            sequence.append(parse_function())
-        ret = parse_expressions()
-        if pos != len(tokens):
-            raise Exception(f'Not all tokens were parsed. Was {len(tokens)}, parsed {pos}')
+        while peek_kind() == FUN:
+            sequence.append((yield parse_function()))
+        ret = yield parse_expressions()
+        if peek_kind() != END:
+            raise Exception(f'Not all tokens were parsed. Unexpected "{peek_text()}" after {pos} tokens{location()}')
         main = [many_to_one(ret)]
         return Module(main + sequence)
     
-    def parse_expressions() -> list[Expression]:
+    def parse_expressions() -> Parsing[list[Expression]]:
         ret: list[Expression] = []
         result: Expression = Literal(None)
 
-        while peek().type != 'end' and peek().text != '}':
-            if peek().text == 'var':
-                exp = parse_variable_declaration()
+        while peek_kind() != END and peek_kind() != RIGHT_BRACE:
+            if peek_kind() == VAR:
+                exp = yield parse_variable_declaration()
             else:
-                exp = parse_expression()
+                exp = yield parse_expression()
                 
-            if peek().type != 'end' and peek().text != '}':
-                if not exp.ends_with_block() or peek().text == ';':
-                    consume(';')
+            if peek_kind() != END and peek_kind() != RIGHT_BRACE:
+                if not exp.ends_with_block() or peek_kind() == SEMICOLON:
+                    expect(SEMICOLON)
                 ret.append(exp)
             else:
                 result = exp
@@ -64,193 +289,204 @@ def parse(tokens: list[Token]) -> Module:
         ret.append(result)
         return ret
     
-    def parse_block() -> Expression:
-        consume('{')
-        expressions = parse_expressions()
+    def parse_block() -> Parsing[Expression]:
+        expect(LEFT_BRACE)
+        expressions = yield parse_expressions()
         block = Block(expressions)
-        consume('}')
+        expect(RIGHT_BRACE)
         return block
 
-    def parse_expression() -> Expression:
-        if peek().text == '{':
-            left = parse_block()
+    def parse_expression() -> Parsing[Expression]:
+        """Precedence climbing over 'binary_precedences' with explicit operand and operator stacks.
+        Blocks are operands only at the start and after comparisons, and nothing but
+        comparisons and logical operators may follow them."""
+        if peek_kind() == LEFT_BRACE:
+            operand = yield parse_block()
+            block_operand = True
         else:
-            left = parse_polynomial()
-        
-        if peek().text == '=':
-            consume('=')
-            op = '='
-            right = parse_expression()
-            return BinaryOp(left, op, right)
-        
-        while peek().text in ['<', '>', '==', '>=', '<=', '!=', '%']:
-            op_token = consume() # TODO: parse_token()
-            if peek().text == '{':
-                right = parse_block()
+            operand = parse_factor()
+            if not isinstance(operand, Expression):
+                operand = yield operand
+            block_operand = False
+        operands: list[Expression] = [operand]
+        operators: list[int] = []
+        compared = False
+
+        while True:
+            kind = peek_kind()
+            precedence = binary_precedences.get(kind, 0)
+            if precedence < COMPARISON:
+                break
+            if precedence == COMPARISON:
+                compared = True
+            elif block_operand:
+                break
+            while operators and binary_precedences[operators[-1]] >= precedence:
+                right = operands.pop()
+                operands[-1] = BinaryOp(operands[-1], KindTexts[operators.pop()], right)
+            operators.append(kind)
+            advance()
+
+            if precedence == COMPARISON and peek_kind() == LEFT_BRACE:
+                operand = yield parse_block()
+                block_operand = True
             else:
-                right = parse_polynomial()
-            left = BinaryOp(left, op_token.text, right)
-        while peek().text in ['or', 'and']:
-            op_token = consume(['or', 'and'])
-            right = parse_expression()
-            left = BinaryOp(left, op_token.text, right)
-        
-        return left
-    
-    def parse_polynomial() -> Expression:
-        left: Expression = parse_term()
-        while peek().text in ['+', '-']:
-            op_token = consume() # TODO: parse_token()
-            right = parse_term()
-            left = BinaryOp(left, op_token.text, right)
-        return left
-    
-    def parse_term() -> Expression:
-        left: Expression = parse_factor()
-        while peek().text in ['*', '/']:
-            op_token = consume() # TODO: parse_token()
-            right = parse_factor()
-            left = BinaryOp(left, op_token.text, right)
+                operand = parse_factor()
+                if not isinstance(operand, Expression):
+                    operand = yield operand
+                block_operand = False
+            operands.append(operand)
+
+        while operators:
+            right = operands.pop()
+            operands[-1] = BinaryOp(operands[-1], KindTexts[operators.pop()], right)
+        left = operands[0]
+
+        if kind == ASSIGN and not compared:
+            advance()
+            right = yield parse_expression()
+            return BinaryOp(left, '=', right)
+        while peek_kind() == OR or peek_kind() == AND:
+            op = consume()
+            right = yield parse_expression()
+            left = BinaryOp(left, op, right)
         return left
     
-    def parse_factor() -> Expression:
-        if peek().text == '(':
-            return parse_parenthesized_expression()
-        elif peek().text == 'if':
-            return parse_if_expression()
-        elif peek().text == 'while':
-            return parse_while_expression()
-        elif peek().text in ['not', '-']:
-            return parse_unary_expression()
-        elif peek().text == 'return':
-            return parse_return()
-        elif peek().type == 'int_literal':
+    def parse_factor() -> Expression | Parsing[Expression]:
+        "Returns literals and identifiers directly, and a parsing step for anything else"
+        kind = peek_kind()
+        if kind == INT_LITERAL:
             return parse_literal()
-        elif peek().type == 'identifier':
+        elif kind == IDENTIFIER:
             return parse_identifier()
-        else:
-            raise Exception(f'Unexpected "{peek().text}"')
+        parse_prefix = prefix_parsers.get(kind)
+        if parse_prefix is None:
+            raise Exception(f'Unexpected "{peek_text()}"{location()}')
+        return parse_prefix()
         
-    def parse_parenthesized_expression() -> Expression:
-        consume('(')
-        expr = parse_expression()
-        consume(')')
+    def parse_parenthesized_expression() -> Parsing[Expression]:
+        expect(LEFT_PAREN)
+        expr = yield parse_expression()
+        expect(RIGHT_PAREN)
         return expr
     
-    def parse_if_expression() -> Expression:
-        consume('if')
-        cond = parse_expression()
-        consume('then')
-        then_clause = parse_expression()
-        if peek().text == 'else':
-            consume('else')
-            else_clause = parse_expression()
+    def parse_if_expression() -> Parsing[Expression]:
+        expect(IF)
+        cond = yield parse_expression()
+        expect(THEN)
+        then_clause = yield parse_expression()
+        if peek_kind() == ELSE:
+            expect(ELSE)
+            else_clause = yield parse_expression()
         else:
             else_clause = None
         return IfExpression(cond, then_clause, else_clause)
     
-    def parse_while_expression() -> Expression:
-        consume('while')
-        cond = parse_expression()
-        consume('do')
-        body = parse_expression()
-        if isinstance(body, Block):
-            return WhileExpression(cond, body)
-        else:
-            if peek().text == ';':
-                consume(';')
-                empty = Literal(None)
-                return WhileExpression(cond, Block([body, empty]))
-            return WhileExpression(cond, body)
+    def parse_while_expression() -> Parsing[Expression]:
+        start = pos
+        expect(WHILE)
+        cond = yield parse_expression()
+        expect(DO)
+        body = yield parse_expression()
+        if not isinstance(body, Block) and peek_kind() == SEMICOLON:
+            expect(SEMICOLON)
+            body = Block([body, Literal(None)])
+        node = WhileExpression(cond, body)
+        locate(node, start)
+        return node
     
-    def parse_unary_expression() -> Expression:
-        op = peek().text
-        consume()
-        if peek().text in ['not', '-']:
-            right = parse_unary_expression()
-        else:
-            right = parse_expression()
-        return UnaryOp(op, right)
+    def parse_unary_expression() -> Parsing[Expression]:
+        ops = [consume()]
+        while peek_kind() == NOT or peek_kind() == MINUS:
+            ops.append(consume())
+        right = yield parse_expression()
+        for op in reversed(ops):
+            right = UnaryOp(op, right)
+        return right
     
-    def parse_variable_declaration() -> Expression:
-        consume('var')
-        if peek().type == 'identifier':
-            name = peek().text
-            consume(name)
+    def parse_variable_declaration() -> Parsing[Expression]:
+        expect(VAR)
+        if KindTypes[peek_kind()] == 'identifier':
+            name = consume_name()
             variable_type: Type = Unit
-            if peek().text == ':':
-                consume(':')
-                t = consume()
-                variable_type = string_to_type(t.text)
-            consume('=')
-            initializer = parse_expression()
+            if peek_kind() == COLON:
+                expect(COLON)
+                variable_type = string_to_type(consume())
+            expect(ASSIGN)
+            initializer = yield parse_expression()
 
             return VariableDeclaration(name, initializer, type=variable_type)
         else:
-            raise Exception(f'Expected variable name, but found {peek().text}')
+            raise Exception(f'Expected variable name, but found {peek_text()}{location()}')
 
     def parse_literal() -> Literal:
-        token = peek()
-        if token.type == 'int_literal':
-            consume()
-            return Literal(value=int(token.text)) # TODO: error handling
-        else:
-            raise Exception(f'Expected literal, but found {token.text}') # TODO: row, col
+        return Literal(int(consume())) # TODO: error handling
         
-    def parse_identifier() -> Literal | Identifier | Function:
-        token = peek()
-        if token.text == 'true':
-            consume()
+    def parse_identifier() -> Expression | Parsing[Expression]:
+        kind = peek_kind()
+        if kind == TRUE:
+            advance()
             return Literal(True)
-        if token.text == 'false':
-            consume()
+        if kind == FALSE:
+            advance()
             return Literal(False)
-        if token.type == 'identifier':
-            consume()
-            next = peek()
-            if next.text == '(':
-                consume('(')
-                args = parse_function_args()
-                consume(')')
-                return Function(token.text, args)
-            else:
-                return Identifier(token.text)
+        name = consume_name()
+        if peek_kind() == LEFT_PAREN:
+            return parse_function_call(name)
         else:
-            raise Exception(f'Expected identifier, but found {token.text}')
+            return Identifier(name)
             
-    def parse_function_args() -> list[Expression]:
+    def parse_function_call(name: str) -> Parsing[Expression]:
+        expect(LEFT_PAREN)
         args: list[Expression] = []
-        while peek().text != ')':
-            args.append(parse_expression())
-            if peek().text == ',':
-                consume(',')
-        return args
+        while peek_kind() != RIGHT_PAREN:
+            args.append((yield parse_expression()))
+            if peek_kind() == COMMA:
+                expect(COMMA)
+        expect(RIGHT_PAREN)
+        return Function(name, args)
     
-    def parse_function() -> FunctionDeclaration:
-        consume('fun')
-        name = peek().text
-        consume(name)
+    def parse_function() -> Parsing[FunctionDeclaration]:
+        expect(FUN)
+        name = consume_name()
         args: list[Expression] = []
-        consume('(')
-        while peek().text != ')':
-            var_name = consume().text
-            consume(':')
-            var_type = consume().text
-            if peek().text != ')':
-                consume(',')
+        expect(LEFT_PAREN)
+        while peek_kind() != RIGHT_PAREN:
+            var_name = consume_name()
+            expect(COLON)
+            var_type = consume()
+            if peek_kind() != RIGHT_PAREN:
+                expect(COMMA)
             args.append(Identifier(name=var_name, type=string_to_type(var_type)))
-        consume(')')
+        expect(RIGHT_PAREN)
         return_type = Unit
-        if peek().text == ':':
-            consume(':')
-            return_type = string_to_type(consume().text)
-        body = parse_block()
+        if peek_kind() == COLON:
+            expect(COLON)
+            return_type = string_to_type(consume())
+        body = yield parse_block()
         return FunctionDeclaration(name=name, args=args, body=body, type=return_type)
     
-    def parse_return() -> ReturnExpression:
-        consume('return')
-        exp = parse_expression()
-        consume(';')
+    def parse_return() -> Parsing[Expression]:
+        expect(RETURN)
+        exp = yield parse_expression()
+        expect(SEMICOLON)
         return ReturnExpression(value=exp)
 
-    return parse_code()
\ No newline at end of file
+    # Factors by their first token. Keywords without a rule of their own are identifiers.
+    prefix_parsers: dict[int, Callable[[], Expression | Parsing[Expression]]] = {
+        kind: parse_identifier for kind in range(len(KindTypes)) if KindTypes[kind] == 'identifier'
+    }
+    prefix_parsers.update({
+        LEFT_PAREN: parse_parenthesized_expression,
+        IF: parse_if_expression,
+        WHILE: parse_while_expression,
+        NOT: parse_unary_expression,
+        MINUS: parse_unary_expression,
+        RETURN: parse_return,
+        INT_LITERAL: parse_literal,
+    })
+
+    # The parser creates no reference cycles, so the cycle collector would only
+    # keep re-scanning the growing tree
+    with paused_collector():
+        return run(parse_code())
@@ -0,0 +1,161 @@
+"""Counters of where the interpreter spends its time, filled in when a Profiler
+is given to 'interpret'. Without one, nothing is counted or timed.
+
+Times are in seconds. The time of a node includes the nodes evaluated in it, and its
+self time doesn't. Likewise the inclusive time of a function includes the functions
+it calls, and its exclusive time doesn't. A node or call adds to the time including
+the others only if no node of its type, or call of its function, is already running,
+so that nested blocks and recursive calls aren't counted twice.
+"""
+from dataclasses import asdict, dataclass, fields
+import json
+from time import perf_counter
+from typing import Any
+
+from compiler.models.expressions import *
+from compiler.models.tokens import SourceLocation
+
+@dataclass
+class NodeStats:
+    count: int = 0
+    time: float = 0.0
+    self_time: float = 0.0
+
+@dataclass
+class FunctionStats:
+    calls: int = 0
+    inclusive_time: float = 0.0
+    exclusive_time: float = 0.0
+
+@dataclass
+class RunningCall:
+    name: str
+    # The names of the running functions, from 'main' to this one, separated by ';'
+    path: str
+    start: float
+    callee_time: float = 0.0
+
+class Profiler:
+    """Evaluation counts and times by node type, call counts and times by function,
+    and iteration counts by loop.
+
+    Loops are keyed by their locations in 'locations', from 'parse', or else by
+    the function they are in and their order in it, e.g. 'main: while 2'."""
+    nodes: dict[str, NodeStats]
+    functions: dict[str, FunctionStats]
+    loops: dict[str, int]
+    # The exclusive time of each stack of running functions, for flame graphs
+    stacks: dict[str, float]
+    locations: dict[int, SourceLocation]
+    _loop_bodies: dict[int, str]
+    _children: list[float]
+    _calls: list[RunningCall]
+    # How many nodes of each type, and calls of each function, are running
+    _running_nodes: dict[str, int]
+    _running_functions: dict[str, int]
+
+    def __init__(self, locations: dict[int, SourceLocation] | None = None) -> None:
+        self.nodes = {}
+        self.functions = {}
+        self.loops = {}
+        self.stacks = {}
+        self.locations = locations if locations is not None else {}
+        self._loop_bodies = {}
+        self._children = []
+        self._calls = []
+        self._running_nodes = {}
+        self._running_functions = {}
+
+    def start(self, exp: Expression) -> None:
+        "Finds the loops of a module or an expression, and starts timing its main code"
+        if isinstance(exp, Module):
+            code = [('main', exp.sequence[0])]
+            code += [(fun.name, fun.body) for fun in exp.sequence[1:] if isinstance(fun, FunctionDeclaration)]
+        else:
+            code = [('main', exp)]
+        for (name, body) in code:
+            count = 0
+            stack: list[Any] = [body]
+            while stack:
+                node = stack.pop()
+                if isinstance(node, list):
+                    stack.extend(reversed(node))
+                    continue
+                if isinstance(node, WhileExpression):
+                    count += 1
+                    location = self.locations.get(id(node))
+                    key = str(location) if location is not None else f'{name}: while {count}'
+                    self._loop_bodies[id(node.body)] = key
+                    self.loops.setdefault(key, 0)
+                values = [getattr(node, f.name) for f in fields(node) if f.name != 'type']
+                stack.extend(v for v in reversed(values) if isinstance(v, (Expression, list)))
+        self.enter_function('main')
+
+    def stop(self) -> None:
+        "Stops timing the functions still running, also after an error"
+        while self._calls:
+            self.exit_function()
+        self._children.clear()
+        self._running_nodes.clear()
+
+    def enter_node(self, node: Expression) -> float:
+        name = type(node).__name__
+        self._running_nodes[name] = self._running_nodes.get(name, 0) + 1
+        self._children.append(0.0)
+        return perf_counter()
+
+    def exit_node(self, node: Expression, start: float) -> None:
+        elapsed = perf_counter() - start
+        name = type(node).__name__
+        if not self._children:
+            # Steps of a failed evaluation, closed after 'stop'
+            return
+        children = self._children.pop()
+        if self._children:
+            self._children[-1] += elapsed
+        self._running_nodes[name] -= 1
+        stats = self.nodes.get(name)
+        if stats is None:
+            stats = self.nodes[name] = NodeStats()
+        stats.count += 1
+        if self._running_nodes[name] == 0:
+            stats.time += elapsed
+        stats.self_time += elapsed - children
+        loop = self._loop_bodies.get(id(node))
+        if loop is not None:
+            self.loops[loop] += 1
+
+    def enter_function(self, name: str) -> None:
+        path = f'{self._calls[-1].path};{name}' if self._calls else name
+        self._calls.append(RunningCall(name, path, perf_counter()))
+        self._running_functions[name] = self._running_functions.get(name, 0) + 1
+
+    def exit_function(self) -> None:
+        call = self._calls.pop()
+        elapsed = perf_counter() - call.start
+        if self._calls:
+            self._calls[-1].callee_time += elapsed
+        self._running_functions[call.name] -= 1
+        stats = self.functions.get(call.name)
+        if stats is None:
+            stats = self.functions[call.name] = FunctionStats()
+        stats.calls += 1
+        if self._running_functions[call.name] == 0:
+            stats.inclusive_time += elapsed
+        stats.exclusive_time += elapsed - call.callee_time
+        self.stacks[call.path] = self.stacks.get(call.path, 0.0) + elapsed - call.callee_time
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'nodes': {name: asdict(stats) for (name, stats) in sorted(self.nodes.items())},
+            'functions': {name: asdict(stats) for (name, stats) in sorted(self.functions.items())},
+            'loops': dict(self.loops),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_collapsed(self) -> str:
+        """Returns the stacks of running functions in the collapsed format of flame graph tools:
+        a line like 'main;fib;fib 120' for each stack, with its exclusive time in microseconds"""
+        return ''.join(f'{path} {round(time * 1_000_000)}\n' for (path, time) in sorted(self.stacks.items()))
@@ -0,0 +1,336 @@
+"""A backend that translates a type checked program into Python source code,
+which CPython compiles to its own bytecode, so the program runs without any
+dispatch on nodes or instructions.
+
+Functions become 'def's, while loops become 'while' loops and variables become
+Python locals, renamed so that shadowed variables get names of their own.
+Expressions that need statements, like blocks and ifs with blocks in their clauses,
+are computed into temporaries before the expression that uses them.
+Like in 'compiler.bytecode', division rounds towards zero, 'and' and 'or' short-circuit,
+and the main code prints its value if it is an Int or a Bool. Unlike there,
+a function that ends without 'return' gives the value of its body.
+Translated with 'budgeted', every loop iteration and every call spends fuel
+of the budget that 'run_code' is given.
+
+'load_program' caches the compiled code objects on disk with 'marshal', keyed by a hash
+of the source code of the program and of the modules that tokenize, parse, check and translate it.
+"""
+import marshal
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from pathlib import Path
+from types import CodeType
+from typing import Any
+
+import compiler.models.expressions
+import compiler.models.symbol_table
+import compiler.models.tokens
+import compiler.models.types
+import compiler.parser
+import compiler.resolver
+import compiler.tokenizer
+import compiler.type_checker
+from compiler.budget import Budget
+from compiler.channel import Channel
+from compiler.ir_interpreter import divide, remainder
+from compiler.models.expressions import *
+from compiler.models.symbol_table import SymTab
+from compiler.models.types import Bool, Int
+from compiler.parser import parse
+from compiler.tokenizer import tokenize_buffer
+from compiler.type_checker import typecheck
+
+builtins = {'print_int': '_print_int', 'print_bool': '_print_bool', 'read_int': '_read_int'}
+
+# Python expressions that can be evaluated at any time, since nothing can change their value
+constant = re.compile(r'-?\d+|True|False|None')
+# Python expressions that are no use as statements
+trivial = re.compile(r'-?\d+|True|False|None|[a-z]\w*')
+
+# The code of a program depends on the source code of these modules, so cached code
+# is compiled again after any of them changes
+translator_modules = [
+    compiler.tokenizer, compiler.parser, compiler.type_checker, compiler.resolver,
+    compiler.models.expressions, compiler.models.symbol_table, compiler.models.tokens, compiler.models.types,
+    sys.modules[__name__],
+]
+translator_hash = blake2b(
+    b''.join(blake2b(Path(str(m.__file__)).read_bytes()).digest() for m in translator_modules),
+    digest_size=16).digest()
+
+@dataclass
+class Writer:
+    "The lines of the function being translated"
+    functions: set[str]
+    lines: list[str] = field(default_factory=list)
+    indent: str = '    '
+    # Whether loop iterations and calls spend fuel of the budget
+    budgeted: bool = False
+    scopes: list[dict[str, str]] = field(default_factory=lambda: [{}])
+    # The Python names used in the function
+    names: set[str] = field(default_factory=set)
+    temporaries: int = 0
+
+    def translate(self, node: Expression) -> str:
+        "Translates a node with 'expression'. Writers of other kinds of code translate nodes their own way."
+        return expression(node, self)
+
+    def emit(self, line: str) -> None:
+        self.lines.append(self.indent + line)
+
+    def temporary(self) -> str:
+        self.temporaries += 1
+        return f't{self.temporaries}'
+
+    def declare(self, name: str) -> str:
+        python_name = f'v_{name}'
+        n = 1
+        while python_name in self.names:
+            n += 1
+            python_name = f'v_{name}_{n}'
+        self.names.add(python_name)
+        self.scopes[-1][name] = python_name
+        return python_name
+
+    def lookup(self, name: str) -> str:
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        raise Exception(f'Variable {name} is not defined')
+
+def translate(exp: Expression, budgeted: bool = False) -> str:
+    "Translates a type checked program into the source code of a Python module that defines 'main'"
+    # Marks the module for 'run_code', even when it has no loops or calls to spend fuel on
+    lines: list[str] = ['_budgeted = True'] if budgeted else []
+    functions: set[str] = set()
+    if isinstance(exp, Module):
+        declarations = [fun for fun in exp.sequence[1:] if isinstance(fun, FunctionDeclaration)]
+        functions = {fun.name for fun in declarations}
+        for fun in declarations:
+            writer = Writer(functions, budgeted=budgeted)
+            params = [writer.declare(arg.get_name()) for arg in fun.args]
+            if budgeted:
+                charge(writer)
+            value = expression(fun.body, writer)
+            lines.append(f'def f_{fun.name}({", ".join(params)}):')
+            lines.extend(writer.lines)
+            lines.append(f'    return {value}')
+        main = exp.sequence[0]
+    else:
+        main = exp
+
+    writer = Writer(functions, budgeted=budgeted)
+    value = expression(main, writer)
+    lines.append('def main():')
+    lines.extend(writer.lines)
+    if main.type == Int:
+        lines.append(f'    _print_int({value})')
+    elif main.type == Bool:
+        lines.append(f'    _print_bool({value})')
+    else:
+        lines.append(f'    {statement(value)}')
+    return '\n'.join(lines) + '\n'
+
+def expression(node: Expression, w: Writer) -> str:
+    "Emits the statements that the node needs, and returns a Python expression for its value"
+    match node:
+        case Literal():
+            return str(node.value)
+
+        case Identifier():
+            return w.lookup(node.name)
+
+        case BinaryOp():
+            if node.op == '=':
+                if not isinstance(node.left, Identifier):
+                    raise Exception(f'Can not assign to {node.left}')
+                value = expression(node.right, w)
+                target = w.lookup(node.left.name)
+                w.emit(f'{target} = {value}')
+                return target
+
+            if node.op == 'and' or node.op == 'or':
+                left = expression(node.left, w)
+                (lines, right) = branch(node.right, w)
+                if not lines:
+                    return f'({left} {node.op} {right})'
+                result = w.temporary()
+                w.emit(f'{result} = {left}')
+                w.emit(f'if {result}:' if node.op == 'and' else f'if not {result}:')
+                w.lines.extend(lines)
+                w.emit(f'    {result} = {right}')
+                return result
+
+            (a, b) = operands([node.left, node.right], w)
+            if node.op == '/':
+                return f'_div({a}, {b})'
+            if node.op == '%':
+                return f'_rem({a}, {b})'
+            return f'({a} {node.op} {b})'
+
+        case UnaryOp():
+            operand = expression(node.right, w)
+            if node.op == 'not':
+                return f'(not {operand})'
+            return f'(-{operand})'
+
+        case IfExpression():
+            cond = expression(node.cond, w)
+            (then_lines, then_value) = branch(node.then_clause, w)
+            if node.else_clause is None:
+                w.emit(f'if {cond}:')
+                w.lines.extend(then_lines)
+                w.emit(f'    {statement(then_value)}')
+                return 'None'
+            (else_lines, else_value) = branch(node.else_clause, w)
+            if not then_lines and not else_lines:
+                return f'({then_value} if {cond} else {else_value})'
+            result = w.temporary()
+            w.emit(f'if {cond}:')
+            w.lines.extend(then_lines)
+            w.emit(f'    {result} = {then_value}')
+            w.emit('else:')
+            w.lines.extend(else_lines)
+            w.emit(f'    {result} = {else_value}')
+            return result
+
+        case WhileExpression():
+            (cond_lines, cond) = branch(node.cond, w)
+            (body_lines, body_value) = branch(node.body, w)
+            if cond_lines:
+                w.emit('while True:')
+                w.lines.extend(cond_lines)
+                w.emit(f'    if not {cond}:')
+                w.emit('        break')
+            else:
+                w.emit(f'while {cond}:')
+            if w.budgeted:
+                charge(w, '    ')
+            w.lines.extend(body_lines)
+            w.emit(f'    {statement(body_value)}')
+            return 'None'
+
+        case VariableDeclaration():
+            value = expression(node.initializer, w)
+            w.emit(f'{w.declare(node.name)} = {value}')
+            return 'None'
+
+        case Block():
+            w.scopes.append({})
+            value = 'None'
+            for (i, exp) in enumerate(node.sequence):
+                value = expression(exp, w)
+                if i < len(node.sequence) - 1 and not trivial.fullmatch(value):
+                    w.emit(value)
+            w.scopes.pop()
+            return value
+
+        case Function():
+            args = operands(node.args, w)
+            if node.name in builtins:
+                return f'{builtins[node.name]}({", ".join(args)})'
+            if node.name not in w.functions:
+                raise Exception(f'Function {node.name} is not defined')
+            return f'f_{node.name}({", ".join(args)})'
+
+        case ReturnExpression():
+            w.emit(f'return {expression(node.value, w)}')
+            return 'None'
+
+        case _:
+            raise Exception(f'Can not translate {type(node).__name__} to Python')
+
+def branch(node: Expression, w: Writer) -> tuple[list[str], str]:
+    "Translates a node into lines of its own, one level deeper, to be put in a clause of 'if' or 'while'"
+    (lines, indent) = (w.lines, w.indent)
+    w.lines = []
+    w.indent = indent + '    '
+    try:
+        value = w.translate(node)
+        return (w.lines, value)
+    finally:
+        (w.lines, w.indent) = (lines, indent)
+
+def operands(nodes: list[Expression], w: Writer) -> list[str]:
+    """Translates nodes that are evaluated from left to right. When a node needs statements,
+    the values of the nodes before it are stored before those statements run."""
+    values: list[str] = []
+    for node in nodes:
+        start = len(w.lines)
+        value = w.translate(node)
+        if len(w.lines) > start:
+            stores: list[str] = []
+            for (i, earlier) in enumerate(values):
+                if not constant.fullmatch(earlier):
+                    values[i] = w.temporary()
+                    stores.append(f'{w.indent}{values[i]} = {earlier}')
+            w.lines[start:start] = stores
+        values.append(value)
+    return values
+
+def charge(w: Writer, indent: str = '') -> None:
+    "Emits the lines that spend a unit of fuel, like the interpreter engines do"
+    w.emit(f'{indent}_budget.remaining -= 1')
+    w.emit(f'{indent}if _budget.remaining == 0:')
+    w.emit(f'{indent}    _budget.check()')
+
+def statement(value: str) -> str:
+    return 'pass' if trivial.fullmatch(value) else value
+
+def load_program(source: str, cache_dir: str | None = None, budgeted: bool = False) -> CodeType:
+    """Compiles the source code of a program into a code object for 'run_code'.
+    With a cache directory, the code object is stored there, and loaded from there
+    the next time the same source code is compiled"""
+    path: str | None = None
+    if cache_dir is not None:
+        key = blake2b(source.encode(), digest_size=16, key=translator_hash)
+        kind = 'budgeted.' if budgeted else ''
+        path = os.path.join(cache_dir, f'{key.hexdigest()}.{kind}{sys.implementation.cache_tag}.code')
+        try:
+            with open(path, 'rb') as f:
+                code = marshal.load(f)
+            if isinstance(code, CodeType):
+                return code
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+    module = parse(tokenize_buffer(source))
+    # Every program gets symbols of its own, so that programs don't see the functions of others
+    typecheck(module, SymTab({}))
+    code = compile(translate(module, budgeted), '<program>', 'exec')
+
+    if cache_dir is not None and path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written under another name first, so that other processes never load half of it
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            marshal.dump(code, f)
+        os.replace(temporary, path)
+    return code
+
+def run_code(code: CodeType, channel: Channel | None = None, budget: Budget | None = None) -> None:
+    """Runs a program compiled by 'load_program' or from 'translate'. It reads and prints through the channel.
+    A budget needs a program translated with 'budgeted'."""
+    if budget is not None and '_budgeted' not in code.co_names:
+        raise Exception('The program was not translated with a budget')
+    io = channel if channel is not None else Channel()
+    if budget is None:
+        # Budgeted code run without a budget spends fuel that has no limit
+        budget = Budget()
+    budget.start()
+    namespace: dict[str, Any] = {
+        '_budget': budget,
+        '_div': divide,
+        '_rem': remainder,
+        '_print_int': io.print_int,
+        '_print_bool': io.print_bool,
+        '_read_int': io.read_int,
+    }
+    try:
+        exec(code, namespace)
+        namespace['main']()
+    finally:
+        io.flush()
@@ -0,0 +1,311 @@
+"""A pass that resolves every variable of a module to where it is stored, before
+interpreting it, so that the interpreter doesn't search for names while running.
+
+Frames are lists. The global frame is at depth 0, the frame with the parameters of
+a function at depth 1, and every block gets a frame one deeper than the code around it.
+A variable is found by its depth and its slot in the frame at that depth.
+
+Every declaration also gets an id of its own, which the type checker and the IR generator
+use to keep what they know about each variable, instead of looking its name up in scopes.
+An arena is resolved by 'resolve_arena', keyed by the indices of its nodes instead of their ids.
+"""
+from dataclasses import dataclass, field
+from typing import Any
+
+from compiler.models.arena import *
+from compiler.models.expressions import *
+
+Location = tuple[int, int]
+
+@dataclass
+class Resolution:
+    """The results of 'resolve', keyed by the ids of the nodes
+    - variables: the location of each resolved Identifier, VariableDeclaration,
+      and the variable assigned by each '=' BinaryOp
+    - operators: the function of each BinaryOp and UnaryOp, from the global symbols
+    - bindings: the declaration of each resolved Identifier, Function call, VariableDeclaration,
+      parameter, and the variable assigned by each '=' BinaryOp, as an index to 'declarations'.
+      The global symbols and the functions are declared first, so their declarations are their slots.
+    - declarations: the location of each declaration, in the order they were resolved
+    - frame_sizes: the amount of slots in the frame of each Block and FunctionDeclaration
+    - local_counts: the amount of parameters and variables that each function of the module declares
+    - global_slots: the slots of the names in the global frame, in slot order.
+      Function calls resolve to the slot of the function in the global frame.
+    - calls: the nodes that have a resolved function call in them, or are one
+    - tail_calls: the function calls whose value is the value of the function they are in
+    - pure_functions: the functions of the module that make no 'print_int', 'print_bool'
+      or 'read_int' calls, don't read or assign global variables, and only call pure functions"""
+    variables: dict[int, Location] = field(default_factory=dict)
+    operators: dict[int, Any] = field(default_factory=dict)
+    bindings: dict[int, int] = field(default_factory=dict)
+    declarations: list[Location] = field(default_factory=list)
+    frame_sizes: dict[int, int] = field(default_factory=dict)
+    local_counts: dict[str, int] = field(default_factory=dict)
+    global_slots: dict[str, int] = field(default_factory=dict)
+    calls: set[int] = field(default_factory=set)
+    tail_calls: set[int] = field(default_factory=set)
+    pure_functions: set[str] = field(default_factory=set)
+
+class Scopes:
+    """The scopes of the code being resolved, the innermost last. Scope i maps names to slots in the frame
+    at depth i, and bound[i] maps them to their declarations. The global scope is the global frame."""
+    resolution: Resolution
+    slots: list[dict[str, int]]
+    bound: list[dict[str, int]]
+    # The amount of slots in the frame of each scope, the global one excepted
+    sizes: list[int]
+
+    def __init__(self, resolution: Resolution, global_symbols: dict[str, Any]) -> None:
+        self.resolution = resolution
+        self.slots = [resolution.global_slots]
+        self.bound = [{}]
+        self.sizes = [0]
+        for name in global_symbols:
+            self.declare_global(name)
+
+    def bind(self, depth: int, name: str) -> int:
+        "Makes the slot of the name a new declaration, and returns its id"
+        self.bound[depth][name] = len(self.resolution.declarations)
+        self.resolution.declarations.append((depth, self.slots[depth][name]))
+        return self.bound[depth][name]
+
+    def declare_global(self, name: str) -> int:
+        if name not in self.slots[0]:
+            self.slots[0][name] = len(self.slots[0])
+        return self.bind(0, name)
+
+    def declare_functions(self, names: list[str]) -> None:
+        "Declares the functions of a module after the global symbols"
+        for name in names:
+            if name not in self.bound[0]:
+                self.declare_global(name)
+
+    def lookup(self, name: str) -> int | None:
+        "Returns the declaration of the name that is in scope"
+        for depth in reversed(range(len(self.bound))):
+            if name in self.bound[depth]:
+                return self.bound[depth][name]
+        return None
+
+    def declare(self, name: str) -> int:
+        depth = len(self.slots) - 1
+        if depth == 0:
+            return self.declare_global(name)
+        if name not in self.slots[depth]:
+            self.slots[depth][name] = self.sizes[depth]
+            self.sizes[depth] += 1
+        return self.bind(depth, name)
+
+    def resolve_variable(self, key: int, name: str) -> Location | None:
+        "Binds the node to the declaration of the name, and returns its location"
+        declaration = self.lookup(name)
+        if declaration is None:
+            return None
+        self.resolution.bindings[key] = declaration
+        location = self.resolution.declarations[declaration]
+        self.resolution.variables[key] = location
+        return location
+
+    def resolve_function(self, key: int, name: str) -> bool:
+        "Binds a call to the global function of the name, and returns whether there is one"
+        if name not in self.slots[0]:
+            return False
+        self.resolution.bindings[key] = self.bound[0][name]
+        self.resolution.variables[key] = (0, self.slots[0][name])
+        return True
+
+    def enter(self, parameters: list[str] = []) -> list[int]:
+        "Enters a block, or a function with its parameters, and returns the declarations of the parameters"
+        self.slots.append({name: i for (i, name) in enumerate(parameters)})
+        self.bound.append({})
+        self.sizes.append(len(parameters))
+        return [self.bind(len(self.bound) - 1, name) for name in parameters]
+
+    def exit(self) -> int:
+        "Leaves the innermost scope, and returns the size of its frame"
+        self.bound.pop()
+        self.slots.pop()
+        return self.sizes.pop()
+
+def resolve(exp: Expression, global_symbols: dict[str, Any]) -> Resolution:
+    """Resolves the names in a module or an expression. The global frame has the global symbols,
+    then the functions of the module. Names that can't be resolved are left out,
+    and fail only if they are evaluated."""
+    resolution = Resolution()
+    scopes = Scopes(resolution, global_symbols)
+    declarations: list[FunctionDeclaration] = []
+    if isinstance(exp, Module):
+        declarations = [fun for fun in exp.sequence[1:] if isinstance(fun, FunctionDeclaration)]
+        scopes.declare_functions([fun.name for fun in declarations])
+        main = exp.sequence[0]
+    else:
+        main = exp
+
+    function_names = {fun.name for fun in declarations}
+    # The function being resolved, the functions found impure and the functions each function calls
+    current: str | None = None
+    impure: set[str] = set()
+    callees: dict[str, set[str]] = {name: set() for name in function_names}
+
+    def uses_global_state() -> None:
+        if current is not None:
+            impure.add(current)
+
+    def visit(node: Expression) -> bool:
+        "Resolves the names in a node, and returns whether it has calls"
+        has_call = False
+        match node:
+            case Literal():
+                pass
+            case Identifier():
+                location = scopes.resolve_variable(id(node), node.name)
+                if location is not None and location[0] == 0 and node.name not in function_names:
+                    uses_global_state()
+            case BinaryOp():
+                if isinstance(node.left, Identifier) and node.op == '=':
+                    location = scopes.resolve_variable(id(node), node.left.name)
+                    if location is None or location[0] == 0:
+                        uses_global_state()
+                else:
+                    has_call = visit(node.left)
+                    if node.op in global_symbols:
+                        resolution.operators[id(node)] = global_symbols[node.op]
+                has_call = visit(node.right) or has_call
+            case UnaryOp():
+                if 'unary_negative' in global_symbols:
+                    resolution.operators[id(node)] = global_symbols['unary_negative']
+                has_call = visit(node.right)
+            case IfExpression():
+                has_call = visit(node.cond)
+                has_call = visit(node.then_clause) or has_call
+                if node.else_clause is not None:
+                    has_call = visit(node.else_clause) or has_call
+            case WhileExpression():
+                has_call = visit(node.cond)
+                has_call = visit(node.body) or has_call
+            case VariableDeclaration():
+                # The initializer can't see the variable it initializes
+                has_call = visit(node.initializer)
+                resolution.bindings[id(node)] = scopes.declare(node.name)
+                resolution.variables[id(node)] = resolution.declarations[resolution.bindings[id(node)]]
+            case Block():
+                scopes.enter()
+                for e in node.sequence:
+                    has_call = visit(e) or has_call
+                resolution.frame_sizes[id(node)] = scopes.exit()
+            case Function():
+                if scopes.resolve_function(id(node), node.name):
+                    has_call = True
+                if current is not None and node.name in function_names and node.name not in ['print_int', 'print_bool', 'read_int']:
+                    callees[current].add(node.name)
+                else:
+                    uses_global_state()
+                for arg in node.args:
+                    has_call = visit(arg) or has_call
+            case ReturnExpression():
+                has_call = visit(node.value)
+            case _:
+                raise Exception(f'Unsupported AST node: {node}')
+        if has_call:
+            resolution.calls.add(id(node))
+        return has_call
+
+    def find_tail_calls(node: Expression) -> None:
+        match node:
+            case Function():
+                if id(node) in resolution.calls:
+                    resolution.tail_calls.add(id(node))
+            case Block():
+                find_tail_calls(node.sequence[-1])
+            case IfExpression():
+                # Without 'else' the value is Unit
+                if node.else_clause is not None:
+                    find_tail_calls(node.then_clause)
+                    find_tail_calls(node.else_clause)
+            case ReturnExpression():
+                find_tail_calls(node.value)
+
+    for fun in declarations:
+        current = fun.name
+        first_declaration = len(resolution.declarations)
+        parameters = scopes.enter([arg.get_name() for arg in fun.args])
+        for (arg, declaration) in zip(fun.args, parameters):
+            resolution.bindings[id(arg)] = declaration
+        visit(fun.body)
+        find_tail_calls(fun.body)
+        resolution.frame_sizes[id(fun)] = scopes.exit()
+        resolution.local_counts[fun.name] = len(resolution.declarations) - first_declaration
+    current = None
+    visit(main)
+
+    # Functions that call impure functions are impure
+    changed = True
+    while changed:
+        changed = False
+        for name in function_names - impure:
+            if callees[name] & impure:
+                impure.add(name)
+                changed = True
+    resolution.pure_functions = function_names - impure
+    return resolution
+
+def resolve_arena(arena: Arena, global_symbols: dict[str, Any]) -> Resolution:
+    """Resolves the names in an arena like 'resolve', reading the nodes by their indices,
+    which are the keys of the resolution instead of the ids of the nodes. Finds only what
+    the type checker and the IR generator need: the variables, bindings, declarations,
+    frame sizes, local counts and global slots. An arena of a single function is
+    resolved like a module with only that function."""
+    resolution = Resolution()
+    scopes = Scopes(resolution, global_symbols)
+    kinds = arena.kinds
+    functions: list[int] = []
+    main: int | None = None
+    if kinds[0] == NODE_MODULE:
+        children = arena.children(0)
+        main = children[0]
+        functions = [c for c in children[1:] if kinds[c] == NODE_FUNCTION_DECLARATION]
+    elif kinds[0] == NODE_FUNCTION_DECLARATION:
+        functions = [0]
+    else:
+        main = 0
+    scopes.declare_functions([arena.name(fun) for fun in functions])
+
+    for fun in functions:
+        first_declaration = len(resolution.declarations)
+        (*args, body) = arena.children(fun)
+        parameters = scopes.enter([arena.name(arg) for arg in args])
+        for (arg, declaration) in zip(args, parameters):
+            resolution.bindings[arg] = declaration
+        resolve_arena_node(arena, body, scopes)
+        resolution.frame_sizes[fun] = scopes.exit()
+        resolution.local_counts[arena.name(fun)] = len(resolution.declarations) - first_declaration
+    if main is not None:
+        resolve_arena_node(arena, main, scopes)
+    return resolution
+
+def resolve_arena_node(arena: Arena, i: int, scopes: Scopes) -> None:
+    "Resolves the names in the node at the index of the arena"
+    resolution = scopes.resolution
+    kinds = arena.kinds
+    kind = kinds[i]
+    children = arena.children(i)
+    if kind == NODE_IDENTIFIER:
+        scopes.resolve_variable(i, arena.name(i))
+    elif kind == NODE_BINARY_OP and arena.op(i) == '=' and kinds[children[0]] == NODE_IDENTIFIER:
+        scopes.resolve_variable(i, arena.name(children[0]))
+        resolve_arena_node(arena, children[1], scopes)
+    elif kind == NODE_VARIABLE_DECLARATION:
+        # The initializer can't see the variable it initializes
+        resolve_arena_node(arena, children[0], scopes)
+        resolution.bindings[i] = scopes.declare(arena.name(i))
+        resolution.variables[i] = resolution.declarations[resolution.bindings[i]]
+    elif kind == NODE_BLOCK:
+        scopes.enter()
+        for c in children:
+            resolve_arena_node(arena, c, scopes)
+        resolution.frame_sizes[i] = scopes.exit()
+    else:
+        if kind == NODE_FUNCTION:
+            scopes.resolve_function(i, arena.name(i))
+        for c in children:
+            resolve_arena_node(arena, c, scopes)
@@ -0,0 +1,293 @@
+"""A compact binary format for parsed and type-checked modules.
+
+    magic           b'CMOD'
+    version         varint
+    module type     varint, a type id from 'models.arena.Types'
+    strings         varint count, then for each: varint byte length and UTF-8 bytes
+    sections        varint count, then for each: varint name (a string id, 0 for the main
+                    code) and varint byte length, followed by the sections themselves
+
+The first section is the main code and the others are the function declarations,
+each of which can be decoded without the others. A section is its nodes in post-order,
+so that decoding needs no recursion: every node starts with a varint of its kind and type
+id, followed by its operator, value, name and number of children where the kind has them.
+Integers are zigzag-encoded varints.
+"""
+import sys
+from typing import BinaryIO, Callable
+
+from compiler.collector import paused_collector
+from compiler.models.arena import (
+    NODE_BINARY_OP, NODE_BLOCK, NODE_FUNCTION, NODE_FUNCTION_DECLARATION, NODE_IDENTIFIER, NODE_IF,
+    NODE_LITERAL, NODE_RETURN, NODE_UNARY_OP, NODE_VARIABLE_DECLARATION, NODE_WHILE, Types, type_ids
+)
+from compiler.models.expressions import *
+from compiler.models.tokens import END, FALSE, INT_LITERAL, Kinds, KindTexts, TRUE
+
+MAGIC = b'CMOD'
+VERSION = 1
+
+def write_varint(out: bytearray, n: int) -> None:
+    while n >= 0x80:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+def read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    "Returns the varint at data[pos] and the position after it"
+    n = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+def zigzag(n: int) -> int:
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+def unzigzag(n: int) -> int:
+    return n // 2 if n % 2 == 0 else -(n + 1) // 2
+
+def encode_module(module: Module) -> bytes:
+    strings: list[str] = []
+    string_ids: dict[str, int] = {}
+
+    def string_id(s: str) -> int:
+        id = string_ids.get(s)
+        if id is None:
+            id = string_ids[s] = len(strings)
+            strings.append(s)
+        return id
+
+    # Id 0 is the name of the main section
+    string_id('')
+    sections = [(0, encode_section(module.sequence[0], string_id))]
+    for declaration in module.sequence[1:]:
+        if not isinstance(declaration, FunctionDeclaration):
+            raise Exception(f'Expected a function declaration, got {declaration}')
+        sections.append((string_id(declaration.name), encode_section(declaration, string_id)))
+
+    out = bytearray(MAGIC)
+    write_varint(out, VERSION)
+    write_varint(out, type_ids[str(module.type)])
+    write_varint(out, len(strings))
+    for s in strings:
+        data = s.encode()
+        write_varint(out, len(data))
+        out += data
+    write_varint(out, len(sections))
+    for (name, section) in sections:
+        write_varint(out, name)
+        write_varint(out, len(section))
+    for (_, section) in sections:
+        out += section
+    return bytes(out)
+
+def encode_section(root: Expression, string_id: Callable[[str], int]) -> bytes:
+    """Encodes the nodes in pre-order with the children visited from last to first,
+    which reversed is post-order with the children from first to last."""
+    records: list[bytes] = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        out = bytearray()
+        children: list[Expression] = []
+        match node:
+            case Literal():
+                kind = NODE_LITERAL
+            case Identifier():
+                kind = NODE_IDENTIFIER
+            case BinaryOp():
+                kind = NODE_BINARY_OP
+                children = [node.left, node.right]
+            case UnaryOp():
+                kind = NODE_UNARY_OP
+                children = [node.right]
+            case IfExpression():
+                kind = NODE_IF
+                children = [node.cond, node.then_clause]
+                if node.else_clause is not None:
+                    children.append(node.else_clause)
+            case WhileExpression():
+                kind = NODE_WHILE
+                children = [node.cond, node.body]
+            case Function():
+                kind = NODE_FUNCTION
+                children = node.args
+            case FunctionDeclaration():
+                kind = NODE_FUNCTION_DECLARATION
+                children = node.args + [node.body]
+            case VariableDeclaration():
+                kind = NODE_VARIABLE_DECLARATION
+                children = [node.initializer]
+            case ReturnExpression():
+                kind = NODE_RETURN
+                children = [node.value]
+            case Block():
+                kind = NODE_BLOCK
+                children = node.sequence
+            case _:
+                raise Exception(f'Unsupported AST node: {node}')
+
+        # There are only four types, so the type id fits in the two lowest bits
+        write_varint(out, kind << 2 | type_ids[str(node.type)])
+        match node:
+            case Literal():
+                if node.value is None:
+                    write_varint(out, END)
+                elif isinstance(node.value, bool):
+                    write_varint(out, TRUE if node.value else FALSE)
+                else:
+                    write_varint(out, INT_LITERAL)
+                    write_varint(out, zigzag(node.value))
+            case BinaryOp() | UnaryOp():
+                write_varint(out, Kinds[node.op])
+            case IfExpression():
+                write_varint(out, len(children))
+            case Identifier() | VariableDeclaration():
+                write_varint(out, string_id(node.name))
+            case Function() | FunctionDeclaration():
+                write_varint(out, string_id(node.name))
+                write_varint(out, len(children))
+            case Block():
+                write_varint(out, len(children))
+        records.append(bytes(out))
+        stack.extend(children)
+    records.reverse()
+    return b''.join(records)
+
+class ModuleReader:
+    """Reads the header and the string table of an encoded module,
+    and decodes the main code and the function declarations on demand."""
+    data: bytes
+    type: Type
+    strings: list[str]
+    function_names: list[str]
+    _sections: list[tuple[int, int]]
+
+    def __init__(self, data: bytes) -> None:
+        if data[:len(MAGIC)] != MAGIC:
+            raise Exception('Not an encoded module')
+        self.data = data
+        pos = len(MAGIC)
+
+        def varint() -> int:
+            nonlocal pos
+            n, pos = read_varint(data, pos)
+            return n
+
+        version = varint()
+        if version != VERSION:
+            raise Exception(f'Unsupported module format version {version}, expected {VERSION}')
+        self.type = Types[varint()]
+        self.strings = []
+        for _ in range(varint()):
+            length = varint()
+            self.strings.append(sys.intern(data[pos:pos + length].decode()))
+            pos += length
+        names_and_lengths = [(varint(), varint()) for _ in range(varint())]
+        self.function_names = [self.strings[name] for (name, _) in names_and_lengths[1:]]
+        self._sections = []
+        for (_, length) in names_and_lengths:
+            self._sections.append((pos, pos + length))
+            pos += length
+
+    def main(self) -> Expression:
+        return self.decode_section(0)
+
+    def function(self, i: int) -> FunctionDeclaration:
+        "Decodes the i-th function declaration only"
+        declaration = self.decode_section(i + 1)
+        if not isinstance(declaration, FunctionDeclaration):
+            raise Exception(f'Section {i + 1} is not a function declaration')
+        return declaration
+
+    def module(self) -> Module:
+        return Module([self.main()] + [self.function(i) for i in range(len(self.function_names))], type=self.type)
+
+    def decode_section(self, i: int) -> Expression:
+        with paused_collector():
+            start, end = self._sections[i]
+            return decode_nodes(self.data, start, end, self.strings)
+
+def decode_nodes(data: bytes, pos: int, end: int, strings: list[str]) -> Expression:
+    "Decodes post-order nodes from data[pos:end], building each node from the ones before it"
+    values: list[Expression] = []
+    pop = values.pop
+    push = values.append
+
+    def varint() -> int:
+        nonlocal pos
+        b = data[pos]
+        if b < 0x80:
+            pos += 1
+            return b
+        n, pos = read_varint(data, pos)
+        return n
+
+    while pos < end:
+        header = varint()
+        kind = header >> 2
+        t = Types[header & 3]
+        node: Expression
+        if kind == NODE_LITERAL:
+            value_kind = varint()
+            value = unzigzag(varint()) if value_kind == INT_LITERAL else 0
+            literal_value = None if value_kind == END else True if value_kind == TRUE else False if value_kind == FALSE else value
+            node = Literal(literal_value, type=t)
+        elif kind == NODE_IDENTIFIER:
+            node = Identifier(strings[varint()], type=t)
+        elif kind == NODE_BINARY_OP:
+            right = pop()
+            node = BinaryOp(pop(), KindTexts[varint()], right, type=t)
+        elif kind == NODE_UNARY_OP:
+            node = UnaryOp(KindTexts[varint()], pop(), type=t)
+        elif kind == NODE_IF:
+            else_clause = pop() if varint() == 3 else None
+            then_clause = pop()
+            node = IfExpression(pop(), then_clause, else_clause, type=t)
+        elif kind == NODE_WHILE:
+            body = pop()
+            node = WhileExpression(pop(), body, type=t)
+        elif kind == NODE_VARIABLE_DECLARATION:
+            node = VariableDeclaration(strings[varint()], pop(), type=t)
+        elif kind == NODE_RETURN:
+            node = ReturnExpression(pop(), type=t)
+        else:
+            name = strings[varint()] if kind == NODE_FUNCTION or kind == NODE_FUNCTION_DECLARATION else ''
+            count = varint()
+            children = values[len(values) - count:]
+            del values[len(values) - count:]
+            if kind == NODE_BLOCK:
+                node = Block(children, type=t)
+            elif kind == NODE_FUNCTION:
+                node = Function(name, children, type=t)
+            elif kind == NODE_FUNCTION_DECLARATION:
+                node = FunctionDeclaration(name, children[:-1], children[-1], type=t)
+            else:
+                raise Exception(f'Unknown node kind: {kind}')
+        push(node)
+
+    if len(values) != 1:
+        raise Exception(f'Corrupted section: {len(values)} root nodes')
+    return values[0]
+
+def decode_module(data: bytes) -> Module:
+    return ModuleReader(data).module()
+
+def save_module(module: Module, file: str | BinaryIO) -> None:
+    data = encode_module(module)
+    if isinstance(file, str):
+        with open(file, 'wb') as f:
+            f.write(data)
+    else:
+        file.write(data)
+
+def load_module(file: str | BinaryIO) -> Module:
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            return decode_module(f.read())
+    return decode_module(file.read())
@@ -0,0 +1,211 @@
+"""A long-lived service that compiles and runs programs for many clients at once.
+
+Clients connect to a Unix socket and send requests as lines of JSON:
+{"source": <source code>, "stdin": <input>}, and get a line of JSON back for each:
+{"output": <standard output>, "exit_code": <exit status>, "timings": {...}},
+or {"error": <message>, "timings": {...}} if the program doesn't compile or run.
+The timings are in seconds: 'queued' before the request was started,
+'compile' in the worker, 'run' for the executable, and 'total'.
+
+Programs are compiled by a pool of worker processes that is started and warmed up
+before the socket is opened, so requests don't pay for starting Python.
+The executables run as subprocesses of the server, at most 'max_running' at a time
+and each for at most 'timeout' seconds. The output of an executable is read in chunks,
+and it is killed once it prints more than 'max_output' bytes. At most 'max_pending' requests are compiled
+or run at once. Requests after that wait, and the server stops reading from their
+connections, so that clients that send too much are slowed down instead of using
+up the memory of the server.
+"""
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
+
+from compiler.assembler import assemble
+from compiler.assembly_generator import generate_assembly
+from compiler.ir_generator import generate_ir
+from compiler.models.symbol_table import SymTab
+from compiler.parser import parse
+from compiler.resolver import resolve
+from compiler.tokenizer import tokenize_buffer
+from compiler.type_checker import typecheck
+
+# The longest request line that is read, in bytes
+max_request_size = 16 * 1024 * 1024
+# The size of the chunks of output that are read from an executable, in bytes
+output_chunk_size = 64 * 1024
+
+def compile_program(source_code: str, workdir: str) -> float:
+    "Compiles a program into an executable 'program' in the directory. Runs in a worker process. Returns the time taken."
+    start = time.perf_counter()
+    module = parse(tokenize_buffer(source_code))
+    resolution = resolve(module, {})
+    # Every program gets symbols of its own, since the worker compiles many
+    typecheck(module, SymTab({}), resolution)
+    assemble(generate_assembly(generate_ir(module, resolution=resolution)), os.path.join(workdir, 'program'), workdir)
+    return time.perf_counter() - start
+
+async def read_output(process: asyncio.subprocess.Process, stdin: bytes, limit: int) -> bytes | None:
+    """Writes the input to the process and reads its output until it exits.
+    Returns None as soon as the output is longer than the limit."""
+    assert process.stdin is not None and process.stdout is not None
+    async def write(stream: asyncio.StreamWriter) -> None:
+        try:
+            stream.write(stdin)
+            await stream.drain()
+            stream.close()
+        except ConnectionError:
+            # The program exited without reading all of it
+            pass
+    # Written while the output is read, so that neither side waits for the other
+    writing = asyncio.create_task(write(process.stdin))
+    chunks: list[bytes] = []
+    size = 0
+    try:
+        while chunk := await process.stdout.read(output_chunk_size):
+            size += len(chunk)
+            if size > limit:
+                return None
+            chunks.append(chunk)
+        await process.wait()
+    finally:
+        writing.cancel()
+    return b''.join(chunks)
+
+def warm_up() -> int:
+    "Does nothing in a worker process, which starts the process"
+    return os.getpid()
+
+@dataclass
+class Server:
+    socket_path: str
+    workers: int = 4
+    max_running: int = 8
+    max_pending: int = 64
+    # Seconds that an executable may run
+    timeout: float = 10.0
+    # Bytes that an executable may print
+    max_output: int = 16 * 1024 * 1024
+    handled: int = 0
+    failed: int = 0
+    _pool: ProcessPoolExecutor | None = field(default=None, repr=False)
+    _running: asyncio.Semaphore | None = field(default=None, repr=False)
+    _pending: asyncio.Semaphore | None = field(default=None, repr=False)
+    _server: asyncio.AbstractServer | None = field(default=None, repr=False)
+
+    async def start(self) -> None:
+        "Starts and warms up the worker processes, then starts listening on the socket"
+        self._pool = ProcessPoolExecutor(self.workers)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self._pool, warm_up) for _ in range(self.workers)])
+        self._running = asyncio.Semaphore(self.max_running)
+        self._pending = asyncio.Semaphore(self.max_pending)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._connection, self.socket_path, limit=max_request_size)
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        assert self._server is not None
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        "Answers the requests of a connection in order, until the client closes it"
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(b'{"error": "Request is too large"}\n')
+                    break
+                if not line:
+                    break
+                response = await self.handle(line)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, line: bytes) -> dict[str, Any]:
+        "Compiles and runs the program of a request line, and returns the response"
+        start = time.perf_counter()
+        timings: dict[str, float] = {}
+        assert self._pending is not None and self._running is not None
+        async with self._pending:
+            timings['queued'] = time.perf_counter() - start
+            try:
+                request = json.loads(line)
+                source_code = request['source']
+                stdin = request.get('stdin', '')
+                if not isinstance(source_code, str) or not isinstance(stdin, str):
+                    raise ValueError('The source and stdin must be strings')
+            except (ValueError, KeyError, TypeError) as e:
+                self.failed += 1
+                return {'error': f'Bad request: {e}', 'timings': timings}
+
+            workdir = tempfile.mkdtemp(prefix='compiler_')
+            try:
+                loop = asyncio.get_running_loop()
+                try:
+                    timings['compile'] = await loop.run_in_executor(self._pool, compile_program, source_code, workdir)
+                except Exception as e:
+                    self.failed += 1
+                    return {'error': f'Compile error: {e}', 'timings': timings}
+
+                async with self._running:
+                    run_start = time.perf_counter()
+                    process = await asyncio.create_subprocess_exec(
+                        os.path.join(workdir, 'program'),
+                        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+                    output: bytes | None = None
+                    try:
+                        output = await asyncio.wait_for(read_output(process, stdin.encode(), self.max_output), self.timeout)
+                        error = f'Printed more than {self.max_output} bytes'
+                    except asyncio.TimeoutError:
+                        error = f'Timed out after {self.timeout} seconds'
+                    if output is None:
+                        process.kill()
+                        await process.wait()
+                        self.failed += 1
+                        timings['run'] = time.perf_counter() - run_start
+                        return {'error': error, 'timings': timings}
+                    timings['run'] = time.perf_counter() - run_start
+            finally:
+                await asyncio.to_thread(shutil.rmtree, workdir, True)
+
+        self.handled += 1
+        timings['total'] = time.perf_counter() - start
+        return {'output': output.decode(errors='replace'), 'exit_code': process.returncode, 'timings': timings}
+
+async def request(socket_path: str, source_code: str, stdin: str = '') -> dict[str, Any]:
+    "Sends one request to a server, and returns its response"
+    (reader, writer) = await asyncio.open_unix_connection(socket_path, limit=max_request_size)
+    try:
+        writer.write(json.dumps({'source': source_code, 'stdin': stdin}).encode() + b'\n')
+        await writer.drain()
+        response: dict[str, Any] = json.loads(await reader.readline())
+        return response
+    finally:
+        writer.close()
+        await writer.wait_closed()
@@ -1,35 +1,97 @@
+import codecs
+import mmap
 import re
-from compiler.models.tokens import Regexes, Token
+from typing import IO, Iterator
+
+from compiler.models.tokens import IDENTIFIER, INT_LITERAL, Keywords, Kinds, Token, TokenBuffer, TokenRegex
+
+Source = str | bytes | bytearray | memoryview | mmap.mmap | IO[str] | IO[bytes]
 
 def tokenize(source_code: str) -> list[Token]:
-    whitespace_re = re.compile(r'\s+')
-    comment_re = re.compile(r'#.*|//.*|\n')
-    position = 0
     result: list[Token] = []
-    
-    while position < len(source_code):
-        # skip whitespace matches
-        match = whitespace_re.match(source_code, position)
-        if match is not None:
-            position = match.end()
+    append = result.append
+    # Tokens are immutable, so every occurrence of the same text shares one Token
+    seen: dict[str, Token] = {}
+
+    for match in TokenRegex.finditer(source_code):
+        type = match.lastgroup
+        if type is None:
             continue
-        # skip comments
-        match = comment_re.match(source_code, position)
-        if match is not None:
-            position = match.end()
+        text = match.group(type)
+        token = seen.get(text)
+        if token is None:
+            token = match_to_token(match, source_code)
+            seen[text] = token
+        append(token)
+
+    return result
+
+def tokenize_buffer(source_code: str) -> TokenBuffer:
+    """Like 'tokenize', but stores the tokens column-wise in a TokenBuffer
+    instead of creating an object for every token."""
+    buffer = TokenBuffer(source_code)
+    kinds = buffer.kinds.append
+    starts = buffer.starts.append
+    ends = buffer.ends.append
+
+    for match in TokenRegex.finditer(source_code):
+        type = match.lastgroup
+        if type is None:
             continue
-        
-        toAdd = try_match(source_code, position)
-        result.append(toAdd)
-        position = position + len(toAdd.text)
+        start, end = match.span(type)
+        if type == 'identifier':
+            kinds(Keywords.get(match.group(type), IDENTIFIER))
+        elif type == 'int_literal':
+            kinds(INT_LITERAL)
+        elif type == 'error':
+            raise Exception(f'Tokenization failed near {source_code[start:start+10]}')
+        else:
+            kinds(Kinds[match.group(type)])
+        starts(start)
+        ends(end)
 
+    return buffer
 
-    return result
+def iter_tokens(source: Source, chunk_size: int = 1 << 16) -> Iterator[Token]:
+    """Tokenizes a string, a bytes-like buffer (e.g. an mmap) or a file object
+    chunk by chunk, so that memory use does not depend on the size of the source."""
+    buffer = ''
+    for chunk in read_chunks(source, chunk_size):
+        buffer += chunk
+        position = 0
+        for match in TokenRegex.finditer(buffer):
+            # A match reaching the end of the buffer may continue in the next chunk
+            if match.end() == len(buffer):
+                break
+            position = match.end()
+            yield match_to_token(match, buffer)
+        buffer = buffer[position:]
+
+    for match in TokenRegex.finditer(buffer):
+        if match.lastgroup is not None:
+            yield match_to_token(match, buffer)
+
+def read_chunks(source: Source, chunk_size: int) -> Iterator[str]:
+    if isinstance(source, str):
+        yield source
+        return
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        for start in range(0, len(source), chunk_size):
+            yield decoder.decode(source[start:start + chunk_size])
+    else:
+        while chunk := source.read(chunk_size):
+            yield chunk if isinstance(chunk, str) else decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
 
-def try_match(source_code: str, pointer: int) -> Token:
-    for (type, pattern) in Regexes:
-        pattern_match = pattern.match(source_code, pointer)
-        if pattern_match is not None:
-            return Token(type=type, text=source_code[pointer:pattern_match.end()])
-        
-    raise Exception(f'Tokenization failed near {source_code[pointer:pointer+10]}')
\ No newline at end of file
+def match_to_token(match: re.Match[str], source_code: str) -> Token:
+    type = match.lastgroup
+    text = match.group(type) if type is not None else ''
+    match type:
+        case 'identifier': return Token('identifier', text, Keywords.get(text, IDENTIFIER))
+        case 'int_literal': return Token('int_literal', text, INT_LITERAL)
+        case 'operator': return Token('operator', text, Kinds[text])
+        case 'punctuation': return Token('punctuation', text, Kinds[text])
+        case _:
+            position = match.start(type) if type is not None else match.end()
+            raise Exception(f'Tokenization failed near {source_code[position:position+10]}')
@@ -0,0 +1,339 @@
+"""Hot loops of the interpreter, compiled to Python.
+
+In the adaptive mode of the interpreter, every WhileExpression without function calls
+counts its iterations. When a loop has run 'threshold' iterations, the tracer takes
+the types of the variables from outside the loop that it uses, and generates Python
+code for the loop that is specialized to those types, with the code generator
+of 'python_backend'. The variables live in Python locals while the loop runs,
+and are stored back to their frames when it ends.
+
+The types are the guard of the compiled loop: it is run only when the variables
+have the same types again, and there is a compiled loop for each set of types.
+Code that needs types the loop can't have, like a variable that is assigned values
+of different types, isn't compiled, and runs in the interpreter like before.
+The compiled code behaves exactly like 'interpreter.evaluate', quirks included.
+"""
+from dataclasses import dataclass, field
+from types import NoneType
+from typing import Any, Callable
+
+from compiler.budget import Budget
+from compiler.channel import Channel
+from compiler.models.expressions import *
+from compiler.python_backend import Writer, branch, operands, statement, trivial
+from compiler.resolver import Location, Resolution
+
+# The types of values that compiled loops work with
+Kind = type
+kinds = (int, bool, NoneType)
+
+class Unspecializable(Exception):
+    "Raised when a loop can't be compiled for the types it would run with"
+
+@dataclass
+class CompiledLoop:
+    "A loop compiled for the types of the variables from outside it, and its source code"
+    run: Callable[[list[list[Any]], Budget | None, Channel], None]
+    source: str
+
+@dataclass
+class LoopWriter(Writer):
+    "The lines of a compiled loop, and the types of its nodes and variables"
+    resolution: Resolution = field(default_factory=Resolution)
+    # The Python operators of the operators, or 'negate' for the unary operator
+    python_operators: dict[Any, str] = field(default_factory=dict)
+    # The depth of the frames of the blocks in the loop
+    depth: int = 0
+    types: dict[int, Kind] = field(default_factory=dict)
+    variable_types: dict[str, Kind] = field(default_factory=dict)
+    # The Python names of the variables declared in each block in the loop, by slot
+    blocks: list[dict[int, str]] = field(default_factory=list)
+    assigned: set[Location] = field(default_factory=set)
+
+    def translate(self, node: Expression) -> str:
+        (value, kind) = loop_expression(node, self)
+        self.types[id(node)] = kind
+        return value
+
+    def variable(self, location: Location) -> str:
+        (depth, slot) = location
+        if depth < self.depth:
+            return f'o{depth}_{slot}'
+        name = self.blocks[depth - self.depth].get(slot)
+        if name is None:
+            raise Unspecializable('Variable is read before it is declared')
+        return name
+
+class LoopTracer:
+    """Counts the iterations of each loop, and keeps the loops compiled for the types
+    of their variables, or None for types that they can't be compiled for.
+    The tables are keyed by the ids of the nodes, so a tracer traces only the program
+    it is first attached to, and keeps that program so that its ids are not reused."""
+    threshold: int
+    program: Expression | None
+    iterations: dict[int, int]
+    loops: dict[tuple[int, tuple[Kind, ...], bool], CompiledLoop | None]
+    # The variables from outside each loop that it uses, in the order of the types in the keys
+    outer: dict[int, list[Location]]
+    compiled_runs: int
+
+    def __init__(self, threshold: int = 1000) -> None:
+        self.threshold = threshold
+        self.program = None
+        self.iterations = {}
+        self.loops = {}
+        self.outer = {}
+        self.compiled_runs = 0
+
+    def attach(self, program: Expression) -> None:
+        if self.program is None:
+            self.program = program
+        elif self.program is not program:
+            raise Exception('The loop tracer already traces another program')
+
+    def specialize(self, node: WhileExpression, resolution: Resolution, frames: list[list[Any]],
+                   budget: Budget | None, python_operators: dict[Any, str]) -> CompiledLoop | None:
+        "Returns the loop compiled for the current values of its variables, compiling it the first time"
+        outer = self.outer.get(id(node))
+        if outer is None:
+            outer = self.outer[id(node)] = outer_variables(node, resolution, len(frames))
+        signature = tuple(type(frames[depth][slot]) for (depth, slot) in outer)
+        key = (id(node), signature, budget is not None)
+        if key not in self.loops:
+            try:
+                source = translate_loop(node, resolution, len(frames), dict(zip(outer, signature)),
+                                        budget is not None, python_operators)
+                namespace: dict[str, Any] = {}
+                exec(compile(source, '<loop>', 'exec'), namespace)
+                self.loops[key] = CompiledLoop(namespace['loop'], source)
+            except Unspecializable:
+                self.loops[key] = None
+        loop = self.loops[key]
+        if loop is not None:
+            self.compiled_runs += 1
+        return loop
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'threshold': self.threshold,
+            'hot_loops': sum(1 for count in self.iterations.values() if count >= self.threshold),
+            'compiled': sum(1 for loop in self.loops.values() if loop is not None),
+            'rejected': sum(1 for loop in self.loops.values() if loop is None),
+            'compiled_runs': self.compiled_runs,
+        }
+
+def outer_variables(node: Expression, resolution: Resolution, depth: int) -> list[Location]:
+    "The locations of the variables from frames below the depth that the node uses, in order"
+    found: set[Location] = set()
+    def visit(node: Expression) -> None:
+        location = resolution.variables.get(id(node))
+        if location is not None and location[0] < depth and not isinstance(node, Function):
+            found.add(location)
+        match node:
+            case BinaryOp():
+                visit(node.left)
+                visit(node.right)
+            case UnaryOp():
+                visit(node.right)
+            case IfExpression():
+                visit(node.cond)
+                visit(node.then_clause)
+                if node.else_clause is not None:
+                    visit(node.else_clause)
+            case WhileExpression():
+                visit(node.cond)
+                visit(node.body)
+            case VariableDeclaration():
+                visit(node.initializer)
+            case Block():
+                for exp in node.sequence:
+                    visit(exp)
+            case Function():
+                for arg in node.args:
+                    visit(arg)
+            case ReturnExpression():
+                visit(node.value)
+    visit(node)
+    return sorted(found)
+
+def translate_loop(node: WhileExpression, resolution: Resolution, depth: int, types: dict[Location, Kind],
+                   budgeted: bool, python_operators: dict[Any, str]) -> str:
+    """Translates a loop into the source code of a Python function 'loop(frames, budget, channel)'
+    for the given types of the variables from the frames below the depth"""
+    w = LoopWriter(set(), resolution=resolution, python_operators=python_operators, depth=depth, budgeted=budgeted)
+    for (location, kind) in types.items():
+        if kind not in kinds:
+            raise Unspecializable(f'Can not compile loops with {kind.__name__} variables')
+        w.variable_types[w.variable(location)] = kind
+    w.indent = '        '
+    w.translate(node)
+
+    lines = ['def loop(frames, budget, channel):']
+    lines.append('    _print_int = channel.print_int')
+    lines.append('    _print_bool = channel.print_bool')
+    lines.append('    _read_int = channel.read_int')
+    for frame_depth in sorted({location[0] for location in types}):
+        lines.append(f'    f{frame_depth} = frames[{frame_depth}]')
+    for location in types:
+        lines.append(f'    {w.variable(location)} = f{location[0]}[{location[1]}]')
+    if not w.assigned:
+        lines.extend(line[4:] for line in w.lines)
+    else:
+        # The variables are stored back even when the loop raises an error
+        lines.append('    try:')
+        lines.extend(w.lines)
+        lines.append('    finally:')
+        for location in sorted(w.assigned):
+            lines.append(f'        f{location[0]}[{location[1]}] = {w.variable(location)}')
+    return '\n'.join(lines) + '\n'
+
+def loop_expression(node: Expression, w: LoopWriter) -> tuple[str, Kind]:
+    "Like 'python_backend.expression', with the semantics of 'interpreter.evaluate'. Returns the type too."
+    match node:
+        case Literal():
+            return (str(node.value), type(node.value))
+
+        case Identifier():
+            location = w.resolution.variables.get(id(node))
+            if location is None:
+                raise Unspecializable(f'Variable {node.name} is not defined')
+            name = w.variable(location)
+            return (name, w.variable_types[name])
+
+        case BinaryOp():
+            if isinstance(node.left, Identifier) and node.op == '=':
+                location = w.resolution.variables.get(id(node))
+                if location is None:
+                    raise Unspecializable(f'Variable {node.left.name} is not defined')
+                value = w.translate(node.right)
+                name = w.variable(location)
+                if w.types[id(node.right)] != w.variable_types[name]:
+                    raise Unspecializable(f'Variable {node.left.name} changes its type')
+                w.emit(f'{name} = {value}')
+                if location[0] < w.depth:
+                    w.assigned.add(location)
+                return ('None', NoneType)
+
+            operator = w.resolution.operators.get(id(node))
+            if operator is None:
+                raise Unspecializable(f'Unsupported operator "{node.op}"')
+            if node.op == 'or' or node.op == 'and':
+                left = w.translate(node.left)
+                (lines, right) = branch(node.right, w)
+                if w.types[id(node.left)] != bool or w.types[id(node.right)] != bool:
+                    raise Unspecializable(f'Operator {node.op} on values that are not Bool')
+                if not lines:
+                    return (f'({left} {node.op} {right})', bool)
+                result = w.temporary()
+                w.emit(f'{result} = {left}')
+                w.emit(f'if {result}:' if node.op == 'and' else f'if not {result}:')
+                w.lines.extend(lines)
+                w.emit(f'    {result} = {right}')
+                return (result, bool)
+
+            python = w.python_operators.get(operator)
+            if python is None or python == 'negate':
+                raise Unspecializable(f'Operator {node.op} is not predefined')
+            (a, b) = operands([node.left, node.right], w)
+            if NoneType in (w.types[id(node.left)], w.types[id(node.right)]):
+                raise Unspecializable(f'Operator {node.op} on Unit')
+            return (f'({a} {python} {b})', bool if python in ['<', '>', '==', '<=', '>=', '!='] else int)
+
+        case UnaryOp():
+            operator = w.resolution.operators.get(id(node))
+            if operator is None or w.python_operators.get(operator) != 'negate':
+                raise Unspecializable('Unary operator is not predefined')
+            operand = w.translate(node.right)
+            # Like the predefined operator, which doesn't depend on the operator of the node
+            if w.types[id(node.right)] == bool:
+                return (f'(not {operand})', bool)
+            if w.types[id(node.right)] == int:
+                return (f'(-{operand})', int)
+            raise Unspecializable('Unary operator on Unit')
+
+        case IfExpression():
+            cond = w.translate(node.cond)
+            (then_lines, then_value) = branch(node.then_clause, w)
+            if node.else_clause is None:
+                w.emit(f'if {cond}:')
+                w.lines.extend(then_lines)
+                w.emit(f'    {statement(then_value)}')
+                return ('None', NoneType)
+            (else_lines, else_value) = branch(node.else_clause, w)
+            kind = w.types[id(node.then_clause)]
+            if w.types[id(node.else_clause)] != kind:
+                raise Unspecializable('The clauses of an if have different types')
+            if not then_lines and not else_lines:
+                return (f'({then_value} if {cond} else {else_value})', kind)
+            result = w.temporary()
+            w.emit(f'if {cond}:')
+            w.lines.extend(then_lines)
+            w.emit(f'    {result} = {then_value}')
+            w.emit('else:')
+            w.lines.extend(else_lines)
+            w.emit(f'    {result} = {else_value}')
+            return (result, kind)
+
+        case WhileExpression():
+            (cond_lines, cond) = branch(node.cond, w)
+            if w.types[id(node.cond)] != bool:
+                cond = f'({cond} == True)'
+            (body_lines, body_value) = branch(node.body, w)
+            if cond_lines:
+                w.emit('while True:')
+                w.lines.extend(cond_lines)
+                w.emit(f'    if not {cond}:')
+                w.emit('        break')
+            else:
+                w.emit(f'while {cond}:')
+            if w.budgeted:
+                w.emit('    budget.remaining -= 1')
+                w.emit('    if budget.remaining == 0:')
+                w.emit('        budget.check()')
+            w.lines.extend(body_lines)
+            w.emit(f'    {statement(body_value)}')
+            return ('None', NoneType)
+
+        case VariableDeclaration():
+            (depth, slot) = w.resolution.variables[id(node)]
+            if depth < w.depth:
+                raise Unspecializable('Variable is declared outside of the blocks of the loop')
+            value = w.translate(node.initializer)
+            w.temporaries += 1
+            name = f'l{w.temporaries}'
+            w.blocks[depth - w.depth][slot] = name
+            w.variable_types[name] = w.types[id(node.initializer)]
+            w.emit(f'{name} = {value}')
+            return ('None', NoneType)
+
+        case Block():
+            w.blocks.append({})
+            (value, kind) = ('None', NoneType)
+            for (i, exp) in enumerate(node.sequence):
+                value = w.translate(exp)
+                kind = w.types[id(exp)]
+                if i < len(node.sequence) - 1 and not trivial.fullmatch(value):
+                    w.emit(value)
+            w.blocks.pop()
+            return (value, kind)
+
+        case Function():
+            if node.name == 'read_int' and not node.args:
+                return ('_read_int()', int)
+            if node.name in ['print_int', 'print_bool'] and len(node.args) == 1:
+                value = w.translate(node.args[0])
+                if node.name == 'print_int':
+                    w.emit(f'_print_int({value})')
+                elif w.types[id(node.args[0])] == bool:
+                    w.emit(f'_print_bool({value})')
+                else:
+                    w.emit(f'_print_bool({value} == True)')
+                return ('None', NoneType)
+            raise Unspecializable(f'Can not compile calls to {node.name}')
+
+        case ReturnExpression():
+            value = w.translate(node.value)
+            return (value, w.types[id(node.value)])
+
+        case _:
+            raise Unspecializable(f'Can not compile {type(node).__name__}')
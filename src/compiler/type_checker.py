@@ -1,168 +1,308 @@
 
+from dataclasses import dataclass
+from typing import Callable, Sequence, TypeVar
+
+from compiler.models.arena import *
 from compiler.models.expressions import *
 from compiler.models.types import *
 from compiler.models.symbol_table import *
+from compiler.resolver import Resolution, resolve, resolve_arena
 
 # TODO: own exception types
-# TODO: table to track types of variables
 # TODO: add a Type to each AST node
-def typecheck(exp: Expression, variables: SymTab = SymTab({})) -> Type:
+# Shared by all calls that don't pass a symbol table
+global_variables = SymTab({})
+
+@dataclass
+class Bindings:
+    """The types of the variables and functions of a resolved module, by the ids of their declarations.
+    Assignments change the type of the declaration they assign."""
+    resolution: Resolution
+    types: dict[int, Type]
+
+# A node of either form of the AST: an Expression, or the index of a node in an arena.
+# The rules of each kind of node are written once for both, and the visitors of the two forms call them.
+Node = TypeVar('Node')
+
+def typecheck(exp: Expression | Arena, variables: SymTab = global_variables, resolution: Resolution | None = None) -> Type:
+    """Checks a module or an expression, and stores the type of every node in it.
+    The names of the symbol table and its parents are global variables of the types they map to.
+    The functions of a module are added to the symbol table.
+    A resolution of the module, from 'resolve' with the names of the symbol table among
+    its global symbols, can be given to reuse it, for example for generating IR.
+    An arena is checked in place by its indices, with a resolution from 'resolve_arena'."""
+    if isinstance(exp, Arena):
+        return typecheck_arena(exp, variables, resolution)
+    functions: list[FunctionDeclaration] = []
     if isinstance(exp, Module):
         node = exp.sequence[0]
         # first collect all functions for recursive calls
-        for i in range(1, len(exp.sequence)):
-            fun = exp.sequence[i]
-            if isinstance(fun, FunctionDeclaration):
-                variables.variables[fun.name] = fun.type
-        # then check them
-        for i in range(1, len(exp.sequence)):
-            fun = exp.sequence[i]
-            if isinstance(fun, FunctionDeclaration):
-                temp = variables
-                for arg in fun.args:
-                    temp.variables[arg.get_name()] = arg.type
-                check_type(fun, variables)
+        functions = [fun for fun in exp.sequence[1:] if isinstance(fun, FunctionDeclaration)]
+        for fun in functions:
+            variables.variables[fun.name] = fun.type
     else:
         node = exp
 
-    node.type = check_type(node, variables)
+    global_types = all_variables(variables)
+    if resolution is None:
+        resolution = resolve(exp, global_types)
+    bindings = global_bindings(resolution, global_types)
+
+    # then check them
+    for fun in functions:
+        check_type(fun, bindings)
+
+    node.type = check_type(node, bindings)
     return node.type
 
-def check_type(node: Expression, variables: SymTab = SymTab({})) -> Type:
+def typecheck_arena(arena: Arena, variables: SymTab, resolution: Resolution | None) -> Type:
+    "Like 'typecheck' for an arena, storing the types in its 'types' column"
+    kinds = arena.kinds
+    functions: list[int] = []
+    node = 0
+    if kinds[0] == NODE_MODULE:
+        (node, *rest) = arena.children(0)
+        functions = [fun for fun in rest if kinds[fun] == NODE_FUNCTION_DECLARATION]
+        for fun in functions:
+            variables.variables[arena.name(fun)] = arena.type(fun)
+
+    global_types = all_variables(variables)
+    if resolution is None:
+        resolution = resolve_arena(arena, global_types)
+    bindings = global_bindings(resolution, global_types)
+
+    # then check them
+    for fun in functions:
+        check_arena_type(arena, fun, bindings)
+
+    return check_arena(arena, node, bindings)
+
+def check_arena(arena: Arena, i: int, bindings: Bindings) -> Type:
+    "Checks the node at the index, and stores its type in the arena"
+    t = check_arena_type(arena, i, bindings)
+    arena.set_type(i, t)
+    return t
+
+def check_arena_type(arena: Arena, i: int, bindings: Bindings) -> Type:
+    kinds = arena.kinds
+    kind = kinds[i]
+    children = arena.children(i)
+    if kind == NODE_LITERAL:
+        return literal_type(arena.literal(i))
+    elif kind == NODE_IDENTIFIER:
+        return variable_type(i, arena.name(i), bindings)
+    elif kind == NODE_BINARY_OP:
+        (left, right) = children
+        if kinds[left] == NODE_IDENTIFIER and arena.op(i) == '=':
+            return check_assignment(i, arena.name(left), right, bindings, lambda c: check_arena(arena, c, bindings))
+        return binary_op_type(arena.op(i), check_arena(arena, left, bindings), check_arena(arena, right, bindings))
+    elif kind == NODE_UNARY_OP:
+        return unary_op_type(arena.op(i), check_arena(arena, children[0], bindings))
+    elif kind == NODE_IF:
+        return check_if(children[0], children[1], children[2] if len(children) > 2 else None,
+                        lambda c: check_arena(arena, c, bindings))
+    elif kind == NODE_VARIABLE_DECLARATION:
+        bindings.types[bindings.resolution.bindings[i]] = check_arena(arena, children[0], bindings)
+        return Unit
+    elif kind == NODE_WHILE:
+        (cond, body) = children
+        if kinds[body] == NODE_BLOCK:
+            body = arena.children(body)[-1]
+        return check_while(cond, body, lambda c: check_arena(arena, c, bindings), lambda c: from_arena(arena, c))
+    elif kind == NODE_FUNCTION:
+        return check_call(i, arena.name(i), children, bindings,
+                          lambda c: check_arena(arena, c, bindings), lambda c: from_arena(arena, c))
+    elif kind == NODE_BLOCK:
+        for c in children[:-1]:
+            check_arena(arena, c, bindings)
+        return check_arena(arena, children[-1], bindings)
+    elif kind == NODE_FUNCTION_DECLARATION:
+        (*args, body) = children
+        for arg in args:
+            bindings.types[bindings.resolution.bindings[arg]] = arena.type(arg)
+        return check_function_body(arena.name(i), arena.type(i), body, lambda c: check_arena(arena, c, bindings))
+    elif kind == NODE_RETURN:
+        return check_arena(arena, children[0], bindings)
+    else:
+        raise Exception(f'Unknown node kind: {kind}')
+
+def all_variables(variables: SymTab) -> dict[str, Type]:
+    "The types of the names of the symbol table and its parents"
+    global_types: dict[str, Type] = dict(variables.variables)
+    parent = variables
+    while isinstance(parent, HierarchicalSymTab):
+        parent = parent.parent
+        global_types = parent.variables | global_types
+    return global_types
+
+def global_bindings(resolution: Resolution, global_types: dict[str, Type]) -> Bindings:
+    # The global symbols are declared first, so their declarations are their slots
+    return Bindings(resolution, {
+        slot: global_types[name] for (name, slot) in resolution.global_slots.items() if name in global_types})
+
+def check(node: Expression, bindings: Bindings) -> Type:
+    "Checks the node, and stores its type in it"
+    node.type = check_type(node, bindings)
+    return node.type
+
+def check_type(node: Expression, bindings: Bindings) -> Type:
     match node:
         case Literal():
-            if isinstance(node.value, bool):
-                return Bool
-            elif isinstance(node.value, int):
-                return Int
-            elif node.value is None:
-                return Unit
-            else:
-                raise Exception(f"Don't know the type of literal: {node.value}")
-            
+            return literal_type(node.value)
+
         case Identifier():
-            if node.name in variables.variables:
-                return variables.variables[node.name]
-            elif isinstance(variables, HierarchicalSymTab):
-                return typecheck(node, variables.parent)
-            else:
-                raise Exception(f"Variable {node.name} is not defined")
-            
+            return variable_type(id(node), node.name, bindings)
+
         case BinaryOp():
             if isinstance(node.left, Identifier) and node.op == '=':
-                if isinstance(variables.variables, dict) and node.left.name in variables.variables:
-                    variables.variables[node.left.name] = typecheck(node.right, variables)
-                    return Unit
-                elif isinstance(variables, HierarchicalSymTab):
-                    return typecheck(node, variables.parent)
-                else:
-                    raise Exception(f'Asserting unknown variable {node.left.name}')
-
-            t1 = typecheck(node.left, variables)
-            t2 = typecheck(node.right, variables)
-            if node.op in ['+', '-', '*', '/', '%']:
-                if t1 is not Int or t2 is not Int:
-                    raise Exception(f'Operator {node.op} expects two Ints, got {t1} and {t2}')
-                return Int
-            elif node.op in ['<', '>', '>=', '<=']:
-                if t1 is not Int or t2 is not Int:
-                    raise Exception(f'Operator {node.op} expects two Ints, got {t1} and {t2}')
-                return Bool
-            elif node.op in ['==', '!=']:
-                if t1 is not t2:
-                    raise Exception(f'Operator {node.op} expects the same types, got {t1} and {t2}')
-                return Bool
-            elif node.op in ['and', 'or']:
-                if t1 is not Bool or t2 is not Bool:
-                    raise Exception(f'Operator {node.op} expects two Booleans, got {t1} and {t2}')
-                return Bool
-            else:
-                raise Exception(f'Unknown operator: {node.op}')
-            
+                return check_assignment(id(node), node.left.name, node.right, bindings, lambda n: check(n, bindings))
+            return binary_op_type(node.op, check(node.left, bindings), check(node.right, bindings))
+
         case UnaryOp():
-            t1 = typecheck(node.right, variables)
-            if node.op == '-':
-                if t1 is not Int:
-                    raise Exception(f'Operator {node.op} expects Int')
-                return Int
-            elif node.op == 'not':
-                if t1 is not Bool:
-                    raise Exception(f'Operator {node.op} expects Bool')
-                return Bool
-            else:
-                raise Exception(f'Unknown unary operator: {node.op}')
-            
+            return unary_op_type(node.op, check(node.right, bindings))
+
         case IfExpression():
-            t1 = typecheck(node.cond, variables)
-            if t1 is not Bool:
-                raise Exception(f"'if' condition was {t1}")
-            t2 = typecheck(node.then_clause, variables)
-            if node.else_clause is None:
-                return Unit
-            t3 = typecheck(node.else_clause, variables)
-            if t2 != t3:
-                raise Exception(f"'then' and 'else' had different types: {t2} and {t3}")
-            return t2
-        
+            return check_if(node.cond, node.then_clause, node.else_clause, lambda n: check(n, bindings))
+
         case VariableDeclaration():
-            variables.variables[node.name] = typecheck(node.initializer, variables)
+            bindings.types[bindings.resolution.bindings[id(node)]] = check(node.initializer, bindings)
             return Unit
-        
+
         case WhileExpression():
-            t1 = typecheck(node.cond, variables)
-            if t1 is not Bool:
-                raise Exception(f"'while' condition {node.cond} was {t1}")
             retval = node.body
             if isinstance(retval, Block):
                 retval = retval.sequence[len(retval.sequence)-1]
-            t2 = typecheck(retval, variables)
-            if t2 is not Unit:
-                raise Exception(f"'while' loop return value was {t2}")
-            return Unit
-        
+            return check_while(node.cond, retval, lambda n: check(n, bindings), lambda n: n)
+
         case Function():
-            match node.name:
-                case 'print_int':
-                    if len(node.args) == 1:
-                        t1 = typecheck(node.args[0], variables)
-                        if t1 is not Int:
-                            raise Exception(f"Function {node.name} argument was {t1}")
-                        return Unit
-                    raise Exception(f'Unsupported arguments for the print_int function, {node.args}')
-                case 'print_bool':
-                    if len(node.args) == 1:
-                        t1 = typecheck(node.args[0], variables)
-                        if t1 is not Bool:
-                            raise Exception(f"Function {node.name} argument was {t1}")
-                        return Unit
-                    raise Exception(f'Unsupported arguments for the print_bool function, {node.args}')
-                case 'read_int':
-                    if len(node.args) != 0:
-                        raise Exception(f'Function {node.name} expects 0 parameters, got {len(node.args)}')
-                    return Int
-                case _:
-                    root_sym = variables
-                    while isinstance(root_sym, HierarchicalSymTab):
-                        root_sym = root_sym.parent
-                    if node.name in root_sym.variables:
-                        return root_sym.variables[node.name]
-                    else:
-                        raise Exception(f'Undeclared function {node.name}')
-                        
+            return check_call(id(node), node.name, node.args, bindings, lambda n: check(n, bindings), lambda n: n)
+
         case Block():
             for i in range(0, len(node.sequence)-1):
-                typecheck(node.sequence[i], variables)
-            return typecheck(node.sequence[len(node.sequence)-1], variables)
-        
+                check(node.sequence[i], bindings)
+            return check(node.sequence[len(node.sequence)-1], bindings)
+
         case FunctionDeclaration():
-            body_type = typecheck(node.body, variables)
-            if body_type != node.type:
-                raise Exception(f'Function {node.name} expects to return type {node.type}, but returned {body_type}')
-            return body_type
-        
+            for arg in node.args:
+                bindings.types[bindings.resolution.bindings[id(arg)]] = arg.type
+            return check_function_body(node.name, node.type, node.body, lambda n: check(n, bindings))
+
         case ReturnExpression():
-            return typecheck(node.value)
-        
+            return check(node.value, bindings)
+
         case _:
             raise Exception(f'Unsupported AST node: {node}')
-        
\ No newline at end of file
+
+def literal_type(value: object) -> Type:
+    if isinstance(value, bool):
+        return Bool
+    elif isinstance(value, int):
+        return Int
+    elif value is None:
+        return Unit
+    else:
+        raise Exception(f"Don't know the type of literal: {value}")
+
+def variable_type(key: int, name: str, bindings: Bindings) -> Type:
+    "The type of the declaration that the node with the key is bound to"
+    declaration = bindings.resolution.bindings.get(key)
+    if declaration is not None and declaration in bindings.types:
+        return bindings.types[declaration]
+    else:
+        raise Exception(f"Variable {name} is not defined")
+
+def check_assignment(key: int, name: str, right: Node, bindings: Bindings, check: Callable[[Node], Type]) -> Type:
+    declaration = bindings.resolution.bindings.get(key)
+    if declaration is not None and declaration in bindings.types:
+        bindings.types[declaration] = check(right)
+        return Unit
+    else:
+        raise Exception(f'Asserting unknown variable {name}')
+
+def binary_op_type(op: str, t1: Type, t2: Type) -> Type:
+    if op in ['+', '-', '*', '/', '%']:
+        if t1 is not Int or t2 is not Int:
+            raise Exception(f'Operator {op} expects two Ints, got {t1} and {t2}')
+        return Int
+    elif op in ['<', '>', '>=', '<=']:
+        if t1 is not Int or t2 is not Int:
+            raise Exception(f'Operator {op} expects two Ints, got {t1} and {t2}')
+        return Bool
+    elif op in ['==', '!=']:
+        if t1 is not t2:
+            raise Exception(f'Operator {op} expects the same types, got {t1} and {t2}')
+        return Bool
+    elif op in ['and', 'or']:
+        if t1 is not Bool or t2 is not Bool:
+            raise Exception(f'Operator {op} expects two Booleans, got {t1} and {t2}')
+        return Bool
+    else:
+        raise Exception(f'Unknown operator: {op}')
+
+def unary_op_type(op: str, t1: Type) -> Type:
+    if op == '-':
+        if t1 is not Int:
+            raise Exception(f'Operator {op} expects Int')
+        return Int
+    elif op == 'not':
+        if t1 is not Bool:
+            raise Exception(f'Operator {op} expects Bool')
+        return Bool
+    else:
+        raise Exception(f'Unknown unary operator: {op}')
+
+def check_if(cond: Node, then_clause: Node, else_clause: Node | None, check: Callable[[Node], Type]) -> Type:
+    t1 = check(cond)
+    if t1 is not Bool:
+        raise Exception(f"'if' condition was {t1}")
+    t2 = check(then_clause)
+    if else_clause is None:
+        return Unit
+    t3 = check(else_clause)
+    if t2 != t3:
+        raise Exception(f"'then' and 'else' had different types: {t2} and {t3}")
+    return t2
+
+def check_while(cond: Node, retval: Node, check: Callable[[Node], Type], describe: Callable[[Node], Expression]) -> Type:
+    "Checks a loop, of which only the value of the body, 'retval', is checked"
+    t1 = check(cond)
+    if t1 is not Bool:
+        raise Exception(f"'while' condition {describe(cond)} was {t1}")
+    t2 = check(retval)
+    if t2 is not Unit:
+        raise Exception(f"'while' loop return value was {t2}")
+    return Unit
+
+def check_call(key: int, name: str, args: Sequence[Node], bindings: Bindings,
+               check: Callable[[Node], Type], describe: Callable[[Node], Expression]) -> Type:
+    match name:
+        case 'print_int':
+            if len(args) == 1:
+                t1 = check(args[0])
+                if t1 is not Int:
+                    raise Exception(f"Function {name} argument was {t1}")
+                return Unit
+            raise Exception(f'Unsupported arguments for the print_int function, {[describe(arg) for arg in args]}')
+        case 'print_bool':
+            if len(args) == 1:
+                t1 = check(args[0])
+                if t1 is not Bool:
+                    raise Exception(f"Function {name} argument was {t1}")
+                return Unit
+            raise Exception(f'Unsupported arguments for the print_bool function, {[describe(arg) for arg in args]}')
+        case 'read_int':
+            if len(args) != 0:
+                raise Exception(f'Function {name} expects 0 parameters, got {len(args)}')
+            return Int
+        case _:
+            declaration = bindings.resolution.bindings.get(key)
+            if declaration is not None and declaration in bindings.types:
+                return bindings.types[declaration]
+            else:
+                raise Exception(f'Undeclared function {name}')
+
+def check_function_body(name: str, return_type: Type, body: Node, check: Callable[[Node], Type]) -> Type:
+    body_type = check(body)
+    if body_type != return_type:
+        raise Exception(f'Function {name} expects to return type {return_type}, but returned {body_type}')
+    return body_type
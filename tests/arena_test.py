@@ -0,0 +1,140 @@
+from multiprocessing import get_context
+import pickle
+
+import compiler.ir_generator
+from compiler.ir_generator import generate_ir
+from compiler.models.arena import *
+from compiler.models.expressions import *
+from compiler.models.symbol_table import SymTab
+from compiler.models.types import Bool, Int, Type, Unit
+from compiler.parser import parse
+from compiler.resolver import resolve_arena
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+from tests.end_to_end_test import find_test_cases
+
+code = '''
+fun square(x: Int): Int {
+    return x * x;
+}
+var a = square(3);
+var b: Bool = not (a > 5) or a == 9;
+if b then { a = -a } else a = 0;
+while a < 100 do a = a * 2;
+{ a; if true then 1 }
+print_int(a)
+'''
+
+def test_arena_round_trip() -> None:
+    module = parse(tokenize(code))
+    arena = to_arena(module)
+    assert from_arena(arena) == module
+    assert arena.kinds[0] == NODE_MODULE
+    assert [arena.kinds[i] for i in arena.children(0)] == [NODE_BLOCK, NODE_FUNCTION_DECLARATION]
+    square = arena.children(0)[1]
+    assert arena.name(square) == 'square' and arena.type(square) == Int
+    assert from_arena(arena, square) == module.sequence[1]
+
+def test_arena_pickle_and_shared_memory() -> None:
+    module = parse(tokenize(code))
+    arena = to_arena(module)
+    assert from_arena(pickle.loads(pickle.dumps(arena))) == module
+
+    memory = share_arena(arena)
+    try:
+        shared = attach_arena(memory)
+        assert isinstance(shared.kinds, memoryview)
+        assert from_arena(shared) == module
+        assert from_arena(pickle.loads(pickle.dumps(shared))) == module
+        del shared
+    finally:
+        memory.close()
+        memory.unlink()
+
+def typecheck_in_process(name: str) -> list[int]:
+    memory = SharedMemory(name)
+    arena = attach_arena(memory)
+    typecheck(arena)
+    types = list(arena.types)
+    del arena
+    memory.close()
+    return types
+
+def test_arena_shared_with_worker_process() -> None:
+    arena = to_arena(parse(tokenize(code)))
+    memory = share_arena(arena)
+    try:
+        with get_context('spawn').Pool(1) as pool:
+            types = pool.apply(typecheck_in_process, (memory.name,))
+        # The worker's types were written to the shared memory
+        shared = attach_arena(memory)
+        assert list(shared.types) == types
+        assert typecheck(arena) == Unit and list(arena.types) == types
+        del shared
+    finally:
+        memory.close()
+        memory.unlink()
+
+def test_typecheck_arena() -> None:
+    module = parse(tokenize(code))
+    arena = to_arena(module)
+    assert typecheck(arena) == typecheck(module) == Unit
+    assert from_arena(arena) == module
+
+    arena = to_arena(parse(tokenize('1 + true')))
+    failed = False
+    try:
+        typecheck(arena)
+    except Exception:
+        failed = True
+    assert failed
+
+def generate(tree: Expression | Arena) -> str:
+    compiler.ir_generator.next_var_number = 1
+    compiler.ir_generator.end_label_number = 1
+    ir = generate_ir(tree)
+    return '\n'.join(f'{name}: {", ".join(str(i) for i in instructions)}' for (name, instructions) in ir.items())
+
+def test_generate_ir_from_arena() -> None:
+    for test_case in find_test_cases() + [None]:
+        module = parse(tokenize(test_case.code if test_case is not None else code))
+        typecheck(module)
+        assert generate(to_arena(module)) == generate(module)
+
+def test_arena_and_object_trees_agree() -> None:
+    for program in [
+        code,
+        '{ var y = 1; } y',
+        'var a = 1; { var b = a + 1; { var c = b * 3; a = c + b } } a',
+        'fun f(x: Int): Int { x } fun g(): Int { x } g()',
+        'fun f(x: Int): Int { return x + 1; } var x = true; f(2)',
+        'fun f(a: Int, b: Bool): Int { if b then a else -a } var x = 1; while x < 3 do { x = x + 1; }; if not (x > 3) then f(x, x > 2) else 0',
+        'while true do { 1 }',
+        'print_int(1, 2)',
+        'var x = 1; x = true; x',
+    ]:
+        module = parse(tokenize(program))
+        arena = to_arena(module)
+        trees: list[Expression | Arena] = [module, arena]
+        results: list[Type | str] = []
+        for tree in trees:
+            try:
+                results.append(typecheck(tree, SymTab({})))
+            except Exception as e:
+                results.append(str(e))
+        assert results[0] == results[1], program
+        if isinstance(results[0], Type):
+            assert from_arena(arena) == module
+            assert generate(arena) == generate(module), program
+
+def test_arena_passes_read_the_arena_by_index() -> None:
+    arena = to_arena(parse(tokenize(code)))
+    resolution = resolve_arena(arena, {})
+    assert all(0 <= i < len(arena) for i in resolution.bindings)
+    square = arena.children(0)[1]
+    (x, body) = arena.children(square)
+    assert resolution.bindings[x] == resolution.global_slots['square'] + 1
+    assert typecheck(arena, SymTab({}), resolution) == Unit
+    assert arena.type(arena.children(0)[0]) == Unit
+    assert [arena.type(i) for i in arena.children(body)][:1] == [Int]
+    assert 'main' in generate_ir(arena, resolution=resolution)
@@ -0,0 +1,138 @@
+import random
+
+from pytest import importorskip, raises
+
+from compiler.batch import BatchResult, interpret_lane, run_batch
+from compiler.budget import Budget, BudgetExceeded
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+
+importorskip('numpy')
+
+def check(code: str, inputs: list[list[int]]) -> BatchResult:
+    "Runs the code in a batch, and checks that every lane gets the value and output that 'interpret' gives"
+    module = parse(tokenize(code))
+    result = run_batch(module, inputs)
+    assert list(zip(result.values, result.outputs)) == [interpret_lane(module, lane) for lane in inputs]
+    return result
+
+def test_batch_runs_straight_line_code() -> None:
+    result = check('''
+        var a = read_int();
+        var b = read_int();
+        var c = a * b - a / 3 + b % 7;
+        c < 100 or a == b
+    ''', [[random.randint(-1000, 1000), random.randint(-1000, 1000)] for _ in range(50)] + [[5, 5]])
+    assert result.scalar_lanes == []
+
+def test_batch_runs_divergent_branches_and_loops() -> None:
+    result = check('''
+        var n = read_int();
+        var steps = 0;
+        while n > 1 do {
+            if n % 2 == 0 then n = n / 2 else n = 3 * n + 1;
+            steps = steps + 1;
+        }
+        steps
+    ''', [[n] for n in range(1, 200)])
+    assert result.values[26] == 111
+    assert result.scalar_lanes == []
+
+def test_batch_runs_recursive_functions() -> None:
+    check('''
+        fun fib(n: Int): Int {
+            if n < 2 then n else fib(n - 1) + fib(n - 2)
+        }
+        fun pick(a: Int, b: Int): Bool { a > b and fib(a) > b }
+        var n = read_int();
+        if pick(n, 10) then fib(n) else 0 - n
+    ''', [[n] for n in range(15)])
+
+def test_batch_keeps_values_of_lanes_that_skip_assignments() -> None:
+    check('''
+        var x = read_int();
+        var y = 0;
+        if x > 0 then { y = x; var z = y * 2; y = z } else y = 0 - 1;
+        while x > 0 and y > 3 do { x = x - 1; y = y - 3 }
+        x * 1000 + y
+    ''', [[x] for x in range(-3, 20)])
+
+def test_batch_prints_in_lanes() -> None:
+    result = check('''
+        var n = read_int();
+        while n > 0 do {
+            if n % 2 == 0 then print_int(n) else print_bool(n > 4);
+            n = n - 3;
+        }
+        n
+    ''', [[n] for n in range(-1, 9)])
+    assert result.outputs[9] == '8\ntrue\n2\n'
+    assert result.scalar_lanes == []
+
+def test_batch_runs_failing_lanes_one_by_one() -> None:
+    result = check('''
+        var a = read_int();
+        var b = read_int();
+        a / b + a * a
+    ''', [[10, 2], [10, 3], [3037000500, 1], [7, 1]])
+    assert result.scalar_lanes == [2]
+
+def test_batch_fails_lanes_whose_products_leave_64_bits() -> None:
+    top = 2**63 - 1
+    bottom = -2**63
+    lanes = [
+        [3037000499, 3037000499], [3037000500, 3037000500], [-3037000499, 3037000499],
+        [top, 1], [top, -1], [bottom, 1], [bottom, -1], [-1, bottom], [0, bottom],
+        [2**32, 2**31 - 1], [2**32, 2**31], [-2**32, 2**31], [-2**32, 2**31 + 1],
+        [4611686018427387904, 2], [4611686018427387904, -2], [-4611686018427387904, 2], [3, 3074457345618258603],
+    ]
+    result = check('read_int() * read_int()', lanes)
+    assert result.scalar_lanes == [1, 6, 7, 10, 12, 13, 16]
+
+def test_batch_falls_back_to_the_interpreter() -> None:
+    module = parse(tokenize('var n = read_int(); n / (n - 2)'))
+    try:
+        run_batch(module, [[4], [2], [3]])
+        assert False
+    except ZeroDivisionError:
+        pass
+
+    result = check('''
+        fun f(x: Int): Int { x }
+        var g = f;
+        read_int() + 1
+    ''', [[1], [2]])
+    assert result.scalar_lanes == [0, 1]
+
+def test_batch_runs_out_of_inputs_like_the_interpreter() -> None:
+    module = parse(tokenize('var a = read_int(); if a > 0 then a + read_int() else a'))
+    assert run_batch(module, [[-1], [0], [-5]]).values == [-1, 0, -5]
+    try:
+        run_batch(module, [[-1], [1]])
+        assert False
+    except EOFError:
+        pass
+
+def test_batch_spends_fuel_once_for_all_lanes() -> None:
+    module = parse(tokenize('''
+        fun double(x: Int): Int { x * 2 }
+        var n = read_int();
+        var i = 0;
+        var total = 0;
+        while i < n do {
+            total = total + double(i);
+            i = i + 1;
+        }
+        total
+    '''))
+    budget = Budget(fuel=100)
+    result = run_batch(module, [[3], [10], [5]], budget)
+    assert result.values == [6, 90, 20]
+    # 10 iterations and 10 calls, however many lanes take them
+    assert budget.used() == 20
+
+    with raises(BudgetExceeded, match='Out of fuel'):
+        run_batch(parse(tokenize('while true do {}')), [[1], [2]], Budget(fuel=50))
+    # Lanes that are run again by 'interpret' are limited too
+    with raises(BudgetExceeded, match='Out of fuel'):
+        run_batch(parse(tokenize('fun f(x: Int): Int { x } var g = f; while true do {}')), [[1]], Budget(fuel=50))
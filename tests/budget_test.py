@@ -0,0 +1,88 @@
+from typing import Callable
+
+from pytest import CaptureFixture
+
+from compiler.budget import Budget, BudgetExceeded
+from compiler.bytecode import lower_ir, run_program
+from compiler.closure_compiler import compile_module
+from compiler.interpreter import Value, interpret
+from compiler.ir_generator import generate_ir
+from compiler.ir_interpreter import run_ir
+from compiler.parser import parse
+from compiler.python_backend import run_code, translate
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+
+def engines(code: str) -> dict[str, Callable[[Budget], Value]]:
+    "Runs the code with a budget on each engine"
+    module = parse(tokenize(code))
+    typecheck(module)
+    ir = generate_ir(module)
+    python_code = compile(translate(module, budgeted=True), '<program>', 'exec')
+    return {
+        'interpreter': lambda budget: interpret(module, budget=budget),
+        'closure compiler': lambda budget: compile_module(module, budget)(),
+        'bytecode VM': lambda budget: run_program(lower_ir(ir), budget),
+        'IR interpreter': lambda budget: run_ir(ir, budget),
+        'Python backend': lambda budget: run_code(python_code, budget=budget),
+    }
+
+def raised(run: Callable[[Budget], Value], budget: Budget) -> BudgetExceeded:
+    try:
+        run(budget)
+    except BudgetExceeded as e:
+        return e
+    raise Exception('Budget was not exceeded')
+
+def test_budget_spends_the_same_fuel_in_every_engine(capsys: CaptureFixture[str]) -> None:
+    code = '''
+        fun triangle(n: Int): Int {
+            if n == 0 then 0 else n + triangle(n - 1)
+        }
+        var i = 0;
+        var total = 0;
+        while i < 10 do {
+            total = total + triangle(i);
+            i = i + 1;
+        }
+        total
+    '''
+    for (name, run) in engines(code).items():
+        budget = Budget(fuel=1000, check_interval=7)
+        run(budget)
+        # 10 iterations, 10 calls from the loop and 45 recursive calls
+        assert budget.used() == 65, name
+
+def test_budget_stops_infinite_loops() -> None:
+    for (name, run) in engines('var x = 0; while true do { x = x + 1 }').items():
+        e = raised(run, Budget(fuel=2500))
+        assert str(e) == 'Out of fuel: used all 2500 units', name
+        assert e.stats['fuel'] == 2500
+        assert e.stats['fuel_used'] == 2501
+
+def test_budget_stops_infinite_recursion() -> None:
+    code = '''
+        fun forever(n: Int): Int { forever(n + 1) }
+        forever(0)
+    '''
+    for (name, run) in engines(code).items():
+        e = raised(run, Budget(fuel=100))
+        assert e.stats['fuel_used'] == 101, name
+
+def test_budget_stops_at_the_deadline() -> None:
+    for (name, run) in engines('var x = 0; while true do { x = x + 1 }').items():
+        e = raised(run, Budget(timeout=0.02))
+        assert str(e) == 'Out of time: ran over 0.02 seconds', name
+        elapsed = e.stats['elapsed']
+        fuel_used = e.stats['fuel_used']
+        assert elapsed is not None and elapsed > 0.02
+        assert fuel_used is not None and fuel_used > 0
+
+def test_budget_restarts_with_every_run() -> None:
+    module = parse(tokenize('var i = 0; while i < 100 do i = i + 1; i'))
+    budget = Budget(fuel=150)
+    program = compile_module(module, budget)
+    assert program() == 100
+    assert program() == 100
+    assert interpret(module, budget=budget) == 100
+    assert budget.used() == 100
@@ -0,0 +1,54 @@
+from pytest import CaptureFixture
+
+from compiler.bytecode import OP_COPY_JUMP, OP_LT_JUMP, lower_ir, run_program
+from compiler.channel import Channel
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+from tests.end_to_end_test import find_test_cases
+
+def run(code: str, channel: Channel | None = None) -> int:
+    node = parse(tokenize(code))
+    typecheck(node)
+    return run_program(lower_ir(generate_ir(node)), channel=channel)
+
+def test_bytecode_runs_test_programs(capsys: CaptureFixture[str]) -> None:
+    for test_case in find_test_cases():
+        run(test_case.code, Channel('\n'.join(test_case.inputs).encode()))
+        output = capsys.readouterr().out
+        assert len(test_case.outputs) == 0 or output == '\n'.join(test_case.outputs) + '\n', test_case.name
+
+def test_bytecode_runs_loops(capsys: CaptureFixture[str]) -> None:
+    run('''
+        var i = 0;
+        var total = 0;
+        while i < 1000 do {
+            if i % 3 == 0 then total = total + i else total = total - 1;
+            i = i + 1;
+        }
+        total
+        ''')
+    assert capsys.readouterr().out == f'{166833 - 666}\n'
+
+def test_bytecode_divides_towards_zero(capsys: CaptureFixture[str]) -> None:
+    run('print_int(-7 / 2); print_int(-7 % 2); print_int(7 / -2); -6 / 3')
+    assert capsys.readouterr().out == '-3\n-1\n-3\n-2\n'
+
+def test_bytecode_passes_parameters_in_order(capsys: CaptureFixture[str]) -> None:
+    run('''
+        fun sub(a: Int, b: Int): Int { return a - b; }
+        fun sub3(a: Int, b: Int, c: Int): Int { return a - b - c; }
+        fun fib(n: Int): Int { if n < 2 then n else fib(n - 1) + fib(n - 2) }
+        print_int(sub(10, 3));
+        print_int(sub3(10, 3, 2));
+        fib(15)
+        ''')
+    assert capsys.readouterr().out == '7\n5\n610\n'
+
+def test_bytecode_fuses_instructions() -> None:
+    node = parse(tokenize('var i = 0; while i < 3 do i = i + 1; if i > 2 then 1 else 2'))
+    typecheck(node)
+    program = lower_ir(generate_ir(node))
+    assert OP_LT_JUMP in program.code
+    assert OP_COPY_JUMP in program.code
@@ -0,0 +1,117 @@
+import io
+
+from compiler.channel import Channel
+from compiler.closure_compiler import compile_module, interpret_compiled
+from compiler.interpreter import PredefinedSymbols, interpret
+from compiler.models.symbol_table import SymTab
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+
+def run(code: str) -> object:
+    return interpret_compiled(parse(tokenize(code)))
+
+def test_closure_compiler_matches_interpreter() -> None:
+    for code in [
+        '1 + 2 * 3',
+        '-1',
+        'not true',
+        'not 1',
+        '1 + (2 < 3)',
+        '7 / 2',
+        '7 % 3',
+        '3 >= 2',
+        '3 != 3',
+        '2 <= 2',
+        '1 + 2; 2 - 3; 4',
+        'if 1 < 2 then 3 else 4',
+        '7 + if 1 < 2 then 3 else 4',
+        'if 1 < 2 then 3',
+        'var a = 1; while a < 3 do a = a + 1; a',
+        'var a = 1; while { a < 3 } do { a = a + 1; }',
+        'var a = 1; { var a = 2; a = a + 1; } a = a + 1; a',
+        'var a = 1; a = { var a = a + 5; a = a + 5; a} a',
+        'var a = 1; { var a = 2; a + 1 } a + 2',
+        '{1 + 2; 2 - 3; 4;}',
+        'true and true',
+        'false and true',
+        '1 < 2 and 2 < 3',
+        'true or false',
+        'false or false',
+        'true and 1',
+        'print_int(1)',
+        'print_bool(true)',
+        'var evaluated = false; true or { evaluated = true; true }; evaluated',
+    ]:
+        assert run(code) == interpret(parse(tokenize(code)), SymTab(dict(PredefinedSymbols))), code
+
+def test_closure_compiler_handles_functions() -> None:
+    assert run('''
+        fun square(x: Int): Int {
+            return x * x;
+        }
+
+        fun vec_len_squared(x: Int, y: Int): Int {
+            return square(x) + square(y);
+        }
+
+        vec_len_squared(3, 4)
+        ''') == 25
+
+def test_closure_compiler_handles_recursion() -> None:
+    assert run('''
+        fun fib(n: Int): Int {
+            if n < 2 then n else fib(n - 1) + fib(n - 2)
+        }
+
+        fib(15)
+        ''') == 610
+
+def test_closure_compiler_keeps_parameters_local() -> None:
+    assert run('''
+        fun inc(a: Int): Int {
+            a = a + 1;
+            a
+        }
+
+        var a = 10;
+        inc(1) + a
+        ''') == 12
+
+def test_closure_compiler_runs_loops() -> None:
+    assert run('''
+        var i = 0;
+        var total = 0;
+        while i < 1000 do {
+            if i % 3 == 0 then total = total + i else total = total - 1;
+            i = i + 1;
+        }
+        total
+        ''') == 166833 - 666
+
+def test_closure_compiler_compiles_once() -> None:
+    program = compile_module(parse(tokenize('var a = 1; a = a + 1; a')))
+    assert program() == 2
+    assert program() == 2
+
+def test_closure_compiler_reads_and_prints() -> None:
+    output = io.StringIO()
+    program = compile_module(parse(tokenize('var a = read_int(); print_int(a * 2); print_bool(a > 1); a + 1')), channel=Channel(b'5', output))
+    assert program() == 6
+    assert output.getvalue() == '10\ntrue\n'
+
+def test_closure_compiler_fails_at_run_time() -> None:
+    for code in [
+        'var a = 1; {var a = 2; var b = 3; a} b',
+        'b = 1',
+        'print_int()',
+        'print_bool(true, false)',
+        'f(1)',
+        'fun f(x: Int): Int { x } f(1, 2)',
+    ]:
+        program = compile_module(parse(tokenize(code)))
+        failed = False
+        try:
+            program()
+        except Exception:
+            failed = True
+        assert failed, f'Running succeeded for: {code}'
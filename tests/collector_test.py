@@ -0,0 +1,41 @@
+import gc
+import threading
+
+from compiler.collector import paused_collector
+
+def test_paused_collector_restores_the_earlier_setting() -> None:
+    assert gc.isenabled()
+    with paused_collector():
+        assert not gc.isenabled()
+        with paused_collector():
+            assert not gc.isenabled()
+        assert not gc.isenabled()
+    assert gc.isenabled()
+
+    gc.disable()
+    try:
+        with paused_collector():
+            pass
+        assert not gc.isenabled()
+    finally:
+        gc.enable()
+
+def test_paused_collector_waits_for_the_last_thread() -> None:
+    entered = threading.Event()
+    leave = threading.Event()
+
+    def pause() -> None:
+        with paused_collector():
+            entered.set()
+            leave.wait()
+
+    thread = threading.Thread(target=pause)
+    thread.start()
+    entered.wait()
+    with paused_collector():
+        pass
+    # The other thread is still in its block
+    assert not gc.isenabled()
+    leave.set()
+    thread.join()
+    assert gc.isenabled()
@@ -0,0 +1,43 @@
+from compiler.models.expressions import *
+from compiler.models.symbol_table import SymTab
+from compiler.models.types import Bool, Int
+from compiler.parser import parse
+from compiler.tokenizer import tokenize, tokenize_buffer
+from compiler.type_checker import typecheck
+
+def parse_code(code: str) -> Expression:
+    return parse(tokenize(code)).sequence[0]
+
+def test_only_names_are_interned() -> None:
+    block = parse_code('{ 1 + 1; true == true; a + a }')
+    assert isinstance(block, Block)
+    one_plus_one, true_eq_true, a_plus_a = [e for e in block.sequence if isinstance(e, BinaryOp)]
+    # Every occurrence is a node of its own, so that tables keyed by the ids of nodes can tell them apart
+    assert one_plus_one.left is not one_plus_one.right
+    assert true_eq_true.left is not true_eq_true.right
+    assert a_plus_a.left is not a_plus_a.right
+    assert isinstance(a_plus_a.left, Identifier) and isinstance(a_plus_a.right, Identifier)
+    assert a_plus_a.left.name is a_plus_a.right.name
+
+def test_structural_hash() -> None:
+    code = 'fun f(x: Int): Int { x * 2 + 1 } var y = f(3); y'
+    module = parse(tokenize(code))
+    assert module.structural_hash() == parse(tokenize(code)).structural_hash()
+    # The same in every run, unlike hash()
+    assert module.structural_hash() == 0x66bff95d625857ea59e1b20ae0829912
+
+    # Inferred types don't matter, declared ones do
+    before = parse(tokenize(code)).structural_hash()
+    typecheck(module, SymTab({}))
+    assert module.structural_hash() == before
+    assert parse(tokenize(code.replace('x: Int', 'x: Bool'))).structural_hash() != before
+    assert parse(tokenize(code.replace('var y =', 'var y: Int ='))).structural_hash() != before
+
+    hashes = {parse(tokenize(c)).structural_hash() for c in [code, code.replace('2', '3'), code.replace('+', '-'),
+                                                            code.replace('f(3)', 'f(3, 4)'), code.replace('x *', 'y *')]}
+    assert len(hashes) == 5
+    assert parse_code('1').structural_hash() != parse_code('true').structural_hash()
+
+def test_structural_hash_of_deep_tree() -> None:
+    exp = parse(tokenize_buffer(' + '.join(['1'] * 100000))).sequence[0]
+    assert exp.structural_hash() == parse(tokenize_buffer(' + '.join(['1'] * 100000))).sequence[0].structural_hash()
@@ -0,0 +1,90 @@
+from compiler.incremental import TextEdit, parse_source, relex, reparse
+from compiler.models.expressions import *
+from compiler.parser import find_function_declarations, parse
+from compiler.tokenizer import tokenize_buffer
+
+code = '''
+fun square(x: Int): Int {
+    return x * x;
+}
+
+fun cube(x: Int): Int {
+    return x * square(x);  // uses square
+}
+
+var a = square(3);
+cube(a)
+'''
+
+def apply(edit: TextEdit) -> str:
+    return code[:edit.start] + edit.text + code[edit.end:]
+
+def assert_same_tokens(edit: TextEdit) -> None:
+    _, tokens = parse_source(code)
+    expected = tokenize_buffer(apply(edit))
+    relexed = relex(tokens, edit).tokens
+    assert relexed.source == expected.source
+    assert relexed.kinds == expected.kinds
+    assert relexed.starts == expected.starts
+    assert relexed.ends == expected.ends
+
+def test_find_function_declarations() -> None:
+    tokens = tokenize_buffer(code)
+    declarations = find_function_declarations(tokens)
+    assert [tokens.text(start) + ' ' + tokens.text(start + 1) for (start, _) in declarations] == ['fun square', 'fun cube']
+    assert [tokens.text(end - 1) for (_, end) in declarations] == ['}', '}']
+    assert tokens.text(declarations[-1][1]) == 'var'
+
+def test_relex_matches_tokenize() -> None:
+    offset = code.index('x * x')
+    assert_same_tokens(TextEdit(offset, offset + 1, 'xy'))
+    assert_same_tokens(TextEdit(offset, offset, ' '))
+    assert_same_tokens(TextEdit(offset, offset + 5, ''))
+    assert_same_tokens(TextEdit(code.index('// uses'), code.index('// uses') + 1, ''))
+    assert_same_tokens(TextEdit(code.index('return x * square'), code.index('return x * square'), '#'))
+    assert_same_tokens(TextEdit(0, len(code), 'a'))
+
+def test_reparse_edit_in_function_reuses_other_declarations() -> None:
+    module, tokens = parse_source(code)
+    offset = code.index('x * square')
+    edit = TextEdit(offset, offset + 1, '2')
+    new_module, _ = reparse(module, tokens, edit)
+    assert new_module == parse(tokenize_buffer(apply(edit)))
+    assert new_module.sequence[0] is module.sequence[0]
+    assert new_module.sequence[1] is module.sequence[1]
+    assert new_module.sequence[2] is not module.sequence[2]
+
+def test_reparse_edit_in_main_reuses_declarations() -> None:
+    module, tokens = parse_source(code)
+    offset = code.index('square(3)')
+    edit = TextEdit(offset + 7, offset + 8, '42')
+    new_module, _ = reparse(module, tokens, edit)
+    assert new_module == parse(tokenize_buffer(apply(edit)))
+    assert new_module.sequence[1] is module.sequence[1]
+    assert new_module.sequence[2] is module.sequence[2]
+
+def test_reparse_whitespace_edit_keeps_tree() -> None:
+    module, tokens = parse_source(code)
+    offset = code.index('x * x')
+    new_module, new_tokens = reparse(module, tokens, TextEdit(offset, offset, '   '))
+    assert new_module == module
+    assert all(new is old for (new, old) in zip(new_module.sequence, module.sequence))
+    assert new_tokens.text(len(new_tokens) - 2) == 'a'
+
+def test_reparse_structural_edit() -> None:
+    module, tokens = parse_source(code)
+    offset = code.index('var a')
+    edit = TextEdit(offset, offset, 'fun one(): Int { 1 }\n')
+    new_module, _ = reparse(module, tokens, edit)
+    assert new_module == parse(tokenize_buffer(apply(edit)))
+    assert len(new_module.sequence) == 4
+
+def test_reparse_fails_on_syntax_error() -> None:
+    module, tokens = parse_source(code)
+    offset = code.index('x * x')
+    failed = False
+    try:
+        reparse(module, tokens, TextEdit(offset, offset + 1, '{'))
+    except Exception:
+        failed = True
+    assert failed
@@ -1,8 +1,15 @@
-from pytest import MonkeyPatch
+import io
+import tracemalloc
 
-from compiler.interpreter import interpret
+from pytest import CaptureFixture
+
+from compiler.channel import Channel
+from compiler.interpreter import MemoCache, MemoKey, PredefinedSymbols, interpret
+from compiler.models.symbol_table import SymTab
 from compiler.parser import parse
+from compiler.resolver import resolve
 from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
 
 
 def test_interpreter_works() -> None:
@@ -92,15 +99,32 @@ def test_interpreter_handles_or_false() -> None:
 def test_interpreter_handles_not_true() -> None:
     assert interpret(parse(tokenize('not true'))) == False
 
-def test_interpreter_handles_print_int() -> None:
+def test_interpreter_handles_print_int(capsys: CaptureFixture[str]) -> None:
     assert interpret(parse(tokenize('print_int(1)'))) == None
+    assert capsys.readouterr().out == '1\n'
 
-def test_interpreter_handles_print_bool() -> None:
+def test_interpreter_handles_print_bool(capsys: CaptureFixture[str]) -> None:
     assert interpret(parse(tokenize('print_bool(true)'))) == None
+    assert capsys.readouterr().out == 'true\n'
 
-def test_interpreter_handles_read_int(monkeypatch: MonkeyPatch) -> None:
-    monkeypatch.setattr('builtins.input', lambda _: "1")
-    assert interpret(parse(tokenize('read_int()'))) == 1
+def test_interpreter_handles_read_int() -> None:
+    assert interpret(parse(tokenize('read_int()')), channel=Channel(b'1\n')) == 1
+
+def test_interpreter_prints_through_channel() -> None:
+    output = io.StringIO()
+    channel = Channel(b'3 4\n5', output, buffer_size=8)
+    assert interpret(parse(tokenize('''
+        fun show(x: Int): Int { print_int(x); x }
+        var total = 0;
+        var i = 0;
+        while i < 3 do {
+            total = total + show(read_int() * 2);
+            i = i + 1;
+        }
+        print_bool(total > 20);
+        total
+    ''')), channel=channel) == 24
+    assert output.getvalue() == '6\n8\n10\ntrue\n'
 
 def test_interpreter_handles_module_with_function() -> None:
     assert interpret(parse(tokenize('''
@@ -145,9 +169,13 @@ def test_interpreter_fails_bad_parameters_for_predefined_functions() -> None:
     assert_interpreter_fails('print_bool()')
     assert_interpreter_fails('print_bool(true, false)')
 
-def test_interpreter_fails_bad_input(monkeypatch: MonkeyPatch) -> None:
-    monkeypatch.setattr('builtins.input', lambda _: "hi")
-    assert_interpreter_fails('read_int()')
+def test_interpreter_fails_bad_input() -> None:
+    for data in [b'hi', b'']:
+        try:
+            interpret(parse(tokenize('read_int()')), channel=Channel(data))
+            assert False
+        except (ValueError, EOFError):
+            pass
     
 def test_interpreter_handles_or_expression_from_example() -> None:
     assert interpret(parse(tokenize(
@@ -167,4 +195,99 @@ def assert_interpreter_fails(code: str) -> None:
         interpret(node)
     except Exception: # TODO: Exception types
         failed = True
-    assert failed, f'Parsing succeeded for: {code}'
\ No newline at end of file
+    assert failed, f'Parsing succeeded for: {code}'
+
+def test_interpreter_handles_recursion() -> None:
+    assert interpret(parse(tokenize('''
+        fun fib(n: Int): Int {
+            if n < 2 then n else fib(n - 1) + fib(n - 2)
+        }
+
+        fib(10)
+        '''))) == 55
+
+def test_interpreter_evaluates_assignments_in_their_scope() -> None:
+    assert interpret(parse(tokenize('var a = 1; var b = 0; { var a = 5; b = a } b'))) == 5
+
+def test_interpreter_handles_deep_recursion() -> None:
+    assert interpret(parse(tokenize('''
+        fun sum(n: Int): Int {
+            if n == 0 then 0 else n + sum(n - 1)
+        }
+
+        sum(20000)
+        '''))) == 200010000
+
+def test_interpreter_runs_tail_calls_in_constant_space() -> None:
+    def peak_memory(n: int) -> int:
+        node = parse(tokenize(f'''
+            fun count(n: Int, acc: Int): Int {{
+                if n == 0 then acc else return count(n - 1, acc + n);
+            }}
+
+            count({n}, 0)
+            '''))
+        tracemalloc.start()
+        try:
+            assert interpret(node) == n * (n + 1) // 2
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    assert peak_memory(3000) < 2 * peak_memory(100)
+
+def test_interpreter_memoizes_pure_functions() -> None:
+    cache = MemoCache()
+    assert interpret(parse(tokenize('''
+        fun fib(n: Int): Int {
+            if n < 2 then n else fib(n - 1) + fib(n - 2)
+        }
+
+        fib(60)
+        ''')), cache=cache) == 1548008755920
+    assert cache.misses == 61
+    assert len(cache) == 61
+    assert cache.hits == 58
+
+def test_interpreter_memoizes_tail_calls() -> None:
+    cache = MemoCache()
+    code = '''
+        fun count(n: Int, acc: Int): Int {
+            if n == 0 then acc else return count(n - 1, acc + n);
+        }
+
+        count(100, 0) + count(100, 0)
+        '''
+    assert interpret(parse(tokenize(code)), cache=cache) == 10100
+    assert cache.stats()['hits'] == 1
+
+def test_interpreter_doesnt_memoize_impure_functions() -> None:
+    cache = MemoCache()
+    assert interpret(parse(tokenize('''
+        fun show(n: Int): Int { print_int(n); n }
+        fun twice(n: Int): Int { show(n) + show(n) }
+        fun double(n: Int): Int { n * 2 }
+
+        twice(1) + twice(1) + double(1) + double(1)
+        ''')), cache=cache) == 8
+    assert cache.misses == 1
+    assert cache.hits == 1
+
+def test_memo_cache_drops_least_recently_used() -> None:
+    cache = MemoCache(maxsize=2)
+    a: MemoKey = ('f', (1,), (int,))
+    b: MemoKey = ('f', (2,), (int,))
+    c: MemoKey = ('f', (True,), (bool,))
+    cache.put(a, 1)
+    cache.put(b, 2)
+    assert cache.get(a) == (True, 1)
+    cache.put(c, 3)
+    assert cache.get(b) == (False, None)
+    assert cache.get(a) == (True, 1)
+    assert cache.get(c) == (True, 3)
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 3, 'misses': 1, 'evictions': 1, 'hit_rate': 0.75}
+
+def test_interpreter_reuses_the_resolution_of_the_type_checker() -> None:
+    node = parse(tokenize('fun f(x: Int): Int { var y = x * 2; y + 1 } var a = 3; { var a = f(a); a = a + 1 } a'))
+    resolution = resolve(node, PredefinedSymbols)
+    typecheck(node, SymTab({}), resolution)
+    assert interpret(node, resolution=resolution) == 3
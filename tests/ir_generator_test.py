@@ -0,0 +1,23 @@
+import compiler.ir_generator
+from compiler.interpreter import PredefinedSymbols
+from compiler.ir_generator import generate_ir
+from compiler.models.expressions import Expression
+from compiler.models.symbol_table import SymTab
+from compiler.parser import parse
+from compiler.resolver import Resolution, resolve
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+
+code = 'fun f(x: Int): Int { var y = x * 2; y + 1 } var a = 3; { var a = f(a); a = a + 1 } a'
+
+def generate(node: Expression, resolution: Resolution | None = None) -> str:
+    compiler.ir_generator.next_var_number = 1
+    compiler.ir_generator.end_label_number = 1
+    ir = generate_ir(node, resolution=resolution)
+    return '\n'.join(f'{name}: {", ".join(str(i) for i in instructions)}' for (name, instructions) in ir.items())
+
+def test_ir_generator_reuses_the_resolution_of_the_type_checker() -> None:
+    node = parse(tokenize(code))
+    resolution = resolve(node, PredefinedSymbols)
+    typecheck(node, SymTab({}), resolution)
+    assert generate(node, resolution=resolution) == generate(node)
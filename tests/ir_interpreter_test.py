@@ -0,0 +1,65 @@
+from pytest import CaptureFixture
+
+from compiler.bytecode import lower_ir, run_program
+from compiler.channel import Channel
+from compiler.ir_generator import generate_ir
+from compiler.ir_interpreter import run_ir
+from compiler.models.instructions import *
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+from tests.end_to_end_test import find_test_cases
+
+def ir_of(code: str) -> dict[str, list[Instruction]]:
+    node = parse(tokenize(code))
+    typecheck(node)
+    return generate_ir(node)
+
+def test_ir_interpreter_runs_test_programs(capsys: CaptureFixture[str]) -> None:
+    for test_case in find_test_cases():
+        run_ir(ir_of(test_case.code), channel=Channel('\n'.join(test_case.inputs).encode()))
+        output = capsys.readouterr().out
+        assert len(test_case.outputs) == 0 or output == '\n'.join(test_case.outputs) + '\n', test_case.name
+
+def test_ir_interpreter_matches_bytecode(capsys: CaptureFixture[str]) -> None:
+    ir = ir_of('''
+        fun sub3(a: Int, b: Int, c: Int): Int { return a - b - c; }
+        fun fib(n: Int): Int { if n < 2 then n else fib(n - 1) + fib(n - 2) }
+        var i = 0;
+        var total = 0;
+        while i < 100 do {
+            if i % 3 == 0 or i / 7 == 2 then total = total + fib(i % 10) else total = sub3(total, i, 2);
+            i = i + 1;
+        }
+        print_bool(total > 0);
+        0 - total
+        ''')
+    run_ir(ir)
+    output = capsys.readouterr().out
+    run_program(lower_ir(ir))
+    assert capsys.readouterr().out == output
+
+def test_ir_interpreter_assigns_outer_variables_from_inner_blocks(capsys: CaptureFixture[str]) -> None:
+    run_ir(ir_of('var a = 1; { var b = a + 1; { var c = b * 3; a = c + b } } a'))
+    assert capsys.readouterr().out == '8\n'
+
+def test_ir_interpreter_runs_instructions() -> None:
+    x, y, z = IRVar('x1'), IRVar('x2'), IRVar('x3')
+    assert run_ir({'main': [
+        LoadIntConst(-7, x),
+        LoadIntConst(2, y),
+        Call(IRVar('/'), [x, y], z),
+        CondJump(z, Label('L1'), Label('L2')),
+        Label('L1'),
+        Return(val=z),
+        Label('L2'),
+        Return(),
+    ]}) == -3
+
+def test_ir_interpreter_fails_on_undefined_label() -> None:
+    failed = False
+    try:
+        run_ir({'main': [Jump(Label('L1'))]})
+    except Exception:
+        failed = True
+    assert failed
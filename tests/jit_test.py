@@ -0,0 +1,95 @@
+import io
+
+from pytest import skip
+
+from compiler.assembly_generator import generate_assembly
+from compiler.channel import Channel
+from compiler.ir_generator import generate_ir
+from compiler.jit import HAS_JIT, JitProgram, encode
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+from tests.end_to_end_test import find_test_cases
+
+if not HAS_JIT:
+    skip('The JIT runs only on x86-64 Linux', allow_module_level=True)
+
+def run(code: str, inputs: str = '') -> str:
+    node = parse(tokenize(code))
+    typecheck(node)
+    program = JitProgram(generate_assembly(generate_ir(node)))
+    output = io.StringIO()
+    try:
+        program.run(Channel(inputs.encode(), output))
+    finally:
+        program.close()
+    return output.getvalue()
+
+def test_jit_runs_test_programs() -> None:
+    for test_case in find_test_cases():
+        output = run(test_case.code, '\n'.join(test_case.inputs))
+        assert len(test_case.outputs) == 0 or output == '\n'.join(test_case.outputs) + '\n', test_case.name
+
+def test_jit_encodes_like_the_assembler() -> None:
+    encoder = encode('''
+        movq $5, -8(%rbp)
+        movabsq $123456789012, %rax
+        addq $1000, %rsp
+        cmpq -16(%rbp), %rdx
+        setle %al
+        pushq 16(%rbp)
+        idivq -24(%rbp)
+        movq %rax, 0(%rsp)
+    ''', {})
+    # As encoded by GNU as
+    assert encoder.code.hex() == '48c745f80500000048b8141a99be1c0000004881c4e8030000483b55f00f9ec0ff751048f77de848890424'
+
+def test_jit_runs_loops_with_many_calls() -> None:
+    # Every call pops its arguments, so that the loop doesn't use up the stack
+    assert run('''
+        fun add(a: Int, b: Int): Int { return a + b; }
+        fun add3(a: Int, b: Int, c: Int): Int { return a + b + c; }
+        var i = 0;
+        var total = 0;
+        while i < 1000000 do {
+            total = add3(total, add(i, 1), 0 - 1);
+            i = i + 1;
+        }
+        print_bool(total > 0);
+        total
+        ''') == 'true\n499999500000\n'
+
+def test_jit_runs_a_program_many_times() -> None:
+    node = parse(tokenize('var n = read_int(); print_int(n * 2); n * n'))
+    typecheck(node)
+    program = JitProgram(generate_assembly(generate_ir(node)))
+    for n in range(5):
+        output = io.StringIO()
+        program.run(Channel(str(n).encode(), output))
+        assert output.getvalue() == f'{n * 2}\n{n * n}\n'
+    program.close()
+    try:
+        program.run()
+        assert False
+    except Exception as e:
+        assert str(e) == 'The program is closed'
+
+def test_jit_raises_errors_of_io_after_main() -> None:
+    try:
+        run('print_int(read_int()); print_int(read_int()); 7', '1')
+        assert False
+    except EOFError:
+        pass
+
+def test_jit_rejects_unsupported_assembly() -> None:
+    for (code, message) in [
+        ('main:\nmovq %xmm0, %rax\nret', 'Unsupported register: %xmm0'),
+        ('main:\nlea -8(%rbp), %rax\nret', 'Unsupported instruction: lea -8(%rbp), %rax'),
+        ('main:\njmp .Lnowhere', 'Unknown label: .Lnowhere'),
+        ('main:\nret\nmain:\nret', 'Label main is already defined'),
+    ]:
+        try:
+            JitProgram(code)
+            assert False
+        except Exception as e:
+            assert str(e) == message
@@ -1,7 +1,10 @@
+import io
+from typing import cast
+
 
 from compiler.models.types import Unit
 from compiler.parser import *
-from compiler.tokenizer import tokenize
+from compiler.tokenizer import iter_tokens, tokenize, tokenize_buffer
 from compiler.type_checker import Bool, Int
 
 def test_parser_can_parse() -> None:
@@ -455,6 +458,14 @@ def test_parser_parse_while_with_expression() -> None:
         body=Block([Identifier('b'), Literal(None)])
     )
     
+def test_parser_records_while_locations() -> None:
+    locations: dict[int, SourceLocation] = {}
+    module = parse(tokenize_buffer('var a = 1;\nwhile a < 3 do {\n  while false do a;\n  a = a + 1\n}'), locations)
+    outer = cast(Block, module.sequence[0]).sequence[1]
+    assert isinstance(outer, WhileExpression)
+    inner = cast(Block, outer.body).sequence[0]
+    assert locations == {id(outer): SourceLocation(2, 1), id(inner): SourceLocation(3, 3)}
+
 def test_parser_parse_while_with_blocks_incorrect_do_returns() -> None:
     assert parse(tokenize('while { a } do { b }')).sequence[0] == WhileExpression(
         cond=Block([Identifier('a')]),
@@ -712,6 +723,34 @@ def test_parser_parse_module_with_many_functions() -> None:
             )
         ])
 
+def test_parser_parses_token_stream() -> None:
+    code = '''
+        fun square(x: Int): Int {
+            return x * x;
+        }
+
+        var a = square(3);
+        while a > 1 do { a = a / 2; }
+        '''
+    assert parse(iter_tokens(io.StringIO(code), 4)) == parse(tokenize(code))
+
+def test_parser_parses_token_buffer() -> None:
+    code = '''
+        fun f(x: Int, y: Bool): Int {
+            if y then return x; else return -x;
+        }
+        { var a = f(3, true); a } < 2
+        '''
+    assert parse(tokenize_buffer(code)) == parse(tokenize(code))
+
+def test_parser_reports_location_of_token_buffer_errors() -> None:
+    message = ''
+    try:
+        parse(tokenize_buffer('var a = 1;\nvar b = (a + 2;'))
+    except Exception as e:
+        message = str(e)
+    assert 'line 2, column 15' in message
+
 def test_parser_fails() -> None:
     assert_parser_fails('1 + 3 4')
 
@@ -741,6 +780,34 @@ def test_parser_block_test_cases_should_fail() -> None:
 def test_parser_empty_input() -> None:
     assert_parser_fails('')
 
+def test_parser_million_term_expression() -> None:
+    terms = 1000000
+    left = parse(tokenize_buffer(' + '.join(['1'] * terms))).sequence[0]
+    count = 1
+    while isinstance(left, BinaryOp):
+        assert left.op == '+' and left.right == Literal(1)
+        left = left.left
+        count += 1
+    assert left == Literal(1)
+    assert count == terms
+
+def test_parser_deep_nesting() -> None:
+    depth = 100000
+    exp = parse(tokenize_buffer('(' * depth + 'x' + ')' * depth)).sequence[0]
+    assert exp == Identifier('x')
+
+    exp = parse(tokenize_buffer('{ ' * depth + 'x' + ' }' * depth)).sequence[0]
+    for _ in range(depth):
+        assert isinstance(exp, Block) and len(exp.sequence) == 1
+        exp = exp.sequence[0]
+    assert exp == Identifier('x')
+
+    exp = parse(tokenize_buffer('if ' * depth + 'a' + ' then b' * depth)).sequence[0]
+    for _ in range(depth):
+        assert isinstance(exp, IfExpression) and exp.then_clause == Identifier('b')
+        exp = exp.cond
+    assert exp == Identifier('a')
+
 def assert_parser_fails(code: str) -> None:
     token = tokenize(code)
     failed = False
@@ -758,4 +825,43 @@ def assert_parser_not_fails(code: str) -> None:
         passed = True
     except Exception: # TODO: Exception types
         pass
-    assert passed, f'Parsing not succeeded for: {code}'
\ No newline at end of file
+    assert passed, f'Parsing not succeeded for: {code}'
+
+def test_parse_parallel_matches_parse() -> None:
+    code = ''.join(f'fun f{i}(x: Int): Int {{ var y = x * {i}; {{ y }} }}\n' for i in range(20)) + 'f1(f2(3))'
+    tokens = tokenize_buffer(code)
+    module = parse_parallel(tokens, workers=2, min_declarations=1)
+    assert module == parse(tokens)
+    assert module.sequence[1].type is Int
+
+    only_declarations = tokenize_buffer(code[:code.index('f1(f2')])
+    assert parse_parallel(only_declarations, workers=2, min_declarations=1) == parse(only_declarations)
+
+def test_parse_parallel_reports_errors_like_parse() -> None:
+    code = ''.join(f'fun f{i}(): Int {{ {i} }}\n' for i in range(10)).replace('{ 5 }', '{ 5 + }') + 'f1()'
+    messages: list[str] = []
+    for workers in [1, 2]:
+        try:
+            parse_parallel(tokenize_buffer(code), workers=workers, min_declarations=1)
+        except Exception as e:
+            messages.append(str(e))
+    assert len(messages) == 2 and messages[0] == messages[1]
+
+def test_parse_parallel_keeps_its_workers() -> None:
+    code = ''.join(f'fun f{i}(x: Int): Int {{ x + {i} }}\n' for i in range(8)) + 'f1(2)'
+    tokens = tokenize_buffer(code)
+    module = parse_parallel(tokens, workers=2, min_declarations=1)
+    pool = parse_pools[2]
+    assert parse_parallel(tokenize_buffer(code), workers=2, min_declarations=1) == module
+    assert parse_pools[2] is pool
+
+    with ProcessPoolExecutor(2) as executor:
+        assert parse_parallel(tokenize_buffer(code), workers=2, min_declarations=1, executor=executor) == module
+
+    # The declarations are found once per buffer
+    assert find_function_declarations(tokens) is find_function_declarations(tokens)
+
+    close_parse_pools()
+    assert parse_pools == {}
+    assert parse_parallel(tokenize_buffer(code), workers=2, min_declarations=1) == module
+    assert parse_pools[2] is not pool
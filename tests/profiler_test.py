@@ -0,0 +1,141 @@
+import json
+
+from compiler.interpreter import MemoCache, interpret
+from compiler.models.tokens import SourceLocation
+from compiler.parser import parse
+from compiler.profiler import Profiler
+from compiler.tokenizer import tokenize, tokenize_buffer
+from compiler.tracing import LoopTracer
+
+
+def test_profiler_counts_nodes() -> None:
+    profiler = Profiler()
+    assert interpret(parse(tokenize('1 + 2 * 3')), profiler=profiler) == 7
+    assert profiler.nodes['BinaryOp'].count == 2
+    assert profiler.nodes['Literal'].count == 3
+    assert profiler.nodes['BinaryOp'].time >= profiler.nodes['BinaryOp'].self_time >= 0
+    assert profiler.functions['main'].calls == 1
+
+def test_profiler_times_functions() -> None:
+    profiler = Profiler()
+    module = parse(tokenize('''
+        fun fib(n: Int): Int {
+            if n < 2 then n else fib(n - 1) + fib(n - 2)
+        }
+        fun twice(n: Int): Int { fib(n) + fib(n) }
+        twice(10)
+    '''))
+    assert interpret(module, profiler=profiler) == 110
+    assert profiler.functions['twice'].calls == 1
+    assert profiler.functions['fib'].calls == 2 * 177
+    fib = profiler.functions['fib']
+    twice = profiler.functions['twice']
+    main = profiler.functions['main']
+    # Recursive calls aren't counted twice
+    assert fib.exclusive_time <= fib.inclusive_time <= twice.inclusive_time <= main.inclusive_time
+    assert twice.exclusive_time < twice.inclusive_time
+    assert sum(f.exclusive_time for f in profiler.functions.values()) <= main.inclusive_time + 1e-6
+
+def test_profiler_counts_loop_iterations_by_location() -> None:
+    locations: dict[int, SourceLocation] = {}
+    module = parse(tokenize_buffer('''var i = 0;
+var j = 0;
+while i < 3 do {
+    i = i + 1;
+    j = 0;
+    while j < 4 do j = j + 1;
+}
+i
+'''), locations)
+    profiler = Profiler(locations)
+    assert interpret(module, profiler=profiler) == 3
+    assert profiler.loops == {'line 3, column 1': 3, 'line 6, column 5': 12}
+
+def test_profiler_counts_loop_iterations_without_locations() -> None:
+    module = parse(tokenize('''
+        fun count(n: Int): Int {
+            var i = 0;
+            while i < n do i = i + 1;
+            i
+        }
+        var k = 0;
+        while k < 2 do k = k + 1;
+        count(5) + count(k)
+    '''))
+    profiler = Profiler()
+    assert interpret(module, profiler=profiler) == 7
+    assert profiler.loops == {'main: while 1': 2, 'count: while 1': 7}
+
+def test_profiler_times_traced_loops_and_calls_from_outside() -> None:
+    module = parse(tokenize('''
+        fun count(n: Int): Int {
+            var i = 0;
+            while i < n do i = i + 1;
+            i
+        }
+        var k = 0;
+        while k < 2 do k = k + 1;
+        count
+    '''))
+    profiler = Profiler()
+    count = interpret(module, profiler=profiler, tracer=LoopTracer())
+    assert profiler.loops == {'main: while 1': 2, 'count: while 1': 0}
+    assert profiler.nodes['WhileExpression'].count == 1
+    assert profiler.nodes['BinaryOp'].count == 3 + 2 * 2
+    assert callable(count) and count([5]) == 5
+    assert profiler.loops['count: while 1'] == 5
+    assert profiler.functions['count'].calls == 1
+
+def test_profiler_follows_tail_calls() -> None:
+    profiler = Profiler()
+    module = parse(tokenize('''
+        fun sum(n: Int, acc: Int): Int {
+            if n == 0 then acc else sum(n - 1, acc + n)
+        }
+        sum(1000, 0)
+    '''))
+    assert interpret(module, profiler=profiler) == 500500
+    assert profiler.functions['sum'].calls == 1001
+    assert set(profiler.stacks) == {'main', 'main;sum'}
+
+def test_profiler_skips_memoized_calls() -> None:
+    profiler = Profiler()
+    module = parse(tokenize('''
+        fun fib(n: Int): Int {
+            if n < 2 then n else fib(n - 1) + fib(n - 2)
+        }
+        fib(30)
+    '''))
+    assert interpret(module, cache=MemoCache(), profiler=profiler) == 832040
+    assert profiler.functions['fib'].calls == 31
+
+def test_profiler_exports_json_and_collapsed_stacks() -> None:
+    profiler = Profiler()
+    module = parse(tokenize('''
+        fun f(n: Int): Int { g(n) + 1 }
+        fun g(n: Int): Int { n * 2 }
+        f(1) + g(2)
+    '''))
+    assert interpret(module, profiler=profiler) == 7
+    data = json.loads(profiler.to_json())
+    assert data['functions']['f']['calls'] == 1
+    assert data['functions']['g']['calls'] == 2
+    assert data['nodes']['Function']['count'] == 3
+    lines = profiler.to_collapsed().splitlines()
+    assert [line.rsplit(' ', 1)[0] for line in lines] == ['main', 'main;f', 'main;f;g', 'main;g']
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+def test_profiler_stops_after_errors() -> None:
+    profiler = Profiler()
+    module = parse(tokenize('''
+        fun f(n: Int): Int { g(n) }
+        f(1)
+    '''))
+    try:
+        interpret(module, profiler=profiler)
+        assert False
+    except Exception as e:
+        assert str(e) == 'Calling undefined function g'
+    assert set(profiler.stacks) == {'main', 'main;f'}
+    assert interpret(parse(tokenize('1 + 2')), profiler=profiler) == 3
+    assert profiler.functions['main'].calls == 2
@@ -0,0 +1,117 @@
+import io
+import os
+from pathlib import Path
+
+from pytest import CaptureFixture, MonkeyPatch, raises
+
+import compiler.parser
+import compiler.python_backend
+import compiler.resolver
+import compiler.tokenizer
+import compiler.type_checker
+from compiler.budget import Budget, BudgetExceeded
+from compiler.channel import Channel
+from compiler.python_backend import load_program, run_code, translate, translator_modules
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+from tests.end_to_end_test import find_test_cases
+
+def run(code: str, inputs: str = '') -> str:
+    node = parse(tokenize(code))
+    typecheck(node)
+    output = io.StringIO()
+    run_code(compile(translate(node), '<program>', 'exec'), Channel(inputs.encode(), output))
+    return output.getvalue()
+
+def test_python_backend_runs_test_programs() -> None:
+    for test_case in find_test_cases():
+        output = run(test_case.code, '\n'.join(test_case.inputs))
+        assert len(test_case.outputs) == 0 or output == '\n'.join(test_case.outputs) + '\n', test_case.name
+
+def test_python_backend_translates_loops_to_python() -> None:
+    code = '''
+        var i = 0;
+        var total = 0;
+        while i < 1000 do {
+            if i % 3 == 0 then total = total + i else total = total - 1;
+            i = i + 1;
+        }
+        total
+        '''
+    node = parse(tokenize(code))
+    typecheck(node)
+    assert 'while (v_i < 1000):' in translate(node)
+    assert run(code) == f'{166833 - 666}\n'
+
+def test_python_backend_divides_towards_zero() -> None:
+    assert run('print_int(0 - 7 / 2); print_int((0 - 7) % 2); print_int(7 / (0 - 2)); (0 - 6) / 3') == '-3\n-1\n-3\n-2\n'
+
+def test_python_backend_keeps_the_order_of_evaluation() -> None:
+    assert run('''
+        var x = 1;
+        {
+            var x = 10;
+            print_int(x);
+        }
+        var i = 0;
+        while { i = i + 1; i < 5 } do x = x * 2;
+        var ok = i > 3 and { x = x + 100; x > 0 };
+        print_bool(ok);
+        print_bool(false or { print_int(read_int()); false });
+        if ok then { print_int(x); x } else 0
+        ''', '42') == '10\ntrue\n42\nfalse\n116\n116\n'
+
+def test_python_backend_runs_functions() -> None:
+    assert run('''
+        fun fib(n: Int): Int { if n < 2 then n else fib(n - 1) + fib(n - 2) }
+        fun early(n: Int): Int {
+            if n > 3 then { return 3; }
+            n
+        }
+        fun do(x: Int) { print_int(x); }
+        do(early(5));
+        do(early(1));
+        fib(20)
+        ''') == '3\n1\n6765\n'
+
+def test_python_backend_caches_code_objects(tmp_path: Path, capsys: CaptureFixture[str]) -> None:
+    cache_dir = os.path.join(tmp_path, 'cache')
+    code = load_program('var x = 6; x * 7', cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    assert load_program('var x = 6; x * 7', cache_dir) == code
+    load_program('var x = 6; x * 8', cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+
+    # A broken cache file is compiled again
+    for name in os.listdir(cache_dir):
+        with open(os.path.join(cache_dir, name), 'wb') as f:
+            f.write(b'broken')
+    run_code(load_program('var x = 6; x * 7', cache_dir))
+    assert capsys.readouterr().out == '42\n'
+
+def test_python_backend_compiles_again_after_the_compiler_changes(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    for module in [compiler.tokenizer, compiler.parser, compiler.type_checker, compiler.resolver, compiler.python_backend]:
+        assert module in translator_modules
+    cache_dir = os.path.join(tmp_path, 'cache')
+    load_program('1 + 2', cache_dir)
+    monkeypatch.setattr(compiler.python_backend, 'translator_hash', b'changed'.ljust(16))
+    load_program('1 + 2', cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+
+def test_python_backend_loads_programs_with_symbols_of_their_own() -> None:
+    load_program('fun leaked(): Int { 1 } leaked()')
+    with raises(Exception, match='Undeclared function leaked'):
+        load_program('leaked()')
+
+def test_python_backend_spends_fuel_only_when_budgeted(tmp_path: Path, capsys: CaptureFixture[str]) -> None:
+    cache_dir = os.path.join(tmp_path, 'cache')
+    code = 'var i = 0; while i < 10 do i = i + 1; i'
+    with raises(Exception, match='not translated with a budget'):
+        run_code(load_program(code, cache_dir), budget=Budget(fuel=5))
+    with raises(BudgetExceeded, match='Out of fuel'):
+        run_code(load_program(code, cache_dir, budgeted=True), budget=Budget(fuel=5))
+    # Budgeted code runs without a budget too, and is cached apart from code that is not
+    run_code(load_program(code, cache_dir, budgeted=True))
+    assert capsys.readouterr().out == '10\n'
+    assert len(os.listdir(cache_dir)) == 2
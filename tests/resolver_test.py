@@ -0,0 +1,93 @@
+from compiler.interpreter import PredefinedSymbols
+from compiler.models.expressions import *
+from compiler.parser import parse
+from compiler.resolver import resolve
+from compiler.tokenizer import tokenize
+
+def test_resolver_resolves_nested_blocks() -> None:
+    node = parse(tokenize('var a = 1; { var b = a; { var a = b; a } }'))
+    resolution = resolve(node, PredefinedSymbols)
+    assert isinstance(node, Module) and isinstance(node.sequence[0], Block)
+    outer = node.sequence[0]
+    middle = outer.sequence[1]
+    assert isinstance(middle, Block)
+    inner = middle.sequence[1]
+    assert isinstance(inner, Block)
+    declaration_b = middle.sequence[0]
+    assert isinstance(declaration_b, VariableDeclaration)
+    inner_declaration = inner.sequence[0]
+    assert isinstance(inner_declaration, VariableDeclaration)
+
+    assert resolution.variables[id(outer.sequence[0])] == (1, 0)
+    assert resolution.variables[id(declaration_b)] == (2, 0)
+    assert resolution.variables[id(declaration_b.initializer)] == (1, 0)
+    assert resolution.variables[id(inner_declaration)] == (3, 0)
+    assert resolution.variables[id(inner_declaration.initializer)] == (2, 0)
+    assert resolution.variables[id(inner.sequence[1])] == (3, 0)
+    assert [resolution.frame_sizes[id(block)] for block in [outer, middle, inner]] == [1, 1, 1]
+
+def test_resolver_resolves_functions_and_parameters() -> None:
+    node = parse(tokenize('fun f(x: Int, y: Int): Int { var z = x; z + y } f(1, 2)'))
+    resolution = resolve(node, PredefinedSymbols)
+    assert isinstance(node, Module)
+    fun = node.sequence[1]
+    assert isinstance(fun, FunctionDeclaration)
+    assert resolution.frame_sizes[id(fun)] == 2
+    assert isinstance(fun.body, Block) and resolution.frame_sizes[id(fun.body)] == 1
+    sum = fun.body.sequence[1]
+    assert isinstance(sum, BinaryOp)
+    assert resolution.variables[id(sum.left)] == (2, 0)
+    assert resolution.variables[id(sum.right)] == (1, 1)
+    assert resolution.operators[id(sum)] is PredefinedSymbols['+']
+    assert resolution.variables[id(node.sequence[0])] == (0, resolution.global_slots['f'])
+
+def test_resolver_leaves_unknown_names_out() -> None:
+    node = parse(tokenize('{ var a = 1; } a = b'))
+    resolution = resolve(node, PredefinedSymbols)
+    assert isinstance(node, Module) and isinstance(node.sequence[0], Block)
+    assignment = node.sequence[0].sequence[1]
+    assert isinstance(assignment, BinaryOp)
+    assert id(assignment) not in resolution.variables
+    assert id(assignment.right) not in resolution.variables
+
+def test_resolver_finds_pure_functions() -> None:
+    node = parse(tokenize('''
+        fun square(x: Int): Int { x * x }
+        fun sum_squares(x: Int, y: Int): Int { square(x) + square(y) }
+        fun show(x: Int): Int { print_int(x); x }
+        fun show_square(x: Int): Int { show(square(x)) }
+        fun reads(): Int { read_int() }
+        fun undefined(): Int { g() }
+        sum_squares(1, 2)
+        '''))
+    assert resolve(node, PredefinedSymbols).pure_functions == {'square', 'sum_squares'}
+
+def test_resolver_treats_global_variables_as_impure() -> None:
+    node = parse(tokenize('fun get(): Int { counter } fun set(): Int { counter = 1; 1 } get()'))
+    resolution = resolve(node, PredefinedSymbols | {'counter': 0})
+    assert resolution.pure_functions == set()
+
+def test_resolver_binds_names_to_declarations() -> None:
+    node = parse(tokenize('fun f(x: Int): Int { var y = x; { var y = 2; y = x } y } var x = 1; x = f(x)'))
+    resolution = resolve(node, PredefinedSymbols)
+    assert isinstance(node, Module) and isinstance(node.sequence[0], Block)
+    fun = node.sequence[1]
+    assert isinstance(fun, FunctionDeclaration) and isinstance(fun.body, Block)
+    (outer_y, block, result) = fun.body.sequence
+    assert isinstance(outer_y, VariableDeclaration) and isinstance(block, Block)
+    (inner_y, assignment) = block.sequence
+    assert isinstance(assignment, BinaryOp)
+    bindings = resolution.bindings
+
+    # Every declaration has an id of its own, even with the same name
+    assert bindings[id(fun.args[0])] == bindings[id(outer_y.initializer)] == bindings[id(assignment.right)]
+    assert bindings[id(assignment)] == bindings[id(inner_y)] != bindings[id(outer_y)] == bindings[id(result)]
+    assert resolution.declarations[bindings[id(inner_y)]] == (3, 0)
+    assert resolution.declarations[bindings[id(outer_y)]] == (2, 0)
+    assert resolution.local_counts == {'f': 3}
+
+    # The global symbols and functions are declared first, in their slots
+    (main_x, main_assignment) = node.sequence[0].sequence
+    assert isinstance(main_assignment, BinaryOp) and isinstance(main_assignment.right, Function)
+    assert bindings[id(main_assignment.right)] == resolution.global_slots['f']
+    assert bindings[id(main_assignment)] == bindings[id(main_x)] != bindings[id(fun.args[0])]
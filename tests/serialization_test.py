@@ -0,0 +1,77 @@
+import io
+from pathlib import Path
+
+from compiler.models.expressions import *
+from compiler.models.symbol_table import SymTab
+from compiler.models.types import Bool, Int, Unit
+from compiler.parser import parse
+from compiler.serialization import *
+from compiler.tokenizer import tokenize, tokenize_buffer
+from compiler.type_checker import typecheck
+
+code = '''
+fun square(x: Int): Int { x * x }
+fun is_big(x: Int): Bool { if x > 1000000000000 then true else false }
+var a = square(-3);
+var b: Bool = not is_big(a) or a == 9;
+if b then { a = -a } else a = 0;
+while a < 100 do a = a * 2;
+print_int(a)
+'''
+
+def test_encode_and_decode_typed_module() -> None:
+    module = parse(tokenize(code))
+    typecheck(module, SymTab({}))
+    data = encode_module(module)
+    decoded = decode_module(data)
+    assert decoded == module
+    main = decoded.sequence[0]
+    assert isinstance(main, Block)
+    assert [e.type for e in main.sequence[:2]] == [Unit, Unit]
+    initializer = main.sequence[0]
+    assert isinstance(initializer, VariableDeclaration) and initializer.initializer.type == Int
+
+def test_decode_gives_every_literal_a_node_of_its_own() -> None:
+    decoded = decode_module(encode_module(parse(tokenize('{ 1 + 1; true == true }'))))
+    block = decoded.sequence[0]
+    assert isinstance(block, Block)
+    for op in block.sequence:
+        assert isinstance(op, BinaryOp) and op.left == op.right and op.left is not op.right
+
+def test_decode_functions_independently() -> None:
+    module = parse(tokenize(code))
+    reader = ModuleReader(encode_module(module))
+    assert reader.function_names == ['square', 'is_big']
+    assert reader.function(1) == module.sequence[2]
+    assert reader.main() == module.sequence[0]
+
+def test_save_and_load(tmp_path: Path) -> None:
+    module = parse(tokenize(code))
+    path = str(tmp_path / 'module.bin')
+    save_module(module, path)
+    assert load_module(path) == module
+
+    file = io.BytesIO()
+    save_module(module, file)
+    file.seek(0)
+    assert load_module(file) == module
+
+def test_decode_rejects_other_versions() -> None:
+    data = bytearray(encode_module(parse(tokenize('1'))))
+    data[len(MAGIC)] = VERSION + 1
+    failed = False
+    try:
+        decode_module(bytes(data))
+    except Exception:
+        failed = True
+    assert failed
+
+def test_encode_deep_tree() -> None:
+    module = parse(tokenize_buffer(' - '.join(['123456789'] * 100000)))
+    data = encode_module(module)
+    # Comparing deep trees with == would recurse
+    decoded = decode_module(data)
+    assert decoded.structural_hash() == module.structural_hash()
+    assert encode_module(decoded) == data
+    # Two bytes for every operator node and six for every literal
+    assert len(data) < 100000 * 8 + 100
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from typing import Any, Awaitable, Callable
+
+from pytest import skip
+
+from compiler.server import Server, request
+
+if shutil.which('as') is None or shutil.which('ld') is None:
+    skip("The server needs 'as' and 'ld'", allow_module_level=True)
+
+def run_with_server(test: Callable[[Server], Awaitable[Any]], **options: Any) -> Any:
+    "Starts a server with the options on a socket in a temporary directory, and runs the test against it"
+    async def main() -> Any:
+        with tempfile.TemporaryDirectory(prefix='compiler_') as directory:
+            server = Server(os.path.join(directory, 'compiler.sock'), workers=2, **options)
+            await server.start()
+            try:
+                return await test(server)
+            finally:
+                await server.close()
+    return asyncio.run(main())
+
+def test_server_compiles_and_runs_programs() -> None:
+    async def test(server: Server) -> list[dict[str, Any]]:
+        return await asyncio.gather(*[
+            request(server.socket_path, 'var n = read_int(); print_int(n * 2); n + 1', str(n))
+            for n in range(8)
+        ])
+    responses = run_with_server(test)
+    for (n, response) in enumerate(responses):
+        assert response['output'] == f'{n * 2}\n{n + 1}\n'
+        assert response['exit_code'] == 0
+        assert set(response['timings']) == {'queued', 'compile', 'run', 'total'}
+
+def test_server_answers_many_requests_of_a_connection() -> None:
+    async def test(server: Server) -> list[bytes]:
+        (reader, writer) = await asyncio.open_unix_connection(server.socket_path)
+        writer.write(b'{"source": "print_bool(true); 1"}\n{"source": "2", "stdin": ""}\nnot json\n')
+        await writer.drain()
+        lines = [await reader.readline() for _ in range(3)]
+        writer.close()
+        await writer.wait_closed()
+        assert server.handled == 2 and server.failed == 1
+        return lines
+    lines = run_with_server(test)
+    assert lines[0].startswith(b'{"output": "true\\n1\\n", "exit_code": 0')
+    assert lines[1].startswith(b'{"output": "2\\n", "exit_code": 0')
+    assert lines[2].startswith(b'{"error": "Bad request: ')
+
+def test_server_reports_errors_of_programs() -> None:
+    async def test(server: Server) -> list[dict[str, Any]]:
+        return [
+            await request(server.socket_path, '1 + true'),
+            await request(server.socket_path, 'while true do {}; 1'),
+            await request(server.socket_path, 'print_int(read_int())', ''),
+        ]
+    (type_error, timeout, no_input) = run_with_server(test, timeout=0.5)
+    assert type_error['error'].startswith('Compile error: ')
+    assert timeout['error'] == 'Timed out after 0.5 seconds'
+    assert no_input['exit_code'] == 1
+
+def test_server_kills_programs_that_print_too_much() -> None:
+    async def test(server: Server) -> list[dict[str, Any]]:
+        return [
+            await request(server.socket_path, 'while true do print_int(123456789); 1'),
+            await request(server.socket_path, 'var i = 0; while i < 10 do { print_int(i); i = i + 1 }; 0'),
+        ]
+    (endless, short) = run_with_server(test, max_output=1000)
+    assert endless['error'] == 'Printed more than 1000 bytes'
+    assert short['output'] == ''.join(f'{i}\n' for i in range(10)) + '0\n'
+
+def test_server_limits_running_programs() -> None:
+    async def test(server: Server) -> list[dict[str, Any]]:
+        # Each program runs until it is killed, so that they would all time out together if they ran at once
+        return await asyncio.gather(*[request(server.socket_path, 'while true do {}; 1') for _ in range(3)])
+    responses = run_with_server(test, max_running=1, max_pending=2, timeout=0.3)
+    runs = sorted(response['timings']['run'] for response in responses)
+    assert all(response['error'] == 'Timed out after 0.3 seconds' for response in responses)
+    # One request waits for the others to be admitted, and so do the programs for running
+    assert max(response['timings']['queued'] for response in responses) >= 0.3
+    assert all(run >= 0.3 for run in runs)
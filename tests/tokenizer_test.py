@@ -1,6 +1,12 @@
+import io
+import mmap
+import tempfile
 
-from compiler.models.tokens import Token
-from compiler.tokenizer import tokenize
+
+from compiler.models.tokens import (
+    ASSIGN, DO, IDENTIFIER, INT_LITERAL, LEFT_BRACE, LESS_EQUAL, PLUS, RIGHT_BRACE, SEMICOLON, WHILE, SourceLocation, Token
+)
+from compiler.tokenizer import iter_tokens, tokenize, tokenize_buffer
 
 
 def test_tokenizer_works() -> None:
@@ -80,4 +86,65 @@ def test_tokenizer_skips_comment_hashtag() -> None:
         Token(type="identifier", text="int"),
         Token(type="identifier", text="a"),
         Token(type="punctuation", text=";")
-    ]
\ No newline at end of file
+    ]
+
+def test_tokenizer_kinds() -> None:
+    assert [t.kind for t in tokenize("while x <= 10 do { x = x + 1; }")] == [
+        WHILE, IDENTIFIER, LESS_EQUAL, INT_LITERAL, DO, LEFT_BRACE,
+        IDENTIFIER, ASSIGN, IDENTIFIER, PLUS, INT_LITERAL, SEMICOLON, RIGHT_BRACE
+    ]
+
+def test_tokenizer_comment_until_end_of_line() -> None:
+    assert tokenize("a // b \n c # d") == [
+        Token(type="identifier", text="a"),
+        Token(type="identifier", text="c")
+    ]
+
+def test_tokenizer_fails_on_unknown_character() -> None:
+    failed = False
+    try:
+        tokenize("a ? b")
+    except Exception:
+        failed = True
+    assert failed
+
+streaming_source = """
+fun square(x: Int): Int { return x * x; }  // squares
+var value_with_long_name = 12345 >= 67890;
+# comment at the end"""
+
+def test_iter_tokens_matches_tokenize() -> None:
+    assert list(iter_tokens(streaming_source)) == tokenize(streaming_source)
+
+def test_iter_tokens_handles_tokens_across_chunks() -> None:
+    for chunk_size in range(1, 8):
+        assert list(iter_tokens(io.StringIO(streaming_source), chunk_size)) == tokenize(streaming_source)
+        assert list(iter_tokens(io.BytesIO(streaming_source.encode()), chunk_size)) == tokenize(streaming_source)
+
+def test_iter_tokens_reads_mmap() -> None:
+    with tempfile.TemporaryFile() as f:
+        f.write(streaming_source.encode())
+        f.flush()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            assert list(iter_tokens(buffer, 5)) == tokenize(streaming_source)
+
+def test_iter_tokens_fails_on_unknown_character() -> None:
+    failed = False
+    try:
+        list(iter_tokens(io.StringIO("a ? b"), 2))
+    except Exception:
+        failed = True
+    assert failed
+
+def test_tokenize_buffer_matches_tokenize() -> None:
+    buffer = tokenize_buffer(streaming_source)
+    assert list(buffer) == tokenize(streaming_source)
+    assert [buffer.text(i) for i in range(len(buffer))] == [t.text for t in tokenize(streaming_source)]
+
+def test_tokenize_buffer_locations() -> None:
+    buffer = tokenize_buffer("var a = 1;\n  // comment\n  a = a + 1")
+    assert buffer.text(5) == 'a'
+    assert buffer.location(0) == SourceLocation(line=1, column=1)
+    assert buffer.location(3) == SourceLocation(line=1, column=9)
+    assert buffer.location(5) == SourceLocation(line=3, column=3)
+    assert buffer.location(9) == SourceLocation(line=3, column=11)
@@ -0,0 +1,163 @@
+import io
+
+from pytest import raises
+
+from compiler.budget import Budget
+from compiler.channel import Channel
+from compiler.interpreter import Value, interpret
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+from compiler.tracing import LoopTracer
+
+def check(code: str, tracer: LoopTracer, inputs: str = '') -> tuple[Value, str]:
+    "Runs the code with the tracer, and checks that it gives what 'interpret' gives without one"
+    module = parse(tokenize(code))
+    results = []
+    for t in [None, tracer]:
+        output = io.StringIO()
+        value = interpret(module, channel=Channel(inputs.encode(), output), tracer=t)
+        results.append((value, output.getvalue()))
+    assert results[0] == results[1]
+    return results[1]
+
+def test_tracing_compiles_hot_loops() -> None:
+    tracer = LoopTracer(threshold=10)
+    assert check('''
+        var i = 0;
+        var total = 0;
+        var flag = false;
+        while i < 1000 do {
+            var k = i % 7;
+            if k == 3 then total = total + k * 2 else total = total - 1;
+            flag = not flag;
+            if i % 250 == 0 then print_int(total);
+            i = i + 1;
+        }
+        print_bool(flag);
+        total
+    ''', tracer) == (1, '-1\n1\n3\n-2\nfalse\n')
+    assert tracer.stats() == {'threshold': 10, 'hot_loops': 1, 'compiled': 1, 'rejected': 0, 'compiled_runs': 1}
+    assert '    while (o' in next(loop for loop in tracer.loops.values() if loop is not None).source
+
+def test_tracing_keeps_the_quirks_of_the_interpreter() -> None:
+    tracer = LoopTracer(threshold=3)
+    check('''
+        var i = 0;
+        var a = 0;
+        var b = true;
+        while i < 20 do {
+            i = i + 1;
+            if i >= 10 then a = a + 100;
+            if i != 5 then a = a + 1000;
+            a = a + (0 - i) / 3 + i % 4;
+            if i > 2 then { var x = i; a = a - x * 2 };
+            b = -b or (i > 10 and true);
+            print_bool(b);
+            print_int(-(i < 5));
+        }
+        a
+    ''', tracer)
+    assert tracer.stats()['compiled'] == 1
+
+def test_tracing_compiles_nested_loops_and_loops_in_functions() -> None:
+    tracer = LoopTracer(threshold=5)
+    check('''
+        fun triangle(n: Int): Int {
+            var total = 0;
+            var i = 0;
+            while i <= n do {
+                var j = 0;
+                while j < i do { total = total + 1; j = j + 1; }
+                i = i + 1;
+            }
+            total
+        }
+        var k = 0;
+        while k < 30 do {
+            print_int(triangle(k));
+            k = k + 1;
+        }
+    ''', tracer)
+    # The outer loop gets hot first, and is compiled with the inner loop in it
+    assert tracer.stats()['compiled'] == 1
+    assert tracer.stats()['compiled_runs'] == 28
+    source = next(loop for loop in tracer.loops.values() if loop is not None).source
+    assert source.count('while') == 2
+
+def test_tracing_guards_compiled_loops_with_types() -> None:
+    tracer = LoopTracer(threshold=2)
+    # The loop in the function runs with Ints and with Bools, and gets compiled for both
+    check('''
+        fun repeat(n: Int, x: Int, y: Int): Int {
+            var i = 0;
+            while i < n do { x = x == y; i = i + 1; }
+            x
+        }
+        print_int(repeat(5, 1, 1));
+        print_int(repeat(5, 2, 1));
+        repeat(5, true, false)
+    ''', tracer)
+    assert tracer.stats()['compiled'] == 2
+
+def test_tracing_leaves_loops_it_can_not_compile_to_the_interpreter() -> None:
+    tracer = LoopTracer(threshold=2)
+    check('''
+        var i = 0;
+        var x = 1;
+        while i < 10 do {
+            if i % 2 == 0 then x = true else x = 1;
+            i = i + 1;
+        }
+        i
+    ''', tracer)
+    assert tracer.stats()['compiled'] == 0
+    assert tracer.stats()['rejected'] > 0
+
+    tracer = LoopTracer(threshold=2)
+    check('''
+        fun f(x: Int): Int { x + 1 }
+        var i = 0;
+        while i < 10 do i = f(i);
+        i
+    ''', tracer)
+    assert tracer.stats()['hot_loops'] == 0
+
+def test_tracing_reads_input_and_stores_variables_on_errors() -> None:
+    tracer = LoopTracer(threshold=2)
+    assert check('''
+        var total = 0;
+        var n = read_int();
+        while n > 0 do { total = total + n; n = read_int(); }
+        total
+    ''', tracer, '1 2 3 4 5 6 0') == (21, '')
+
+    module = parse(tokenize('var i = 0; var x = 0; while true do { x = 100 / (5 - i); i = i + 1; }'))
+    try:
+        interpret(module, tracer=LoopTracer(threshold=2))
+        assert False
+    except ZeroDivisionError:
+        pass
+
+def test_tracing_traces_only_one_program() -> None:
+    tracer = LoopTracer(threshold=2)
+    module = parse(tokenize('var i = 0; while i < 10 do i = i + 1; i'))
+    assert interpret(module, tracer=tracer) == 10
+    assert interpret(module, tracer=tracer) == 10
+    assert tracer.stats()['compiled_runs'] == 2
+    # Its tables would give the loops of this program to the nodes of another
+    with raises(Exception, match='already traces another program'):
+        interpret(parse(tokenize('var i = 0; while i < 10 do i = i + 2; i')), tracer=tracer)
+
+def test_tracing_spends_the_same_fuel() -> None:
+    code = parse(tokenize('var i = 0; while i < 100 do { var j = 0; while j < i do j = j + 1; i = i + 1; } i'))
+    budget = Budget(fuel=10000, check_interval=7)
+    assert interpret(code, budget=budget) == 100
+    used = budget.used()
+    assert interpret(code, budget=budget, tracer=LoopTracer(threshold=10)) == 100
+    assert budget.used() == used
+
+    try:
+        interpret(code, budget=Budget(fuel=1000), tracer=LoopTracer(threshold=10))
+        assert False
+    except Exception as e:
+        assert str(e) == 'Out of fuel: used all 1000 units'
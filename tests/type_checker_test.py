@@ -1,6 +1,7 @@
 
-from pytest import MonkeyPatch
+from pytest import MonkeyPatch, raises
 from compiler.parser import parse
+from compiler.resolver import resolve
 from compiler.tokenizer import tokenize
 from compiler.type_checker import *
 from compiler.models.expressions import *
@@ -299,4 +300,18 @@ def assert_type_checker_fails(code: str) -> None:
         typecheck(expr)
     except Exception:
         failed = True
-    assert failed, f'Type-checking succeeded for: {code}'
\ No newline at end of file
+    assert failed, f'Type-checking succeeded for: {code}'
+
+def test_type_checker_scopes_variables_to_blocks() -> None:
+    node = parse(tokenize('var x = 1; { var x = true; print_bool(x) } x'))
+    assert typecheck(node, SymTab({})) == Int
+    with raises(Exception, match='Variable y is not defined'):
+        typecheck(parse(tokenize('{ var y = 1; } y')), SymTab({}))
+    with raises(Exception, match='Variable x is not defined'):
+        typecheck(parse(tokenize('fun f(x: Int): Int { x } fun g(): Int { x } g()')), SymTab({}))
+
+def test_type_checker_reuses_a_resolution() -> None:
+    node = parse(tokenize('fun f(x: Int): Int { var y = x * 2; y + 1 } var a = 3; { var a = f(a); a = a + 1 } a'))
+    resolution = resolve(node, {})
+    assert typecheck(node, SymTab({}), resolution) == Int
+    assert isinstance(node.sequence[1], FunctionDeclaration) and node.sequence[1].body.type == Int